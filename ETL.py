@@ -1,13 +1,21 @@
 from package.exception import CustomException
+from package.logger import logging
 import sys
 import pymongo
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
 from typing import ClassVar
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import pandas as pd
+import numpy as np
+import hashlib
 import json
+import time
 import os
 import certifi
 from dotenv import load_dotenv
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import yaml
 
 
@@ -18,6 +26,35 @@ uri = os.getenv("URI")
 # connecting safely
 ca = certifi.where()
 
+# integer columns with at most this many distinct values get allowed_values in the schema
+MAX_ALLOWED_VALUES = 16
+
+# csv rows parsed at a time
+CHUNK_SIZE = 50_000
+
+# documents per insert_many, large enough to amortize the round trip, small enough to keep several in flight
+BATCH_SIZE = 5_000
+
+# concurrent insert_many calls
+MAX_WORKERS = 4
+
+# progress of an interrupted load, removed once the load completes
+CHECKPOINT_FILE_PATH = os.path.join("artifacts", "etl_checkpoint.json")
+
+# mongodb error code of a duplicate key, expected when a batch is replayed after a failure
+DUPLICATE_KEY_ERROR = 11000
+
+# unique key of a document built from its values, see get_content_hashes
+CONTENT_HASH_FIELD = "content_hash"
+
+# markers of the loads into the collection, ingestion doesn't move its _id watermark
+# past the first _id of a load that is still running or was interrupted
+LOADS_COLLECTION_NAME = "Loads"
+
+# insert: insert_many, rows already loaded are rejected one by one by the unique content hash index
+# upsert: bulk upserts on the content hash, rows already loaded cost no write at all
+MODES = ("insert", "upsert")
+
 
 @dataclass
 class ExtractTransformLoad:
@@ -25,42 +62,283 @@ class ExtractTransformLoad:
     __Database: ClassVar = __Client["Network-Security"]
     __Collection: ClassVar = __Database["Data"]
 
-    def csv_to_json(self, path:str)-> list:
-        """Converts csv file into a list of json
+    mode: str = "upsert"
+    chunk_size: int = CHUNK_SIZE
+    batch_size: int = BATCH_SIZE
+    max_workers: int = MAX_WORKERS
+    checkpoint_path: str = CHECKPOINT_FILE_PATH
+    dtypes: dict = field(default_factory=dict, init=False, repr=False)
+    values: dict = field(default_factory=dict, init=False, repr=False)
+    occurrences: dict = field(default_factory=dict, init=False, repr=False)
+    stats: dict = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.mode not in MODES:
+            raise CustomException(f"mode must be one of {MODES}, got {self.mode}", sys)
+
+    @staticmethod
+    def get_object_ids(epoch:int, source:str, start:int, count:int)->list:
+        """deterministic ObjectIds of the rows start ... start + count of a load
+
+        4 bytes load time | 3 bytes hash of the source | 5 bytes row number, so
+        newer loads sort after older ones. Batches finish out of order, so the
+        _id's of a load only become a valid ingestion watermark once the load
+        is complete, see start_load.
 
         Args:
-            path (str): path of CSV file where data is available.
+            epoch (int): start time of the load in seconds
+            source (str): path of the csv file
+            start (int): row number of the first document
+            count (int): number of documents
 
         Returns:
-            list: list of json for the whole file.
+            list: ObjectIds
+        """
+        prefix = epoch.to_bytes(4, "big") + hashlib.sha256(source.encode()).digest()[:3]
+        return [ObjectId(prefix + row.to_bytes(5, "big")) for row in range(start, start + count)]
+
+    def get_content_hashes(self, data:pd.DataFrame)->list:
+        """stable key of every record: 64 bit hash of its values and how often the same
+        values occurred before in the file, so repeated records of the source are kept
+
+        Values are hashed as float64 like DataIngestionComponents.get_test_mask, a
+        column turning float in a chunk with missing values keeps the same hashes.
+
+        Args:
+            data (pd.DataFrame): next chunk of the file, chunks must come in file order
+
+        Returns:
+            list: hex keys
+        """
+        numeric = all(dtype.kind in "iubf" for dtype in data.dtypes)
+        hashes = pd.util.hash_pandas_object(data.astype(np.float64) if numeric else data.astype(str), index=False)
+        hashes = pd.Series(hashes.to_numpy())
+        occurrence = hashes.groupby(hashes).cumcount().to_numpy()
+        keys = list()
+        for value, index in zip(hashes.tolist(), occurrence.tolist()):
+            index += self.occurrences.get(value, 0)
+            keys.append(f"{value:016x}-{index}")
+        counts = hashes.value_counts()
+        for value, count in zip(counts.index.tolist(), counts.tolist()):
+            self.occurrences[value] = self.occurrences.get(value, 0) + count
+        return keys
+
+    def collect_schema(self, data:pd.DataFrame)->None:
+        """keeps the dtype and, while there are few, the distinct values of every column for save_schema
+        """
+        for col in data.columns:
+            if col not in self.dtypes:
+                self.dtypes[col] = data[col].dtype
+                self.values[col] = set()
+            else:
+                self.dtypes[col] = np.result_type(self.dtypes[col], data[col].dtype)
+            if self.values[col] is not None:
+                self.values[col].update(data[col].dropna().unique().tolist())
+                if len(self.values[col]) > MAX_ALLOWED_VALUES:
+                    self.values[col] = None
+
+    def iter_batches(self, path:str, skip_rows:int=0):
+        """reads the csv chunk by chunk and builds documents straight from the column arrays
+
+        Args:
+            path (str): path of CSV file where data is available.
+            skip_rows (int, optional): rows already loaded. Defaults to 0.
+
+        Yields:
+            tuple: (row number of the first document, list of documents without _id)
         """
         try:
-            self.data = pd.read_csv(path)
-            records = list(json.loads(self.data.T.to_json()).values())
-            return records
+            start = 0
+            self.occurrences = dict()
+            for data in pd.read_csv(path, chunksize=self.chunk_size):
+                self.collect_schema(data)
+                content_hashes = self.get_content_hashes(data)
+                if start + len(data) <= skip_rows:
+                    start += len(data)
+                    continue
+                if start < skip_rows:
+                    content_hashes = content_hashes[skip_rows - start:]
+                    data = data.iloc[skip_rows - start:]
+                    start = skip_rows
+
+                # python scalars per column, missing values become null like in json
+                columns = list(data.columns)
+                values = [data[col].astype(object).where(data[col].notna(), None).tolist() if data[col].hasnans
+                          else data[col].tolist() for col in columns]
+                documents = [dict(zip(columns, row)) for row in zip(*values)]
+                for document, content_hash in zip(documents, content_hashes):
+                    document[CONTENT_HASH_FIELD] = content_hash
+                for offset in range(0, len(documents), self.batch_size):
+                    yield start + offset, documents[offset:offset + self.batch_size]
+                start += len(data)
         except Exception as e:
             raise CustomException(e, sys)
-        
-    def push_to_db(self, records:list, collection:list)-> int:
-        """pushes all records into collection of database
+
+    @staticmethod
+    def insert_batch(collection, documents:list)->dict:
+        """unordered insert_many of a batch, documents whose _id or content hash is already
+        in the collection are skipped
+
+        Returns:
+            dict: inserted, updated and skipped documents and seconds spent
+        """
+        start = time.perf_counter()
+        try:
+            inserted = len(collection.insert_many(documents, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            inserted = e.details.get("nInserted", 0)
+        return {"inserted": inserted, "updated": 0, "skipped": len(documents) - inserted,
+                "seconds": time.perf_counter() - start}
+
+    @staticmethod
+    def upsert_batch(collection, documents:list)->dict:
+        """unordered bulk of upserts keyed by the content hash, a document is only written
+        when its key isn't in the collection yet, so reloading the same records is a no-op
+
+        Returns:
+            dict: inserted, updated and skipped documents and seconds spent
+        """
+        start = time.perf_counter()
+        requests = [UpdateOne({CONTENT_HASH_FIELD: document[CONTENT_HASH_FIELD]}, {"$setOnInsert": document}, upsert=True)
+                    for document in documents]
+        try:
+            result = collection.bulk_write(requests, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            # two loads racing on the same key, the other one wrote it
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            result = e.details
+        inserted, updated = result.get("nUpserted", 0), result.get("nModified", 0)
+        return {"inserted": inserted, "updated": updated, "skipped": len(documents) - inserted - updated,
+                "seconds": time.perf_counter() - start}
+
+    @staticmethod
+    def start_load(loads, checkpoint:dict)->None:
+        """marks the load of checkpoint as running with the lowest _id it can write,
+        an interrupted load keeps the mark of its first attempt until it completes
+        """
+        first_id = ObjectId(checkpoint["first_epoch"].to_bytes(4, "big") + bytes(8))
+        loads.update_one({"_id": checkpoint["source"]},
+                         {"$set": {"status": "running", "first_id": first_id, "epoch": checkpoint["epoch"]}},
+                         upsert=True)
+
+    @staticmethod
+    def complete_load(loads, checkpoint:dict, rows:int)->None:
+        loads.update_one({"_id": checkpoint["source"]}, {"$set": {"status": "complete", "rows": rows}})
+
+    def load_checkpoint(self, path:str)->dict:
+        """progress of an interrupted load of the same, unchanged csv, None otherwise
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as file:
+            checkpoint = json.load(file)
+        stat = os.stat(path)
+        if (checkpoint["source"], checkpoint["size"], checkpoint["mtime"]) != (os.path.abspath(path), stat.st_size, stat.st_mtime):
+            return None
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint:dict)->None:
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(checkpoint, file)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def push_to_db(self, path:str, collection, loads=None)-> int:
+        """streams the csv into collection through concurrent unordered insert_many or
+        upsert batches, depending on mode
+
+        Every finished batch moves a checkpoint of the rows loaded without gaps.
+        After a failure the next call with the same csv resumes from there with
+        a new epoch, so the resumed rows sort after everything written before.
+        The batches in flight at the failure are replayed and their already
+        written documents are skipped by content hash.
 
         Args:
-            records (list): list of json
+            path (str): path of CSV file where data is available.
             collection (id): mongoclient database collection full id
+            loads (id, optional): collection of the load markers. Defaults to LOADS_COLLECTION_NAME of the same database.
 
         Returns:
-            int: lenght of records
+            int: number of rows loaded, including the ones of an earlier interrupted run.
+                Inserted, updated and skipped documents and the time per batch are kept in stats
         """
         try:
-            self.records = records
-            self.collection = collection
-            self.collection.insert_many(self.records)
-            return len(records)
+            # content hashes are unique, documents loaded before they existed don't have one
+            collection.create_index(CONTENT_HASH_FIELD, unique=True, sparse=True)
+            write_batch = self.upsert_batch if self.mode == "upsert" else self.insert_batch
+
+            loads = loads if loads is not None else collection.database[LOADS_COLLECTION_NAME]
+
+            checkpoint = self.load_checkpoint(path)
+            if checkpoint is None:
+                stat = os.stat(path)
+                checkpoint = {"source": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime,
+                              "epoch": int(time.time()), "rows": 0}
+                checkpoint["first_epoch"] = checkpoint["epoch"]
+            else:
+                checkpoint.setdefault("first_epoch", checkpoint["epoch"])
+                # rows written from now on sort after everything written before the failure
+                checkpoint["epoch"] = max(int(time.time()), checkpoint["epoch"] + 1)
+                logging.info(f"resuming load of {path} after {checkpoint['rows']} rows")
+            self.save_checkpoint(checkpoint)
+            self.start_load(loads, checkpoint)
+            resumed_rows = checkpoint["rows"]
+
+            start_time = time.perf_counter()
+            self.stats = {"mode": self.mode, "inserted": 0, "updated": 0, "skipped": 0, "batches": list()}
+            pending = dict()
+            finished = dict()
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="etl") as executor:
+                def collect(done):
+                    for future in done:
+                        start, count = pending.pop(future)
+                        batch = future.result()
+                        for key in ("inserted", "updated", "skipped"):
+                            self.stats[key] += batch[key]
+                        batch = {"start": start, "documents": count, **batch, "seconds": round(batch["seconds"], 4)}
+                        self.stats["batches"].append(batch)
+                        logging.info(f"batch of rows {start} - {start + count}: {batch['inserted']} inserted, "
+                                     f"{batch['updated']} updated, {batch['skipped']} skipped in {batch['seconds']}s")
+                        finished[start] = count
+                    # move the checkpoint over every batch finished without a gap before it
+                    rows = checkpoint["rows"]
+                    while rows in finished:
+                        rows += finished.pop(rows)
+                    if rows != checkpoint["rows"]:
+                        checkpoint["rows"] = rows
+                        self.save_checkpoint(checkpoint)
+
+                for start, documents in self.iter_batches(path, skip_rows=resumed_rows):
+                    for document, _id in zip(documents, self.get_object_ids(checkpoint["epoch"], checkpoint["source"], start, len(documents))):
+                        document["_id"] = _id
+                    pending[executor.submit(write_batch, collection, documents)] = (start, len(documents))
+                    # bounded number of batches in memory
+                    if len(pending) >= 2 * self.max_workers:
+                        collect(wait(pending, return_when=FIRST_COMPLETED).done)
+                while pending:
+                    collect(wait(pending, return_when=FIRST_COMPLETED).done)
+
+            seconds = time.perf_counter() - start_time
+            loaded = checkpoint["rows"] - resumed_rows
+            self.stats.update(rows=loaded, seconds=round(seconds, 3), docs_per_second=round(loaded / seconds) if seconds else None)
+            logging.info(f"{self.mode} of {loaded} rows in {seconds:.2f}s ({self.stats['docs_per_second']} docs/s): "
+                         f"{self.stats['inserted']} inserted, {self.stats['updated']} updated, {self.stats['skipped']} skipped")
+            self.complete_load(loads, checkpoint, checkpoint["rows"])
+            # nothing may have been checkpointed, e.g. a header only csv
+            if os.path.exists(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
+            return checkpoint["rows"]
         except Exception as e:
             raise CustomException(e, sys)
-        
+
     def save_schema(self)->None:
-        """saves the schema data
+        """saves the schema of the last loaded csv
         """
         try:
             path = "schema"
@@ -68,32 +346,39 @@ class ExtractTransformLoad:
 
             schema = dict()
             columns_with_dtype = dict()
+            allowed_values = dict()
             numerical_columns = list()
 
-            for col in self.data.columns:
-                columns_with_dtype[col] = str(self.data[col].dtype)
-                if self.data[col].dtype!="O":
+            for col, dtype in self.dtypes.items():
+                columns_with_dtype[col] = str(dtype)
+                if dtype!="O":
                     numerical_columns.append(col)
 
+                # categorical integer columns, their value range decides the dtype used by the pipeline
+                values = self.values[col]
+                if dtype.kind == "i" and values is not None:
+                    allowed_values[col] = sorted(int(value) for value in values)
+
             schema["columns"] = columns_with_dtype
+            schema["allowed_values"] = allowed_values
             schema["numerical_columns"] = numerical_columns
 
             with open(os.path.join(path, "schema.yaml"), "w") as file:
                 yaml.safe_dump(schema, file)
         except Exception as e:
             raise CustomException(e, sys)
-        
+
     def main(self)-> int:
         """Runs the full ETL process
         """
         path = "C:/Users/hasan/Documents/DS/Udemy/ML-Project-with-ETL-Pipeline/materials/networksecurity/Network_Data/phisingData.csv"
         collection = ExtractTransformLoad.__Collection
-        records = self.csv_to_json(path)
-        records_len = self.push_to_db(records, collection)
+        records_len = self.push_to_db(path, collection)
         return records_len
-        
+
 
 
 if __name__=="__main__":
-    ETL_obj = ExtractTransformLoad()
+    # python ETL.py [insert|upsert]
+    ETL_obj = ExtractTransformLoad(mode=sys.argv[1] if len(sys.argv) > 1 else "upsert")
     print(ETL_obj.main()) # length of records inserted
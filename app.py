@@ -1,41 +1,34 @@
 import sys
 import os
 
-import certifi
-ca = certifi.where()
-
 from dotenv import load_dotenv
 load_dotenv()
-mongo_db_url = os.getenv("URI")
-print(mongo_db_url)
-import pymongo
 from package.exception import CustomException
-from package.pipeline.training_pipeline import TrainingPipeline
+from package.pipeline.training_pipeline import TrainingJobManager, TRAINING_MODES
 from package.pipeline.prediction_pipeline import PredictionPipeline
-from package.configuration import ModelTrainerConfig, DataTransformationConfig
+from package.components.prediction import PredictionComponents
+from package.components.micro_batcher import MicroBatcher
+from package.components.prediction_sink import get_prediction_sink
+from package.components.drift import get_drift_monitor
+from package.components.schema_validator import get_schema_validator
+from package.configuration import ModelTrainerConfig, DataTransformationConfig, PredictionConfig
+from package.components.model_registry import ModelRegistry
+from package.logger import logging
 
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, File, UploadFile,Request
+from fastapi import FastAPI, File, UploadFile, Request, HTTPException
 from uvicorn import run as app_run
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import asyncio
 from starlette.responses import RedirectResponse
-import pandas as pd
 import numpy as Numpy
-from package.utils import load_obj, load_json
-import bentoml, dagshub
-
-
-
-
-client = pymongo.MongoClient(mongo_db_url, tlsCAFile=ca)
+import json
+from package.utils import load_array
 
-from package.constants import DataIngestionConstants
-
-# Initialize Dagshub
-dagshub.init(repo_owner='hasan-raza-01', repo_name='Network-Security', mlflow=True)
-
-database = client[DataIngestionConstants.DATABASE_NAME]
-collection = database[DataIngestionConstants.COLLECTION_NAME]
+# mongodb and dagshub/mlflow clients are created by the training stages that use them,
+# so the API starts without network access
 
 app = FastAPI()
 origins = ["*"]
@@ -51,43 +44,214 @@ app.add_middleware(
 from fastapi.templating import Jinja2Templates
 templates = Jinja2Templates(directory="./templates")
 
+# model and preprocessor stay resident and are swapped when the artifacts change
+registry = ModelRegistry(DataTransformationConfig, ModelTrainerConfig, PredictionConfig)
+
+# CPU bound work runs here so the event loop keeps serving requests
+executor = ThreadPoolExecutor(max_workers=PredictionConfig.MAX_WORKERS, thread_name_prefix="predict")
+
+# training runs in the background, one job at a time, and its model is served once it succeeds
+training_jobs = TrainingJobManager(on_success=registry.reload)
+
+@app.on_event("startup")
+async def load_model():
+    try:
+        registry.load()
+    except Exception as e:
+        # no trained model yet, it gets loaded on first prediction
+        logging.exception(e)
+    registry.start_polling()
+
+@app.on_event("shutdown")
+async def stop_model_polling():
+    registry.stop_polling()
+
 @app.get("/", tags=["authentication"])
 async def index():
     return RedirectResponse(url="/docs")
 
 @app.get("/train")
-async def train_route():
+async def train_route(mode: str = "full"):
+    if mode not in TRAINING_MODES:
+        raise HTTPException(status_code=422, detail=f"mode must be one of {TRAINING_MODES}")
     try:
-        train_pipeline=TrainingPipeline()
-        train_pipeline.run()
-        return Response("Training is successful")
+        job, created = training_jobs.submit(mode)
+        return JSONResponse(job.to_dict(), status_code=202 if created else 409)
     except Exception as e:
         raise CustomException(e,sys)
+
+@app.get("/train/{job_id}")
+async def train_status_route(job_id: str):
+    job = training_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"training job {job_id} not found")
+    return job.to_dict()
+
+@app.get("/health")
+async def health_route():
+    return registry.health()
+
+@app.post("/reload")
+async def reload_route():
+    """loads the newest intact model of the model store, publishing new training artifacts first"""
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(executor, registry.reload)
+    except Exception as e:
+        # the active version keeps serving
+        raise HTTPException(status_code=503, detail=str(e))
+    return registry.health()
     
+def validate_features(data: Numpy.ndarray)->None:
+    """rejects a payload with records that don't fit the schema before scoring"""
+    validator = get_schema_validator(PredictionConfig.SCHEMA_FILE_PATH)
+    invalid, reasons = validator.check_array(data, exclude=[PredictionConfig.TARGET_COLUMN_NAME])
+    if reasons:
+        raise HTTPException(status_code=422, detail={"invalid_rows": int(invalid.sum()), "reasons": reasons})
+
+def select_features(data: Numpy.ndarray, columns: list)->Numpy.ndarray:
+    """feature columns of a csv or arrow body in schema order, selected by name"""
+    if columns is None:
+        return data
+    target = PredictionConfig.TARGET_COLUMN_NAME
+    features = [col for col in get_schema_validator(PredictionConfig.SCHEMA_FILE_PATH).columns if col != target]
+    missing = [col for col in features if col not in columns]
+    extra = [col for col in columns if col not in features and col != target]
+    if missing or extra:
+        raise HTTPException(status_code=422, detail={"missing_columns": missing, "unexpected_columns": extra})
+    indices = [columns.index(col) for col in features]
+    # already in schema order, no copy of the payload
+    if indices == list(range(len(features))) and len(columns) == len(features):
+        return data
+    return data[:, indices]
+
+def prepare_batch(contents: bytes, content_type: str)->Numpy.ndarray:
+    """parses, selects and validates a batch body, all off the event loop"""
+    try:
+        data, columns = load_array(contents, content_type)
+    except Exception as e:
+        # the details with file paths stay in the server log
+        logging.exception(e)
+        content_type = content_type.split(";")[0].strip() or "application/x-npy"
+        raise HTTPException(status_code=400, detail=f"could not parse body as {content_type}")
+    data = select_features(data, columns)
+    validate_features(data)
+    return data
+
+def load_table(contents: bytes)->Numpy.ndarray:
+    data = Numpy.load(BytesIO(contents))
+    if len(data) > PredictionConfig.HTML_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"the HTML view is limited to {PredictionConfig.HTML_MAX_ROWS} rows, use /predict/batch")
+    validate_features(data)
+    return data
+
+def render_table(data: Numpy.ndarray, pred)->str:
+    import pandas as pd
+    df = pd.DataFrame(data)
+    #df['predicted_column'].replace(-1, 0)
+    #return df.to_json()
+    df["Result"] = pred
+    return df.to_html(classes='table table-striped')
+
+def predict_table(data: Numpy.ndarray)->str:
+    import pandas as pd
+    active = registry.get()
+    pipeline = PredictionPipeline(active.model, None, data=pd.DataFrame(data))
+    return render_table(data, pipeline.main())
+
 @app.post("/predict")
 async def predict_route(request: Request,file: UploadFile = File(...)):
     try:
-        df = pd.DataFrame(Numpy.load(file.file))
-        try:
-
-            # # load model from mlflow
-            model_name = load_json(ModelTrainerConfig.CONFIG_FILE_PATH)["model"]
-            model = bentoml.mlflow.load_model(f"{model_name}:latest")
-        except:
-            model = load_obj(ModelTrainerConfig.ESTIMATOR_FILE_PATH)
-        preprocessor = load_obj(DataTransformationConfig.PREPROCESSOR_PATH)
-        pipeline = PredictionPipeline(model, preprocessor, data=df)
-        pred = pipeline.main()
-        #df['predicted_column'].replace(-1, 0)
-        #return df.to_json()
-        df["Result"] = pred
-        table_html = df.to_html(classes='table table-striped')
+        contents = await file.read()
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(executor, load_table, contents)
+        if data.ndim == 2 and len(data) <= PredictionConfig.MICRO_BATCH_MAX_REQUEST_ROWS:
+            # small uploads are coalesced with the other small requests, like on /predict/batch
+            pred = await asyncio.wrap_future(batcher.submit(data))
+            table_html = await loop.run_in_executor(executor, render_table, data, pred)
+        else:
+            table_html = await loop.run_in_executor(executor, predict_table, data)
         #print(table_html)
         return templates.TemplateResponse("index.html", {"request": request, "table": table_html})
         
+    except HTTPException:
+        raise
     except Exception as e:
             raise CustomException(e,sys)
 
+def predict_chunk(data: Numpy.ndarray, proba: bool)->tuple:
+    active = registry.get()
+    predictor = PredictionComponents(PredictionConfig)
+    return predictor.predict_array(active.model, data, proba)
+
+# tiny requests are coalesced into one vectorized predict call
+batcher = MicroBatcher(
+    predict_fn=lambda data: predict_chunk(data, False)[0],
+    max_batch_size=PredictionConfig.MICRO_BATCH_MAX_BATCH_SIZE,
+    max_latency=PredictionConfig.MICRO_BATCH_MAX_LATENCY
+)
+
+@app.get("/metrics")
+async def metrics_route():
+    return {"micro_batcher": batcher.metrics(), "prediction_sink": get_prediction_sink(PredictionConfig).stats()}
+
+@app.get("/drift")
+async def drift_route(reset: bool = False):
+    """distribution drift of the prediction inputs seen so far against the train data"""
+    return get_drift_monitor(PredictionConfig).report(reset)
+
+def npy_header(dtype, shape: tuple)->bytes:
+    buffer = BytesIO()
+    header = {"descr": Numpy.lib.format.dtype_to_descr(Numpy.dtype(dtype)), "fortran_order": False, "shape": shape}
+    Numpy.lib.format.write_array_header_1_0(buffer, header)
+    return buffer.getvalue()
+
+@app.post("/predict/batch")
+async def predict_batch_route(request: Request, proba: bool = False, format: str = "json"):
+    """machine facing batch prediction
+
+    body: .npy, csv (with header) or Arrow IPC, selected by the Content-Type header
+    response:
+        - json: application/x-ndjson, one {"pred": [...], "proba": [[...]]} line per chunk
+        - npy: a single .npy array, int8 predictions or float32 probabilities when proba=true
+    """
+    if format not in ("json", "npy"):
+        raise HTTPException(status_code=400, detail=f"unsupported format {format}, expected json or npy")
+    contents = await request.body()
+    content_type = request.headers.get("content-type", "")
+    loop = asyncio.get_running_loop()
+    # checking a large body takes long, nothing else would be served meanwhile
+    data = await loop.run_in_executor(executor, prepare_batch, contents, content_type)
+    del contents
+
+    chunk_size = PredictionConfig.BATCH_CHUNK_SIZE
+
+    async def predict(chunk: Numpy.ndarray)->tuple:
+        if not proba and len(chunk) <= PredictionConfig.MICRO_BATCH_MAX_REQUEST_ROWS:
+            return await asyncio.wrap_future(batcher.submit(chunk)), None
+        return await loop.run_in_executor(executor, predict_chunk, chunk, proba)
+
+    async def stream():
+        if format == "npy":
+            # written before any chunk, an empty body still gets a valid empty array
+            if proba:
+                active = await loop.run_in_executor(executor, registry.get)
+                yield npy_header(Numpy.float32, (len(data), len(active.model.estimator.classes_)))
+            else:
+                yield npy_header(Numpy.int8, (len(data),))
+        for start in range(0, len(data), chunk_size):
+            pred, probabilities = await predict(data[start:start+chunk_size])
+            if format == "json":
+                line = {"pred": pred.tolist()}
+                if proba:
+                    line["proba"] = probabilities.tolist()
+                yield json.dumps(line, separators=(",", ":")).encode() + b"\n"
+            else:
+                yield (probabilities if proba else pred).tobytes()
+
+    media_type = "application/x-ndjson" if format == "json" else "application/x-npy"
+    return StreamingResponse(stream(), media_type=media_type)
+
     
 if __name__=="__main__":
     app_run(app,host="0.0.0.0",port=8000)
@@ -0,0 +1,395 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+from sklearn.pipeline import Pipeline
+from sklearn.impute import SimpleImputer
+from sklearn.model_selection import GridSearchCV, ParameterGrid
+from sklearn.metrics import accuracy_score
+from sklearn.linear_model import LogisticRegression
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import AdaBoostClassifier, GradientBoostingClassifier, RandomForestClassifier
+from package.components.inference import FusedInferenceModel
+from package.components.data_ingestion import DataIngestionComponents
+from package.utils import save_frame, load_frame, load_json, save_obj, evaluate_models
+from import_time import IMPORT_TIME_BUDGET, get_import_times, get_excluded_imports
+
+
+def timeit(func, repeat:int=5)->float:
+    """best wall time of func over repeat runs in seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def synthetic_features(n_rows:int, n_features:int=30, nan_fraction:float=0.0, seed:int=42)->np.ndarray:
+    """random -1/0/1 features shaped like the phishing dataset
+    """
+    rng = np.random.default_rng(seed)
+    data = rng.integers(-1, 2, size=(n_rows, n_features)).astype(np.float64)
+    if nan_fraction:
+        data[rng.random(data.shape) < nan_fraction] = np.nan
+    return data
+
+
+def benchmark_fused_inference(batch_sizes:tuple=(1, 100, 10_000, 1_000_000))->None:
+    """two step preprocessor.transform + model.predict against FusedInferenceModel.predict
+    """
+    X_train = synthetic_features(11_000, nan_fraction=0.01)
+    y_train = (np.nan_to_num(X_train[:, 0]) > 0).astype(int)
+    preprocessor = Pipeline([("imputer", SimpleImputer(strategy="most_frequent"))])
+    X_train = preprocessor.fit_transform(X_train)
+    model = RandomForestClassifier(n_estimators=256, n_jobs=-1, random_state=42).fit(X_train, y_train)
+    fused = FusedInferenceModel.from_pipeline(preprocessor, model)
+
+    print(f"{'batch':>10} {'nan':>5} {'two step (s)':>14} {'fused (s)':>12} {'speedup':>8}")
+    for batch_size in batch_sizes:
+        repeat = 1 if batch_size >= 1_000_000 else 5
+        for nan_fraction in (0.0, 0.01):
+            data = synthetic_features(batch_size, nan_fraction=nan_fraction, seed=batch_size)
+            two_step = timeit(lambda: model.predict(preprocessor.transform(data)), repeat)
+            single_step = timeit(lambda: fused.predict(data), repeat)
+            print(f"{batch_size:>10} {nan_fraction:>5} {two_step:>14.4f} {single_step:>12.4f} {two_step / single_step:>7.2f}x")
+
+
+def measure(func)->tuple:
+    """wall time in seconds and peak traced python memory in MB of a single call
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, peak / 1024 / 1024
+
+
+class SyntheticCollection:
+    """stand-in for a mongodb collection that generates phishing-like documents lazily,
+    so only the ingestion side is measured
+    """
+
+    def __init__(self, n_documents:int, n_features:int=30):
+        self.n_documents = n_documents
+        self.columns = [f"feature_{i}" for i in range(n_features)] + ["Result"]
+
+    def find(self, filter:dict=None, projection:dict=None, batch_size:int=None):
+        from bson import ObjectId
+        rng = np.random.default_rng(42)
+        include_id = not projection or projection.get("_id", 1)
+        remaining = self.n_documents
+        while remaining:
+            size = min(remaining, 10_000)
+            values = rng.integers(-1, 2, size=(size, len(self.columns))).tolist()
+            for row in values:
+                document = {"_id": ObjectId()} if include_id else {}
+                document.update(zip(self.columns, row))
+                yield document
+            remaining -= size
+
+
+def benchmark_mongo_ingestion(sizes:tuple=(10_000, 1_000_000, 10_000_000))->None:
+    """pd.DataFrame(collection.find()) against streaming int8 ingestion
+    """
+    def dict_per_row(collection):
+        return pd.DataFrame(collection.find()).drop("_id", axis=1)
+
+    def streaming(collection):
+        return DataIngestionComponents.collection_to_dataframe(collection, collection.columns, batch_size=10_000)[0]
+
+    print(f"{'documents':>10} {'method':>12} {'time (s)':>10} {'peak (MB)':>10}")
+    for size in sizes:
+        collection = SyntheticCollection(size)
+        methods = {"streaming": streaming}
+        if size <= 1_000_000:
+            # the dict per row frame needs tens of GB beyond this
+            methods["dict-per-row"] = dict_per_row
+        for name, method in methods.items():
+            elapsed, peak = measure(lambda: method(collection))
+            print(f"{size:>10} {name:>12} {elapsed:>10.2f} {peak:>10.1f}")
+
+
+def benchmark_storage_formats(sizes:tuple=(11_055, 1_000_000))->None:
+    """write time, parse time and on-disk size of the data artifacts per file format
+    """
+    print(f"{'rows':>10} {'format':>8} {'write (s)':>10} {'read (s)':>10} {'size (MB)':>10}")
+    for size in sizes:
+        columns = [f"feature_{i}" for i in range(30)] + ["Result"]
+        data = pd.DataFrame(synthetic_features(size, n_features=len(columns)).astype(np.int8), columns=columns)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for suffix in (".csv", ".parquet", ".feather"):
+                path = os.path.join(temp_dir, f"train{suffix}")
+                write = timeit(lambda: save_frame(data, path), repeat=3)
+                read = timeit(lambda: load_frame(path), repeat=3)
+                print(f"{size:>10} {suffix[1:]:>8} {write:>10.3f} {read:>10.3f} {os.path.getsize(path) / 1024 / 1024:>10.2f}")
+
+
+class NullCollection:
+    """stand-in for a mongodb collection that accepts inserts after a fixed round trip,
+    so only the loader side and the overlap of concurrent batches are measured
+    """
+
+    def __init__(self, latency:float=0.005):
+        self.latency = latency
+
+    def create_index(self, *args, **kwargs):
+        return None
+
+    def update_one(self, *args, **kwargs):
+        return None
+
+    def insert_many(self, documents:list, ordered:bool=True):
+        from types import SimpleNamespace
+        time.sleep(self.latency)
+        return SimpleNamespace(inserted_ids=[document.get("_id") for document in documents])
+
+    def bulk_write(self, requests:list, ordered:bool=True):
+        from types import SimpleNamespace
+        time.sleep(self.latency)
+        return SimpleNamespace(bulk_api_result={"nUpserted": len(requests), "nModified": 0})
+
+
+def benchmark_etl_load(sizes:tuple=(11_055, 1_000_000))->None:
+    """docs/s of the transpose + to_json documents and a single insert_many against the
+    streaming loader of ETL.py with concurrent unordered insert or upsert batches, on a
+    stand-in collection with a fixed round trip (mongomock checks unique indexes with a
+    scan per document, which hides everything else)
+    """
+    from ETL import ExtractTransformLoad
+
+    def json_single(path, collection):
+        data = pd.read_csv(path)
+        records = list(json.loads(data.T.to_json()).values())
+        for start in range(0, len(records), 100_000):
+            # pymongo splits a single insert_many into 48MB messages
+            collection.insert_many(records[start:start + 100_000])
+        return len(records)
+
+    print(f"{'rows':>10} {'method':>12} {'time (s)':>10} {'docs/s':>10}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        checkpoint = os.path.join(temp_dir, "checkpoint.json")
+        for size in sizes:
+            columns = [f"feature_{i}" for i in range(30)] + ["Result"]
+            path = os.path.join(temp_dir, "data.csv")
+            pd.DataFrame(synthetic_features(size, n_features=len(columns)), columns=columns).to_csv(path, index=False)
+            methods = {"json-single": lambda: json_single(path, NullCollection()),
+                       "insert": lambda: ExtractTransformLoad("insert", checkpoint_path=checkpoint).push_to_db(path, NullCollection(), NullCollection()),
+                       "upsert": lambda: ExtractTransformLoad("upsert", checkpoint_path=checkpoint).push_to_db(path, NullCollection(), NullCollection())}
+            for name, method in methods.items():
+                start = time.perf_counter()
+                rows = method()
+                elapsed = time.perf_counter() - start
+                print(f"{size:>10} {name:>12} {elapsed:>10.2f} {rows / elapsed:>10.0f}")
+
+
+def get_grid(entry:dict, max_values:int=None)->dict:
+    """parameter grid of a params.json entry with every list cut to its first max_values entries
+    """
+    grid = entry["grid"] if "strategy" in entry else entry
+    return {key: values[:max_values] for key, values in grid.items()}
+
+
+def benchmark_model_search(max_values:int=2, n_jobs:int=-1)->None:
+    """serial GridSearchCV per model against the shared process pool of evaluate_models
+
+    Every list in params.json is cut to its first max_values entries so the
+    comparison finishes in minutes, max_values=None runs the full grids.
+    """
+    params = {model_name: get_grid(entry, max_values) for model_name, entry in load_json("params.json").items()}
+    def get_models():
+        return {
+            "RandomForestClassifier": RandomForestClassifier(),
+            "DecisionTreeClassifier": DecisionTreeClassifier(),
+            "GradientBoostingClassifier": GradientBoostingClassifier(),
+            "LogisticRegression": LogisticRegression(),
+            "AdaBoostClassifier": AdaBoostClassifier(),
+        }
+
+    X = synthetic_features(11_055)
+    y = ((X[:, 0] + X[:, 1] + X[:, 2]) > 0).astype(int)
+    X_train, X_test, y_train, y_test = X[:8844], X[8844:], y[:8844], y[8844:]
+
+    def serial_loop():
+        report = dict()
+        for model_name, model in get_models().items():
+            grid = GridSearchCV(model, params[model_name], n_jobs=n_jobs).fit(X_train, y_train)
+            model.set_params(**grid.best_params_).fit(X_train, y_train)
+            report[model_name] = {"score": accuracy_score(y_test, model.predict(X_test)), "params": grid.best_params_}
+        return report
+
+    fits = sum(len(ParameterGrid(grid)) for grid in params.values()) * 5
+    print(f"cores: {os.cpu_count()}, n_jobs: {n_jobs}, fits: {fits}")
+    print(f"{'method':>14} {'time (s)':>10}")
+    for name, method in (("serial loop", serial_loop),
+                         ("shared pool", lambda: evaluate_models(X_train, y_train, X_test, y_test, get_models(), params, n_jobs=n_jobs))):
+        start = time.perf_counter()
+        report = method()
+        print(f"{name:>14} {time.perf_counter() - start:>10.2f}   best: {max(report, key=lambda m: report[m]['score'])}")
+
+
+def benchmark_search_strategies(max_values:int=3, n_jobs:int=-1)->None:
+    """exhaustive, random and successive halving search of the GradientBoostingClassifier grid
+    """
+    grid = get_grid(load_json("params.json")["GradientBoostingClassifier"], max_values)
+    strategies = {
+        "exhaustive": grid,
+        "random": {"strategy": "random", "n_iter": 20, "grid": grid},
+        "halving": {"strategy": "halving", "resource": "n_estimators", "min_resource": 8, "grid": grid},
+        "halving-rows": {"strategy": "halving", "resource": "n_samples", "grid": grid},
+    }
+
+    X = synthetic_features(11_055)
+    y = ((X[:, 0] + X[:, 1] + X[:, 2]) > 0).astype(int)
+    X_train, X_test, y_train, y_test = X[:8844], X[8844:], y[:8844], y[8844:]
+
+    print(f"candidates: {len(ParameterGrid(grid))}")
+    print(f"{'strategy':>14} {'time (s)':>10} {'cv score':>10} {'test score':>10} {'rounds':>7}")
+    for name, entry in strategies.items():
+        models = {"GradientBoostingClassifier": GradientBoostingClassifier()}
+        start = time.perf_counter()
+        report = evaluate_models(X_train, y_train, X_test, y_test, models, {"GradientBoostingClassifier": entry}, n_jobs=n_jobs)
+        elapsed = time.perf_counter() - start
+        result = report["GradientBoostingClassifier"]
+        print(f"{name:>14} {elapsed:>10.2f} {result['cv_score']:>10.4f} {result['score']:>10.4f} {len(result['search']['rounds']):>7}")
+
+
+def benchmark_incremental_training(n_rows:int=110_550, new_fraction:float=0.1)->None:
+    """full refit of the best model against a warm_start update with the new records
+    """
+    from package.components.model_trainer import ModelTrainerComponents
+
+    X = synthetic_features(n_rows + 20_000)
+    y = ((X[:, 0] + X[:, 1] + X[:, 2] + 0.5 * X[:, 3]) > 0).astype(int)
+    X_train, y_train, X_test, y_test = X[:n_rows], y[:n_rows], X[n_rows:], y[n_rows:]
+    previous_rows = int(n_rows * (1 - new_fraction))
+
+    print(f"{'model':>28} {'full (s)':>10} {'update (s)':>11} {'full acc':>9} {'update acc':>11}")
+    for model in (RandomForestClassifier(n_estimators=256, max_features="sqrt"),
+                  GradientBoostingClassifier(n_estimators=256, subsample=0.85),
+                  LogisticRegression()):
+        current = model.__class__(**model.get_params()).fit(X_train[:previous_rows], y_train[:previous_rows])
+
+        start = time.perf_counter()
+        full = model.__class__(**model.get_params()).fit(X_train, y_train)
+        full_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        updated = ModelTrainerComponents.update_model(current, X_train, y_train, previous_rows)
+        update_time = time.perf_counter() - start
+
+        print(f"{type(model).__name__:>28} {full_time:>10.2f} {update_time:>11.2f} "
+              f"{accuracy_score(y_test, full.predict(X_test)):>9.4f} {accuracy_score(y_test, updated.predict(X_test)):>11.4f}")
+
+
+def benchmark_feature_dtypes(n_rows:int=1_000_000, fit_rows:int=200_000)->None:
+    """size, load time and training memory of the transformed features per dtype
+    """
+    X = synthetic_features(n_rows)
+    y = (X[:, 0] + X[:, 1] > 0).astype(np.int8)
+
+    print(f"{'dtype':>8} {'size (MB)':>10} {'load (s)':>9} {'fit (s)':>8} {'fit peak (MB)':>14} {'predict (rows/s)':>17}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for dtype in (np.float64, np.float32, np.int8):
+            path = os.path.join(temp_dir, f"X_{np.dtype(dtype).name}.npy")
+            np.save(path, X.astype(dtype))
+            load = timeit(lambda: np.load(path), repeat=3)
+            data = np.load(path, mmap_mode="r")
+
+            model = RandomForestClassifier(n_estimators=32, max_depth=12, random_state=42)
+            fit, peak = measure(lambda: model.fit(data[:fit_rows], y[:fit_rows]))
+            predict = timeit(lambda: model.predict(data), repeat=1)
+            print(f"{np.dtype(dtype).name:>8} {os.path.getsize(path) / 1024 / 1024:>10.1f} {load:>9.3f} {fit:>8.2f} "
+                  f"{peak:>14.1f} {n_rows / predict:>17,.0f}")
+            del data
+
+
+def benchmark_import_time(module:str="app", budget:float=IMPORT_TIME_BUDGET, repeat:int=3)->None:
+    """cumulative import time of module in a fresh interpreter, exits with 1 when the best
+    run is over budget or a training only dependency gets imported
+    """
+    modules = get_import_times(module, repeat)
+    best = modules[module]
+
+    print(f"{'module':>40} {'cumulative (s)':>15}")
+    for name, seconds in sorted(modules.items(), key=lambda item: item[1], reverse=True)[1:11]:
+        print(f"{name:>40} {seconds:>15.3f}")
+    excluded = get_excluded_imports(modules)
+    print(f"import {module}: {best:.3f}s, budget {budget:.3f}s, training only modules imported: {excluded or 'none'}")
+    if best > budget or excluded:
+        sys.exit(1)
+
+
+# loads an artifact in a fresh interpreter and reports load time and memory of the process
+LOAD_SCRIPT = """
+import sys, json, time
+import numpy as np, sklearn.ensemble
+from package.utils import load_obj
+
+def rss():
+    # private (anonymous) and page cache backed (file) resident memory in MB, linux only
+    fields = dict(line.split(":") for line in open("/proc/self/status") if line.startswith(("RssAnon", "RssFile")))
+    return {key: int(value.split()[0]) / 1024 for key, value in fields.items()}
+
+path, mmap_mode = sys.argv[1], sys.argv[2] or None
+before = rss()
+start = time.perf_counter()
+model = load_obj(path, mmap_mode)
+load = time.perf_counter() - start
+model.predict(np.zeros((1000, model.fill_values.shape[0]), dtype=np.float32))
+after = rss()
+print(json.dumps({"load": load, "anon": after["RssAnon"] - before["RssAnon"], "file": after["RssFile"] - before["RssFile"]}))
+"""
+
+
+def benchmark_serialization(n_rows:int=100_000, n_estimators:int=128)->None:
+    """file size, save time, load time and resident memory of the fused model per serializer,
+    anon is private memory of every worker, file is page cache shared by the workers
+    """
+    X = synthetic_features(n_rows)
+    y = (X[:, 0] + X[:, 1] > 0).astype(np.int8)
+    preprocessor = SimpleImputer(strategy="most_frequent").fit(X)
+    model = RandomForestClassifier(n_estimators=n_estimators, random_state=42, n_jobs=-1).fit(X, y)
+    fused = FusedInferenceModel.from_pipeline(preprocessor, model)
+
+    print(f"{'serializer':>16} {'size (MB)':>10} {'save (s)':>9} {'load (s)':>9} {'anon (MB)':>10} {'file (MB)':>10}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, suffix, compress, mmap_mode in (("pickle", ".pkl", 0, ""), ("joblib", ".joblib", 0, ""),
+                                                  ("joblib mmap", ".joblib", 0, "r"), ("joblib zlib 3", ".joblib", 3, "")):
+            path = os.path.join(temp_dir, f"inference_{compress}{suffix}")
+            save = timeit(lambda: save_obj(fused, path, compress), repeat=1)
+            runs = [json.loads(subprocess.run([sys.executable, "-c", LOAD_SCRIPT, path, mmap_mode], capture_output=True,
+                                              text=True, check=True).stdout) for _ in range(3)]
+            best = min(runs, key=lambda run: run["load"])
+            print(f"{name:>16} {os.path.getsize(path) / 1024 / 1024:>10.1f} {save:>9.3f} {best['load']:>9.3f} "
+                  f"{best['anon']:>10.1f} {best['file']:>10.1f}")
+
+
+BENCHMARKS = {
+    "fused_inference": benchmark_fused_inference,
+    "mongo_ingestion": benchmark_mongo_ingestion,
+    "storage_formats": benchmark_storage_formats,
+    "model_search": benchmark_model_search,
+    "search_strategies": benchmark_search_strategies,
+    "incremental_training": benchmark_incremental_training,
+    "feature_dtypes": benchmark_feature_dtypes,
+    "etl_load": benchmark_etl_load,
+    "import_time": benchmark_import_time,
+    "serialization": benchmark_serialization,
+}
+
+
+if __name__=="__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"\n>>>>>>>>>>>>>>>>>>>>> {name} <<<<<<<<<<<<<<<<<<<<<")
+        BENCHMARKS[name]()
@@ -0,0 +1,39 @@
+"""import time of the API in a fresh interpreter, shared by benchmark.py and the tests
+
+Only the standard library is imported here, so measuring doesn't load what
+the check keeps out of the API startup.
+"""
+import subprocess
+import sys
+
+
+# cold start budget of the API, python -X importtime -c "import app" in seconds
+IMPORT_TIME_BUDGET = 1.0
+
+# training only dependencies the API must not import at startup
+STARTUP_EXCLUDED_MODULES = ("pandas", "sklearn", "scipy", "pymongo", "mlflow", "dagshub")
+
+
+def get_import_times(module:str="app", repeat:int=3)->dict:
+    """cumulative import time in seconds of module and everything it imports, in a fresh
+    interpreter, taken from the best of repeat runs
+    """
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                capture_output=True, text=True, check=True)
+        # import time: self [us] | cumulative | imported package
+        times = dict()
+        for line in result.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+                _, cumulative, name = line[len("import time:"):].split("|")
+                times[name.strip()] = int(cumulative) / 1e6
+        if best is None or times[module] < best[module]:
+            best = times
+    return best
+
+
+def get_excluded_imports(times:dict)->list:
+    """training only dependencies among the imported modules
+    """
+    return sorted({name.split(".")[0] for name in times} & set(STARTUP_EXCLUDED_MODULES))
@@ -1,36 +1,41 @@
-import bentoml, dagshub
+import bentoml
 import numpy as Numpy
 from package.pipeline.training_pipeline import TrainingPipeline
 from package.pipeline.prediction_pipeline import PredictionPipeline
-from package.configuration import DataTransformationConfig, ModelTrainerConfig
-from package.utils import load_obj, load_json
+from package.configuration import DataTransformationConfig, ModelTrainerConfig, PredictionConfig
+from package.components.model_registry import ModelRegistry
 
 
 
 @bentoml.service
 class NetworkSecurity:
 
+    def __init__(self):
+        # model and preprocessor stay resident and are swapped when the artifacts change
+        self.registry = ModelRegistry(DataTransformationConfig, ModelTrainerConfig, PredictionConfig)
+        self.registry.load()
+        self.registry.start_polling()
+
     @bentoml.api
-    def train(self):
+    def train(self, incremental:bool=False):
         pipeline = TrainingPipeline()
-        pipeline.run()
+        pipeline.run(incremental)
+        self.registry.reload()
 
         return "Training Completed"
-    
+
+    @bentoml.api
+    def health(self)->dict:
+        return self.registry.health()
+
+    @bentoml.api
+    def reload(self)->dict:
+        self.registry.reload()
+        return self.registry.health()
+
     @bentoml.api
     def predict(self, input_data:Numpy.ndarray)->list:
-        try:
-            # Initialize Dagshub
-            dagshub.init(repo_owner='hasan-raza-01', repo_name='Network-Security', mlflow=True)
-
-            # # load model from mlflow
-            model_name = load_json(ModelTrainerConfig.CONFIG_FILE_PATH)["model"]
-            model = bentoml.mlflow.load_model(f"{model_name}:latest")
-        except:
-            model = load_obj(ModelTrainerConfig.ESTIMATOR_FILE_PATH)
-        preprocessor = load_obj(DataTransformationConfig.PREPROCESSOR_PATH)
-        pipeline = PredictionPipeline(model, preprocessor, data=input_data)
+        active = self.registry.get()
+        pipeline = PredictionPipeline(active.model, None, data=input_data)
         pred = pipeline.main()
         return pred
-
-
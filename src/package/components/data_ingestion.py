@@ -1,48 +1,242 @@
 from package.entity import DataIngestionConfigEntity
 from package.exception import CustomException
 from package.logger import logging
-from package.utils import create_dirs
+from package.utils import (create_dirs, read_yaml, load_json, save_json, iter_frame_chunks, FrameWriter, get_schema_dtype,
+                           cast_if_lossless)
 from dataclasses import dataclass
 from dotenv import load_dotenv
 from pymongo import MongoClient
-from sklearn.model_selection import train_test_split
+from bson import ObjectId
+from datetime import datetime
+from operator import itemgetter
+from itertools import islice
+from glob import glob
 import pandas as pd
+import numpy as np
+import time
 import sys
 import os
 
 
+def to_float(value:any)->float:
+    """value of a document field as a float, NaN if missing and inf if it isn't a number
+    """
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError, OverflowError):
+        return np.inf
+
+
 @dataclass
 class DataIngestionComponents:
     data_ingestion_config: DataIngestionConfigEntity
 
+    # feature store and splits hold the values as ingested, they are only cast to the schema dtype
+    # once the validation stage has quarantined the records that don't fit it
+    RAW_DTYPE = np.float64
+
+    @staticmethod
+    def documents_to_array(documents:list, columns:list, dtype:type)->np.ndarray:
+        """converts a batch of documents into a 2D array, of dtype if every value fits it exactly
+
+        Missing fields become NaN and are imputed in the transformation stage. Values
+        that aren't numbers become inf, so the validation stage quarantines their records
+        instead of imputing them.
+
+        Args:
+            documents (list): mongodb documents
+            columns (list): fields to extract, in order
+            dtype (type): dtype of the array, float64 is kept if a value doesn't fit it exactly
+
+        Returns:
+            np.ndarray: (len(documents), len(columns)) array
+        """
+        getter = itemgetter(*columns)
+        try:
+            data = np.array([getter(document) for document in documents], dtype=np.float64)
+        except (KeyError, TypeError, ValueError, OverflowError):
+            data = np.array([[to_float(document.get(col)) for col in columns] for document in documents], dtype=np.float64)
+        return cast_if_lossless(data, dtype)
+
     @staticmethod
-    def collection_to_dataframe(collection)->pd.DataFrame:
+    def iter_collection_batches(collection, columns:list=None, query:dict=None, watermark_field:str=None,
+                                batch_size:int=10000, dtype:type=np.int8):
+        """streams a mongodb collection as typed 2D arrays
+
+        Args:
+            collection (mongodb collection): collection to read
+            columns (list, optional): fields to collect, all fields if None. Column order follows the documents
+            query (dict, optional): mongodb filter. Defaults to all documents.
+            watermark_field (str, optional): field to sort by and report the last value of
+            batch_size (int, optional): cursor batch size and rows per array. Defaults to 10000.
+            dtype (type, optional): dtype of the arrays. Defaults to np.int8.
+
+        Yields:
+            tuple: (array, columns, last watermark value of the batch)
+        """
+        projection = {"_id": 0}
+        if columns is not None:
+            projection.update({col: 1 for col in columns})
+        if watermark_field is not None:
+            projection[watermark_field] = 1
+        cursor = collection.find(query or {}, projection, batch_size=batch_size)
+        if watermark_field is not None:
+            cursor = cursor.sort(watermark_field, 1)
+
+        ordered_columns = None
+        while True:
+            documents = list(islice(cursor, batch_size))
+            if not documents:
+                break
+            if ordered_columns is None:
+                # keep the field order of the documents
+                first = [col for col in documents[0].keys() if col != watermark_field]
+                ordered_columns = first + [col for col in (columns or []) if col not in first]
+            watermark = documents[-1].get(watermark_field) if watermark_field is not None else None
+            yield DataIngestionComponents.documents_to_array(documents, ordered_columns, dtype), ordered_columns, watermark
+
+    @staticmethod
+    def collection_to_dataframe(collection, columns:list=None, batch_size:int=10000, dtype:type=np.int8,
+                                query:dict=None, watermark_field:str=None)->tuple[pd.DataFrame, any]:
         """converts mongodb collection into pandas dataframe
 
+        Documents are streamed in batches without "_id" and packed into typed
+        buffers, so peak memory follows the column data instead of one dict per row.
+
         Args:
             collection (mongodb collection): collection which needs to convert into dataframe
+            columns (list, optional): fields to collect, all fields if None. Column order follows the documents
+            batch_size (int, optional): cursor batch size and rows per buffer. Defaults to 10000.
+            dtype (type, optional): dtype of the feature buffers. Defaults to np.int8.
+            query (dict, optional): mongodb filter. Defaults to all documents.
+            watermark_field (str, optional): field to sort by and report the highest value of
 
         Returns:
-            pandas.DataFrame
+            tuple[pd.DataFrame, any]: (data, highest watermark value or None)
         """
         try:
             logging.info("In collection_to_dataframe")
+            start = time.perf_counter()
 
-            # collection mongodb collection 
-            df = pd.DataFrame(collection.find())
-            logging.info("data successfully converted (mongodb collection ===> pandas DataFrame)")
+            # collection mongodb collection
+            chunks = list()
+            watermark = None
+            batches = DataIngestionComponents.iter_collection_batches(collection, columns, query, watermark_field, batch_size, dtype)
+            for chunk, columns, watermark in batches:
+                chunks.append(chunk)
+            logging.info(f"collected {sum(len(chunk) for chunk in chunks)} documents in {len(chunks)} batches")
 
             # converting mongodb collection into pandas dataframe
-            df = df.drop("_id", axis=1)
+            if not chunks:
+                return pd.DataFrame(columns=columns), None
+            data = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+            del chunks
+            df = pd.DataFrame(data, columns=columns, copy=False)
+            if data.dtype != dtype:
+                # keep dtype for every column that holds it exactly
+                for col in columns:
+                    df[col] = cast_if_lossless(df[col].to_numpy(), dtype)
+            logging.info(f"data successfully converted (mongodb collection ===> pandas DataFrame) in {time.perf_counter() - start:.2f}s")
 
             logging.info("Out collection_to_dataframe")
-            return df
+            return df, watermark
+        except Exception as e:
+            logging.exception(e)
+            raise CustomException(e, sys)
+
+    @staticmethod
+    def get_test_mask(data:pd.DataFrame, split_ratio:float)->np.ndarray:
+        """assigns every record to train or test from a stable hash of its content
+
+        The hash only depends on the values of the record, so a record lands in
+        the same split on every run no matter which other records exist.
+
+        Args:
+            data (pd.DataFrame): records to split
+            split_ratio (float): fraction of records that go to test
+
+        Returns:
+            np.ndarray: True for test records
+        """
+        hashes = pd.util.hash_pandas_object(data.astype(np.float64), index=False).to_numpy()
+        return (hashes % 10000) < int(split_ratio * 10000)
+
+    def load_watermark(self)->any:
+        """reads the highest ingested watermark value, None if nothing was ingested yet
+        """
+        path = self.data_ingestion_config.WATERMARK_FILE_PATH
+        if not os.path.exists(path):
+            return None
+        watermark = load_json(path)
+        if watermark["field"] != self.data_ingestion_config.WATERMARK_FIELD:
+            raise CustomException(f"feature store was built with watermark field {watermark['field']}, "
+                                  f"not {self.data_ingestion_config.WATERMARK_FIELD}", sys)
+        if watermark["type"] == "ObjectId":
+            return ObjectId(watermark["value"])
+        if watermark["type"] == "datetime":
+            return datetime.fromisoformat(watermark["value"])
+        return watermark["value"]
+
+    def save_watermark(self, value:any)->None:
+        """records the highest ingested watermark value
+        """
+        if isinstance(value, ObjectId):
+            value_type, value = "ObjectId", str(value)
+        elif isinstance(value, datetime):
+            value_type, value = "datetime", value.isoformat()
+        else:
+            value_type = "raw"
+        watermark = {
+            "field": self.data_ingestion_config.WATERMARK_FIELD,
+            "type": value_type,
+            "value": value,
+            "updated_at": datetime.now().isoformat(timespec="seconds")
+        }
+        save_json(watermark, self.data_ingestion_config.WATERMARK_FILE_PATH)
+
+    def get_query(self, database, watermark:any)->dict:
+        """filter of the documents newer than watermark
+
+        ETL.py loads write their _id's out of order until they complete, so with
+        the _id watermark the query stops below the first _id of every load that
+        is still running or was interrupted, see the LOADS_COLLECTION_NAME markers.
+
+        Args:
+            database (mongodb database): database of the collection and the load markers
+            watermark (any): highest ingested watermark value, None if nothing was ingested yet
+
+        Returns:
+            dict: mongodb filter
+        """
+        try:
+            watermark_field = self.data_ingestion_config.WATERMARK_FIELD
+            condition = {"$gt": watermark} if watermark is not None else dict()
+            if watermark_field == "_id":
+                loads = database[self.data_ingestion_config.LOADS_COLLECTION_NAME]
+                running = [load["first_id"] for load in loads.find({"status": "running"}, {"first_id": 1})]
+                if running:
+                    limit = min(running)
+                    if watermark is not None and watermark >= limit:
+                        raise ValueError(f"watermark {watermark} is already past {limit}, the first _id of a load that "
+                                     f"hasn't completed, its documents would never be ingested")
+                    condition["$lt"] = limit
+                    logging.info(f"{len(running)} load(s) not complete, collecting documents below {limit}")
+            return {watermark_field: condition} if condition else dict()
         except Exception as e:
             logging.exception(e)
             raise CustomException(e, sys)
 
+    def get_partition_paths(self)->list:
+        """feature store partitions in ingestion order
+        """
+        _, file_name = os.path.split(self.data_ingestion_config.PARTITION_FILE_PATH)
+        partition_dir = self.data_ingestion_config.PARTITIONS_ROOT_DIR_PATH
+        return sorted(glob(os.path.join(partition_dir, f"[0-9]*_{file_name}")))
+
     def collect_data(self)->None:
-        """collects data from data base and saves locally
+        """collects documents added since the last run and appends them to the feature store
         """
         try:
             logging.info("In collect_data")
@@ -52,61 +246,89 @@ class DataIngestionComponents:
             create_dirs(self.data_ingestion_config.DATA_ROOT_DIR_PATH)
             create_dirs(self.data_ingestion_config.INGESTION_ROOT_DIR_PATH)
             create_dirs(self.data_ingestion_config.FEATURE_STORE_ROOT_DIR_PATH)
+            create_dirs(self.data_ingestion_config.PARTITIONS_ROOT_DIR_PATH)
             create_dirs(self.data_ingestion_config.INGESTED_ROOT_DIR_PATH)
             logging.info("Required dir's creation completed")
 
             # loading vulnarable variables
             load_dotenv()
             MONGODB_URI = os.getenv("MONGODB_URI")
-            
+
             # connecting to mongodb
             client = MongoClient(MONGODB_URI)
             logging.info("connected tot mongodb")
-            
+
             database_name = self.data_ingestion_config.DATABASE_NAME
             collection_name = self.data_ingestion_config.COLLECTION_NAME
-            
+
             # collection mongodb collection
             collection = client[database_name][collection_name]
 
-            # converting mongodb collection into pandas dataframe
-            self.data_frame = self.collection_to_dataframe(collection)
-            logging.info(f"collected data from mongodb DATABASE: {database_name} and COLLECTION: {collection_name}")
-            
-            # saving data into local file path
-            file_path = self.data_ingestion_config.RAW_FILE_PATH
-            self.data_frame.to_csv(file_path, index=False, header=True)
+            # only documents newer than the last ingested one
+            watermark_field = self.data_ingestion_config.WATERMARK_FIELD
+            watermark = self.load_watermark()
+            query = self.get_query(client[database_name], watermark)
+            logging.info(f"collecting documents with {watermark_field} > {watermark}")
+
+            # streaming new records batch by batch into the next feature store partition
+            partition_dir, file_name = os.path.split(self.data_ingestion_config.PARTITION_FILE_PATH)
+            file_path = os.path.join(partition_dir, f"{len(self.get_partition_paths()):06d}_{file_name}")
+            temp_file_path = os.path.join(partition_dir, f"tmp_{os.path.basename(file_path)}")
+
+            schema = read_yaml(self.data_ingestion_config.SCHEMA_FILE_PATH)
+            columns = list(schema.columns.keys())
+            dtype = get_schema_dtype(schema)
+            batches = self.iter_collection_batches(collection, columns, query, watermark_field,
+                                                   batch_size=self.data_ingestion_config.BATCH_SIZE, dtype=dtype)
+            new_watermark = None
+            with FrameWriter(temp_file_path, dtype=self.RAW_DTYPE) as writer:
+                for data, columns, new_watermark in batches:
+                    writer.write(pd.DataFrame(data, columns=columns, copy=False))
+            logging.info(f"collected {writer.rows} new records from mongodb DATABASE: {database_name} and COLLECTION: {collection_name}")
+
+            if writer.rows == 0:
+                logging.info("Out collect_data")
+                return
+
+            os.replace(temp_file_path, file_path)
             logging.info(f"Data saved at {file_path}")
 
+            # the watermark only moves once the partition is on disk
+            self.save_watermark(new_watermark)
+            logging.info(f"watermark moved to {new_watermark}")
+
             logging.info("Out collect_data")
         except Exception as e:
             logging.exception(e)
             raise CustomException(e, sys)
-    
+
     def get_splits(self)->None:
-        """Divide the collected data into train and test and saves locally
+        """Divide the feature store into train and test chunk by chunk and saves locally
         """
         try:
             logging.info("In get_splits")
 
             split_ratio = self.data_ingestion_config.SPLIT_RATIO
+            batch_size = self.data_ingestion_config.BATCH_SIZE
+            dtype = self.RAW_DTYPE
+            export_csv = self.data_ingestion_config.EXPORT_CSV
+            train_file_path = self.data_ingestion_config.TRAIN_FILE_PATH
+            test_file_path = self.data_ingestion_config.TEST_FILE_PATH
 
-            # getting train and test data according to split ratio
-            train_data, test_data = train_test_split(self.data_frame, test_size=split_ratio, random_state=42)
+            # getting train and test data according to split ratio, per record, one chunk resident at a time
+            with FrameWriter(train_file_path, dtype, export_csv) as train_writer, \
+                 FrameWriter(test_file_path, dtype, export_csv) as test_writer:
+                for path in self.get_partition_paths():
+                    for data_frame in iter_frame_chunks(path, batch_size):
+                        test_mask = self.get_test_mask(data_frame, split_ratio)
+                        train_writer.write(data_frame[~test_mask])
+                        test_writer.write(data_frame[test_mask])
             logging.info("data spliting completed")
+            logging.info(f"Train data ({train_writer.rows} records) saved at {train_file_path}")
+            logging.info(f"Test data ({test_writer.rows} records) saved at {test_file_path}")
 
-            # saving train data into local file path
-            train_file_path = self.data_ingestion_config.TRAIN_FILE_PATH
-            train_data.to_csv(train_file_path, index=False, header=True)
-            logging.info(f"Train data saved at {train_file_path}")
-
-            # saving test data into local file path
-            test_file_path = self.data_ingestion_config.TEST_FILE_PATH
-            test_data.to_csv(test_file_path, index=False, header=True)
-            logging.info(f"Test data saved at {test_file_path}")
-            
             logging.info("Out get_splits")
         except Exception as e:
             logging.exception(e)
             raise CustomException(e, sys)
-        
+
@@ -1,12 +1,14 @@
 from package.entity import DataValidationConfigEntity, DataTransformationConfigEntity
 from package.exception import CustomException
-from package.utils import create_dirs, save_obj, read_yaml
+from package.utils import create_dirs, save_obj, read_yaml, load_frame, iter_frame_chunks, ArrayWriter, get_schema_dtype
+from package.components.schema_validator import get_schema_validator
+from package.components.drift import get_value_counts
+from collections import Counter
 from dataclasses import dataclass
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 from package.logger import logging
 from pathlib import Path
-import pandas as pd
 import numpy as np
 import sys
 
@@ -28,55 +30,98 @@ class DataTransformationComponents:
         except Exception as e:
             raise CustomException(e, sys)
     
-    def transform_data(self, train_data_path:Path, test_data_path:Path)->tuple[np.array]:
-        """transform data with SimpleImputer only
+    def fit_preprocessor(self, preprocessor:Pipeline, data_path:Path)->Pipeline:
+        """fits the most frequent value imputer from value counts collected chunk by chunk,
+        the data is never loaded as a whole
+
+        Columns with allowed values in the schema are counted together with
+        get_value_counts, any other column with pandas value counts. The imputer
+        is then fitted on a single row of the most frequent values (the smallest
+        one on ties, like SimpleImputer), which gives it the same statistics as
+        fitting it on the whole data. A column without any value stays empty.
 
         Args:
-            train_data_path (Path): train file path
-            test_data_path (Path): test file path
+            preprocessor (Pipeline): preprocessor of get_preprocessor
+            data_path (Path): validated train data file path
 
         Returns:
-            tuple[np.array]: (train data, test data)
+            Pipeline: fitted preprocessor
         """
         try:
-            logging.info("In transform_data")
-
-            # get data
-            train_data = pd.read_csv(train_data_path)
-            test_data = pd.read_csv(test_data_path)
-            logging.info("validated data collection completed")
+            logging.info("In fit_preprocessor")
+            import pandas as pd
 
-            # X, y for train data
             target_column = self.data_transformation_config.TARGET_COLUMN_NAME
-            X_train  = train_data.drop(target_column, axis=1)
-            y_train = train_data[target_column].replace(-1, 0)
+            imputer = preprocessor.named_steps["imputer"]
+            if imputer.strategy != "most_frequent":
+                # other strategies need the values themselves
+                return preprocessor.fit(load_frame(data_path).drop(target_column, axis=1))
+
+            validator = get_schema_validator(self.data_transformation_config.SCHEMA_FILE_PATH)
+            allowed_values = validator.allowed_values
+            features = [col for col in validator.columns if col != target_column]
+            restricted = [col for col in features if col in allowed_values]
+            values = sorted({value for col in restricted for value in allowed_values[col]})
+            counts = np.zeros((len(restricted), len(values) + 1), dtype=np.int64)
+            counters = {col: Counter() for col in features if col not in allowed_values}
+
+            for data in iter_frame_chunks(data_path, self.data_transformation_config.CHUNK_SIZE):
+                if restricted:
+                    counts += get_value_counts(data[restricted].to_numpy(), values)
+                for col, counter in counters.items():
+                    counter.update(data[col].value_counts(dropna=True).to_dict())
+
+            # the last bin holds the missing values
+            most_frequent = dict()
+            for index, col in enumerate(restricted):
+                column_counts = counts[index, :-1]
+                most_frequent[col] = values[column_counts.argmax()] if column_counts.any() else np.nan
+            for col, counter in counters.items():
+                most_frequent[col] = min(counter, key=lambda value: (-counter[value], value)) if counter else np.nan
+
+            preprocessor.fit(pd.DataFrame({col: [most_frequent[col]] for col in features}))
+            logging.info("Out fit_preprocessor")
+            return preprocessor
+        except Exception as e:
+            raise CustomException(e, sys)
 
-            # X, y for test data
-            target_column = self.data_transformation_config.TARGET_COLUMN_NAME
-            X_test  = test_data.drop(target_column, axis=1)
-            y_test = test_data[target_column].replace(-1, 0)
-            
-            # get preprocessor object
-            preprocessor = self.get_preprocessor()
-            logging.info("preprocessor collected")
+    def transform_data(self, preprocessor:Pipeline, data_path:Path, X_file_path:Path, y_file_path:Path,
+                       dtype:type=np.float32)->int:
+        """transforms data chunk by chunk with a fitted preprocessor and saves input and output features
+        as separate .npy files that can be memory mapped
 
-            # transform data input features
-            transformed_X_train = preprocessor.fit_transform(X_train)
-            transformed_X_test = preprocessor.transform(X_test)
-            logging.info("input features transformation completed")
+        Args:
+            preprocessor (Pipeline): fitted preprocessor
+            data_path (Path): validated data file path
+            X_file_path (Path): file path of the transformed input features
+            y_file_path (Path): file path of the output features, int8
+            dtype (type, optional): dtype of the transformed input features. Defaults to np.float32.
 
-            # save preprocessor
-            preprocessor_path = self.data_transformation_config.PREPROCESSOR_PATH
-            save_obj(preprocessor, preprocessor_path)
-            logging.info(f"preprocessor object saved at {preprocessor_path}")
+        Returns:
+            int: number of records
+        """
+        try:
+            logging.info("In transform_data")
 
-            # concatination of input and output features
-            preprocessed_train_data = np.c_[transformed_X_train, np.array(y_train)]
-            preprocessed_test_data = np.c_[transformed_X_test, np.array(y_test)]
-            logging.info("concatination of X and y successfully completed")
+            target_column = self.data_transformation_config.TARGET_COLUMN_NAME
+            chunk_size = self.data_transformation_config.CHUNK_SIZE
+            integer = np.dtype(dtype).kind == "i"
+            with ArrayWriter(X_file_path, dtype) as X_writer, ArrayWriter(y_file_path, np.int8) as y_writer:
+                for data in iter_frame_chunks(data_path, chunk_size):
+                    # X, y
+                    X = data.drop(target_column, axis=1)
+                    y = data[target_column].replace(-1, 0)
+
+                    # transform data input features
+                    transformed_X = preprocessor.transform(X)
+                    if integer and not np.array_equal(transformed_X, np.round(transformed_X)):
+                        raise CustomException(f"transformed features don't fit {np.dtype(dtype)}, missing values left or not integral", sys)
+                    X_writer.write(transformed_X)
+                    y_writer.write(y.to_numpy())
+            logging.info(f"{X_writer.rows} records transformed, saved at {X_file_path} and {y_file_path}")
 
             logging.info("Out transform_data")
-            return (preprocessed_train_data, preprocessed_test_data)
+            return X_writer.rows
         except Exception as e:
             raise CustomException(e, sys)
 
@@ -99,7 +144,7 @@ class DataTransformationComponents:
                 if not status:
                     pass
                 else:
-                    message = "data drift status is True"
+                    message = "data drift status is True, too many records failed validation"
                     logging.info(message)
                     raise CustomException(message, sys)
                 
@@ -107,18 +152,27 @@ class DataTransformationComponents:
             train_data_path = self.data_validation_config.VALID_TRAIN_FILE_PATH
             test_data_path = self.data_validation_config.VALID_TEST_FILE_PATH
 
-            # get transformed data
-            train_data, test_data = self.transform_data(train_data_path, test_data_path)
+            # fit preprocessor on train data input features
+            target_column = self.data_transformation_config.TARGET_COLUMN_NAME
+            preprocessor = self.fit_preprocessor(self.get_preprocessor(), train_data_path)
+            logging.info("preprocessor fitted on train data")
+
+            # save preprocessor
+            preprocessor_path = self.data_transformation_config.PREPROCESSOR_PATH
+            save_obj(preprocessor, preprocessor_path, self.data_transformation_config.COMPRESS)
+            logging.info(f"preprocessor object saved at {preprocessor_path}")
+
+            # imputed features keep the compact dtype of the schema, estimators convert to float32 where they need it
+            dtype = get_schema_dtype(read_yaml(self.data_transformation_config.SCHEMA_FILE_PATH), exclude=[target_column])
+            logging.info(f"transformed features are stored as {dtype}")
 
             # save transformed train data
-            train_file_path = self.data_transformation_config.TRAIN_FILE_PATH
-            np.save(train_file_path, train_data)
-            logging.info(f"transformed train data saved at {train_file_path}")
+            self.transform_data(preprocessor, train_data_path,
+                                self.data_transformation_config.X_TRAIN_FILE_PATH, self.data_transformation_config.Y_TRAIN_FILE_PATH, dtype)
 
             # save transformed test data
-            test_file_path = self.data_transformation_config.TEST_FILE_PATH
-            np.save(test_file_path, test_data)
-            logging.info(f"transformed test data saved at {test_file_path}")
+            self.transform_data(preprocessor, test_data_path,
+                                self.data_transformation_config.X_TEST_FILE_PATH, self.data_transformation_config.Y_TEST_FILE_PATH, dtype)
             
             logging.info("Out intiate_transformation")
         except Exception as e:
@@ -2,10 +2,16 @@ from dataclasses import dataclass
 from package.entity import DataIngestionConfigEntity, DataValidationConfigEntity
 from package.exception import CustomException
 from package.logger import logging
-from package.utils import create_dirs, read_yaml, save_yaml
+from package.utils import create_dirs, save_yaml, iter_frame_chunks, FrameWriter
+from package.components.drift import get_value_counts, get_drift_report
+from package.components.schema_validator import SchemaValidator, get_schema_validator
+from collections import Counter
 from pathlib import Path
 import pandas as pd
+import numpy as np
+import time
 import sys
+import os
 
 
 @dataclass
@@ -13,69 +19,115 @@ class DataValidationComponents:
     data_ingestion_config: DataIngestionConfigEntity
     data_validation_config: DataValidationConfigEntity
 
-    @staticmethod
-    def get_report(train_data:pd.DataFrame, test_data:pd.DataFrame,schema_org_path:Path)->dict[dict]:
-        """validates columns and data types with schema
+    # column of the quarantine files holding why a row was rejected
+    REASON_COLUMN = "reason"
+
+    def validate_file(self, data_path:Path, valid_path:Path, invalid_path:Path, validator:SchemaValidator, count_columns:list,
+                      values:list)->tuple[dict, np.ndarray]:
+        """validates a data file chunk by chunk, valid rows go to valid_path, rejected rows
+        to the quarantine file invalid_path with the reason of the rejection
 
         Args:
-            train_file (Path): path for train file to compare with schema
-            test_file (Path): path for test file to compare with schema
+            data_path (Path): data to validate
+            valid_path (Path): file for the records passing the schema
+            invalid_path (Path): quarantine file for the other records, stored as text with a reason column
+            validator (SchemaValidator): compiled schema
+            count_columns (list): columns whose value counts of valid records are collected
+            values (list): values to count
 
         Returns:
-            dict[dict]: 
-                True: If file follows schema 
-                False: If file don't follow schema
+            tuple[dict, np.ndarray]: (validation statistics, value counts of count_columns)
+        """
+        try:
+            logging.info(f"In validate_file for {data_path}")
+            start = time.perf_counter()
+
+            columns = list(validator.columns)
+            required = [self.data_validation_config.TARGET_COLUMN_NAME]
+            export_csv = self.data_validation_config.EXPORT_CSV
+
+            # a quarantine file of an earlier run must not survive a clean run
+            for path in (invalid_path, Path(invalid_path).with_suffix(".csv")):
+                if os.path.exists(path):
+                    os.remove(path)
+
+            rows = 0
+            reasons = Counter()
+            counts = np.zeros((len(count_columns), len(values) + 1), dtype=np.int64)
+            with FrameWriter(valid_path, validator.dtype, export_csv) as valid_writer, \
+                 FrameWriter(invalid_path, export_csv=export_csv) as invalid_writer:
+                for data in iter_frame_chunks(data_path, self.data_validation_config.CHUNK_SIZE):
+                    invalid, reason, summary = validator.check_frame(data, required, self.data_validation_config.ALLOW_MISSING)
+                    rows += len(data)
+                    reasons.update(summary)
+
+                    if not invalid.all():
+                        valid_data = data.loc[~invalid, columns]
+                        valid_writer.write(valid_data)
+                        if count_columns:
+                            counts += get_value_counts(valid_data[count_columns].to_numpy(), values)
+                    if invalid.any():
+                        # raw values are kept as text, they don't fit the schema dtypes
+                        quarantined = data[invalid].astype("string")
+                        quarantined[self.REASON_COLUMN] = reason
+                        invalid_writer.write(quarantined)
+
+            seconds = time.perf_counter() - start
+            stats = {
+                "rows": rows,
+                "valid": valid_writer.rows,
+                "invalid": invalid_writer.rows,
+                "reasons": dict(reasons.most_common()),
+                "seconds": round(seconds, 3),
+                "rows_per_second": round(rows / seconds) if seconds else None
+            }
+            logging.info(f"{valid_writer.rows} of {rows} records valid, {invalid_writer.rows} quarantined at {invalid_path} "
+                         f"({stats['rows_per_second']} rows/s)")
+
+            logging.info("Out validate_file")
+            return stats, counts
+        except Exception as e:
+            logging.exception(e)
+            raise CustomException(e, sys)
+
+    def get_distribution_report(self, columns:list, values:list, reference:np.ndarray, current:np.ndarray)->dict:
+        """compares the value distribution of every column with allowed values in the schema
+        between train and test data
 
-                output: {result:{key:value}}
-                    key = type of data[train/test]
-                   value = True/False
+        Args:
+            columns (list): compared columns
+            values (list): counted values
+            reference (np.ndarray): value counts of train data
+            current (np.ndarray): value counts of test data
 
-        Note: schema will be taken from Configuration
+        Returns:
+            dict: thresholds, reference counts (also used for prediction inputs) and per column statistics of test data
         """
         try:
-            logging.info("In get_report")
-
-            schema_org = read_yaml(schema_org_path)
-            logging.info(f"schema collected from {schema_org_path}")
-            
-            data_dict = {"Train Data":train_data, "Test Data":test_data}
-
-            # verification
-            logging.info("creating drift report.....")
-            schema = dict()
-            columns_with_dtype = dict()
-            numerical_columns = list()
-            output = dict()
-            final_output = dict()
-
-            for data_type_name, data in data_dict.items():
-                schema = dict()
-                columns_with_dtype = dict()
-                numerical_columns = list()
-                for col in data.columns:
-                    columns_with_dtype[col] = str(data[col].dtype)
-                    if data[col].dtype!="O":
-                        numerical_columns.append(col)
-
-                schema["columns"] = columns_with_dtype
-                schema["numerical_columns"] = numerical_columns
-
-                if schema==schema_org:
-                    drift_status = False
-                else:
-                    drift_status = True
-                output[data_type_name] = drift_status   
-            final_output["result"] = output
-            logging.info("drift report successfully created")
-
-            logging.info("Out get_report")
-            return final_output
+            logging.info("In get_distribution_report")
+
+            psi_threshold = self.data_validation_config.DRIFT_PSI_THRESHOLD
+            js_threshold = self.data_validation_config.DRIFT_JS_THRESHOLD
+
+            report = {"thresholds": {"psi": psi_threshold, "js": js_threshold}}
+            if not columns or not reference.sum() or not current.sum():
+                logging.info("no columns with allowed values in schema or no valid records, distribution drift skipped")
+                return report
+
+            report["reference"] = {"columns": columns, "values": values, "counts": reference.tolist()}
+            report["Test Data"] = get_drift_report(columns, reference, current, psi_threshold, js_threshold)
+            drifted = [col for col, stats in report["Test Data"]["features"].items() if stats["drift"]]
+            logging.info(f"distribution drift of test data: {drifted or 'none'}")
+
+            logging.info("Out get_distribution_report")
+            return report
         except Exception as e:
             logging.exception(e)
             raise CustomException(e, sys)
-        
+
     def validate(self)->None:
-        """create required directories, saves validated data and report
+        """create required directories, validates ingested data row by row, saves
+        valid and quarantined records and the report
         """
         try:
             logging.info("In validate")
@@ -89,46 +141,42 @@ class DataValidationComponents:
             create_dirs(self.data_validation_config.DRIFT_REPORT_ROOT_DIR_PATH)
             logging.info("required dir's created")
 
-            # collecting ingested data
-            ingested_train_data = pd.read_csv(self.data_ingestion_config.TRAIN_FILE_PATH, index_col=False)
-            ingested_test_data = pd.read_csv(self.data_ingestion_config.TEST_FILE_PATH, index_col=False)
-            logging.info("ingested data collection completed")
-
             # get required variables
             schema_path = self.data_validation_config.SCHEMA_FILE_PATH
             report_path = self.data_validation_config.DRIFT_REPORT_FILE_PATH
-            output = self.get_report(ingested_train_data, ingested_test_data, schema_path)
-
-            # get valid and invalid file path for train and test data
-            valid_path_dict = {"Train Data":self.data_validation_config.VALID_TRAIN_FILE_PATH, 
-                               "Test Data":self.data_validation_config.VALID_TEST_FILE_PATH}
-            invalid_path_dict = {"Train Data":self.data_validation_config.INVALID_TRAIN_FILE_PATH, 
-                               "Test Data":self.data_validation_config.INVALID_TEST_FILE_PATH}
-            logging.info("collected drift report and path")
+            validator = get_schema_validator(schema_path)
+            logging.info(f"schema collected from {schema_path}")
+            allowed_values = validator.allowed_values
+            count_columns = list(allowed_values)
+            values = sorted({int(value) for col in count_columns for value in allowed_values[col]})
+
+            # ingested, valid and invalid file path for train and test data
+            path_dict = {
+                "Train Data": (self.data_ingestion_config.TRAIN_FILE_PATH, self.data_validation_config.VALID_TRAIN_FILE_PATH,
+                               self.data_validation_config.INVALID_TRAIN_FILE_PATH),
+                "Test Data": (self.data_ingestion_config.TEST_FILE_PATH, self.data_validation_config.VALID_TEST_FILE_PATH,
+                              self.data_validation_config.INVALID_TEST_FILE_PATH)
+            }
+
+            # validate records, a data set fails when too many of its records are quarantined
+            logging.info("validating data.....")
+            max_invalid_ratio = self.data_validation_config.MAX_INVALID_RATIO
+            output = {"result": dict(), "row_validation": dict()}
+            counts = dict()
+            for data_type_name, (data_path, valid_path, invalid_path) in path_dict.items():
+                stats, counts[data_type_name] = self.validate_file(data_path, valid_path, invalid_path, validator, count_columns, values)
+                status = stats["valid"] == 0 or stats["invalid"] > max_invalid_ratio * stats["rows"]
+                output["result"][data_type_name] = status
+                output["row_validation"][data_type_name] = stats
+                logging.info(f"drift status is {status}, {data_type_name} saved in {valid_path}")
+            output["distribution_drift"] = self.get_distribution_report(count_columns, values, counts["Train Data"], counts["Test Data"])
 
-            
             # save validation report
             save_yaml(output, report_path)
             logging.info(f"drift report saved at {report_path}")
-
-            # save validated data
-            logging.info("validating data.....")
-            for data_type_name, status in output["result"].items():
-                if not status:
-                    path = valid_path_dict[data_type_name]
-                else:
-                    path = invalid_path_dict[data_type_name]
-
-                if data_type_name=="Train Data":
-                    ingested_train_data.to_csv(path, index=False, header=True)
-                if data_type_name=="Test Data":
-                    ingested_test_data.to_csv(path, index=False, header=True)
-                logging.info(f"drift status is {status}, saving {data_type_name} in {path}")
             logging.info("validation of data successfully completed.")
 
             logging.info("Out validate")
         except Exception as e:
             logging.exception(e)
             raise CustomException(e, sys)
-        
-
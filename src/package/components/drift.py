@@ -0,0 +1,221 @@
+from package.entity import PredictionConfigEntity
+from package.exception import CustomException
+from package.logger import logging
+from package.utils import read_yaml
+from dataclasses import dataclass, field
+import numpy as np
+import threading
+import sys
+import os
+
+
+# rows per bincount pass, bounds the temporary code array
+CHUNK_SIZE = 262144
+
+# smoothing of empty bins so log ratios stay finite
+EPSILON = 1e-6
+
+
+def get_value_counts(data:np.ndarray, values:list)->np.ndarray:
+    """counts every value of every column in one vectorized pass
+
+    Each cell is mapped to the code column * (len(values) + 1) + position of
+    its value, so a single np.bincount gives the histogram of all columns.
+    Missing, non integral and unexpected values fall into the last bin.
+
+    Args:
+        data (np.ndarray): 2D array of features
+        values (list): sorted integer values to count
+
+    Returns:
+        np.ndarray: (columns, len(values) + 1) counts
+    """
+    try:
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data.reshape(1, -1)
+        values = np.asarray(values, dtype=np.int64)
+        low, high = int(values.min()), int(values.max())
+        n_columns, n_bins = data.shape[1], len(values) + 1
+
+        # value - low => position of the value, anything else => last bin
+        lookup = np.full(high - low + 1, len(values), dtype=np.intp)
+        lookup[values - low] = np.arange(len(values))
+        offsets = np.arange(n_columns, dtype=np.intp) * n_bins
+
+        counts = np.zeros(n_columns * n_bins, dtype=np.int64)
+        for start in range(0, len(data), CHUNK_SIZE):
+            chunk = data[start:start + CHUNK_SIZE]
+            if chunk.dtype.kind in "iu" and chunk.min() >= low and chunk.max() <= high:
+                # integer features inside the value range, no masking needed
+                codes = lookup[chunk.astype(np.intp) - low]
+            else:
+                valid = (chunk >= low) & (chunk <= high)
+                if chunk.dtype.kind == "f":
+                    valid &= chunk == np.floor(chunk)
+                codes = np.full(chunk.shape, len(values), dtype=np.intp)
+                codes[valid] = lookup[chunk[valid].astype(np.intp) - low]
+            codes += offsets
+            counts += np.bincount(codes.ravel(), minlength=len(counts))
+        return counts.reshape(n_columns, n_bins)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def compare_distributions(reference:np.ndarray, current:np.ndarray, psi_threshold:float, js_threshold:float)->dict:
+    """PSI, Jensen-Shannon divergence and chi-square test of every column at once
+
+    Args:
+        reference (np.ndarray): (columns, bins) counts of the reference data
+        current (np.ndarray): (columns, bins) counts of the compared data
+        psi_threshold (float): a column drifts from this PSI on
+        js_threshold (float): a column drifts from this Jensen-Shannon divergence (base 2) on
+
+    Returns:
+        dict: arrays of psi, js, chi2, p_value and drift per column
+    """
+    from scipy.stats import chi2
+
+    reference = np.asarray(reference, dtype=np.float64)
+    current = np.asarray(current, dtype=np.float64)
+
+    p = reference + EPSILON
+    p /= p.sum(axis=1, keepdims=True)
+    q = current + EPSILON
+    q /= q.sum(axis=1, keepdims=True)
+
+    psi = ((q - p) * np.log(q / p)).sum(axis=1)
+    m = (p + q) / 2
+    js = 0.5 * (p * np.log2(p / m)).sum(axis=1) + 0.5 * (q * np.log2(q / m)).sum(axis=1)
+
+    # chi-square test of homogeneity on the 2 x bins table, empty bins left out
+    observed = np.stack([reference, current], axis=1)
+    row_totals = observed.sum(axis=2, keepdims=True)
+    bin_totals = observed.sum(axis=1, keepdims=True)
+    expected = row_totals * bin_totals / np.maximum(row_totals.sum(axis=1, keepdims=True), 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        statistic = np.where(expected > 0, (observed - expected) ** 2 / expected, 0.0).sum(axis=(1, 2))
+    dof = np.maximum((bin_totals[:, 0, :] > 0).sum(axis=1) - 1, 1)
+    p_value = chi2.sf(statistic, dof)
+
+    return {
+        "psi": psi,
+        "js": js,
+        "chi2": statistic,
+        "p_value": p_value,
+        "drift": (psi >= psi_threshold) | (js >= js_threshold)
+    }
+
+
+def get_drift_report(columns:list, reference:np.ndarray, current:np.ndarray, psi_threshold:float, js_threshold:float)->dict:
+    """per column drift statistics in a yaml friendly form
+
+    Returns:
+        dict: dict(drift=any column drifted, rows=rows compared, features=dict(key=column, value=statistics))
+    """
+    stats = compare_distributions(reference, current, psi_threshold, js_threshold)
+    features = {
+        col: {
+            "psi": round(float(stats["psi"][index]), 6),
+            "js": round(float(stats["js"][index]), 6),
+            "chi2": round(float(stats["chi2"][index]), 3),
+            "p_value": float(stats["p_value"][index]),
+            "drift": bool(stats["drift"][index])
+        }
+        for index, col in enumerate(columns)
+    }
+    return {
+        "drift": bool(stats["drift"].any()),
+        "rows": int(np.asarray(current)[0].sum()) if len(columns) else 0,
+        "features": features
+    }
+
+
+@dataclass
+class DriftMonitor:
+    """accumulates value counts of prediction inputs and compares them with the
+    train distribution saved in the drift report by the validation stage
+    """
+    prediction_config: PredictionConfigEntity
+    _reference: dict = field(default=None, init=False, repr=False)
+    _reference_mtime: int = field(default=None, init=False, repr=False)
+    _counts: np.ndarray = field(default=None, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def load_reference(self)->dict:
+        """reads the reference distribution, None if no drift report exists yet or it has
+        no reference (distribution check skipped), read again when a training run rewrote it
+        """
+        path = self.prediction_config.DRIFT_REPORT_FILE_PATH
+        if not os.path.exists(path):
+            return None
+        mtime = os.stat(path).st_mtime_ns
+        if self._reference_mtime != mtime:
+            distribution = read_yaml(path).get("distribution_drift") or dict()
+            reference = None
+            if distribution.get("reference") is not None:
+                target = self.prediction_config.TARGET_COLUMN_NAME
+                columns = list(distribution.reference.columns)
+                features = [index for index, col in enumerate(columns) if col != target]
+                reference = {
+                    "columns": [columns[index] for index in features],
+                    "values": list(distribution.reference["values"]),
+                    "counts": np.asarray(distribution.reference.counts, dtype=np.int64)[features],
+                    "psi_threshold": distribution.thresholds.psi,
+                    "js_threshold": distribution.thresholds.js
+                }
+                logging.info(f"drift reference loaded from {path}")
+            else:
+                logging.warning(f"{path} has no drift reference, drift isn't monitored")
+            with self._lock:
+                # counts of the old reference may have other values or columns, a new window starts
+                self._reference = reference
+                self._reference_mtime = mtime
+                self._counts = None
+        return self._reference
+
+    def update(self, data:np.ndarray)->None:
+        """adds a batch of prediction inputs to the current distribution
+        """
+        try:
+            reference = self.load_reference()
+            if reference is None or np.ndim(data) != 2 or np.shape(data)[1] != len(reference["columns"]):
+                return
+            counts = get_value_counts(data, reference["values"])
+            with self._lock:
+                self._counts = counts if self._counts is None else self._counts + counts
+        except Exception as e:
+            # monitoring must never fail a prediction
+            logging.exception(e)
+
+    def report(self, reset:bool=False)->dict:
+        """drift of the prediction inputs seen so far against the train data
+
+        Args:
+            reset (bool, optional): start a new window after reporting. Defaults to False.
+        """
+        reference = self.load_reference()
+        if reference is None:
+            return {"drift": None, "rows": 0, "features": {}, "detail": "no drift reference, run the training pipeline"}
+        with self._lock:
+            counts = self._counts
+            if reset:
+                self._counts = None
+        if counts is None:
+            return {"drift": None, "rows": 0, "features": {}}
+        return get_drift_report(reference["columns"], reference["counts"], counts,
+                                reference["psi_threshold"], reference["js_threshold"])
+
+
+_monitors = dict()
+_monitors_lock = threading.Lock()
+
+
+def get_drift_monitor(prediction_config:PredictionConfigEntity)->DriftMonitor:
+    """process wide drift monitor for a prediction config
+    """
+    with _monitors_lock:
+        key = id(prediction_config)
+        if key not in _monitors:
+            _monitors[key] = DriftMonitor(prediction_config)
+        return _monitors[key]
@@ -0,0 +1,60 @@
+from package.exception import CustomException
+from dataclasses import dataclass
+import numpy as np
+import sys
+
+
+@dataclass
+class FusedInferenceModel:
+    """applies the learned SimpleImputer fill values and the estimator in a single step
+    """
+    estimator: any
+    fill_values: np.ndarray
+
+    @classmethod
+    def from_pipeline(cls, preprocessor, estimator):
+        """builds the fused model from the fitted preprocessor and estimator
+
+        Args:
+            preprocessor (Pipeline | SimpleImputer): fitted preprocessor with an "imputer" step
+            estimator (sklearn model): fitted estimator
+
+        Returns:
+            FusedInferenceModel
+        """
+        try:
+            from sklearn.pipeline import Pipeline
+            imputer = preprocessor.named_steps["imputer"] if isinstance(preprocessor, Pipeline) else preprocessor
+            fill_values = np.ascontiguousarray(imputer.statistics_, dtype=np.float32)
+            return cls(estimator=estimator, fill_values=fill_values)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def transform(self, data)->np.ndarray:
+        """converts data into a contiguous float32 buffer and fills missing values in place
+
+        Args:
+            data (array like): input features
+
+        Returns:
+            np.ndarray: imputed float32 buffer
+        """
+        buffer = np.asarray(data, dtype=np.float32, order="C")
+        if buffer.ndim == 1:
+            buffer = buffer.reshape(1, -1)
+
+        # NaN propagates through the sum, so a single reduction tells whether imputation is needed at all
+        if not np.isnan(buffer.sum()):
+            return buffer
+
+        # never write into the caller's array
+        if np.may_share_memory(buffer, data):
+            buffer = buffer.copy()
+        np.copyto(buffer, self.fill_values, where=np.isnan(buffer))
+        return buffer
+
+    def predict(self, data)->np.ndarray:
+        return self.estimator.predict(self.transform(data))
+
+    def predict_proba(self, data)->np.ndarray:
+        return self.estimator.predict_proba(self.transform(data))
@@ -0,0 +1,124 @@
+from package.logger import logging
+from concurrent.futures import Future
+from collections import deque
+from dataclasses import dataclass, field
+import numpy as np
+import threading
+import queue
+import time
+
+
+@dataclass
+class MicroBatcher:
+    """coalesces concurrent small prediction requests into one vectorized predict call
+
+    A batch is flushed when it holds max_batch_size rows or when its oldest
+    request has waited max_latency seconds, whichever comes first.
+    """
+    predict_fn: callable
+    max_batch_size: int
+    max_latency: float
+    requests: int = field(default=0, init=False)
+    batches: int = field(default=0, init=False)
+    _queue: queue.Queue = field(default_factory=queue.Queue, init=False, repr=False)
+    _batch_sizes: dict = field(default_factory=dict, init=False, repr=False)
+    _wait_times: deque = field(default_factory=lambda: deque(maxlen=4096), init=False, repr=False)
+    _thread: threading.Thread = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, data:np.ndarray)->Future:
+        """queues rows for prediction
+
+        Args:
+            data (np.ndarray): 2D array of features
+
+        Returns:
+            Future: resolves to the prediction for the submitted rows
+        """
+        future = Future()
+        self._queue.put((data, future, time.monotonic()))
+        return future
+
+    def _collect(self)->list:
+        first = self._queue.get()
+        batch = [first]
+        rows = len(first[0])
+        deadline = first[2] + self.max_latency
+        while rows < self.max_batch_size:
+            # past the deadline, still take whatever is already queued
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows += len(item[0])
+        return batch
+
+    def _run(self)->None:
+        while True:
+            try:
+                self._flush(self._collect())
+            except Exception as e:
+                # one bad batch must not stop the batcher, later requests would never resolve
+                logging.exception(e)
+
+    def _flush(self, batch:list)->None:
+        flushed_at = time.monotonic()
+        for _, _, enqueued_at in batch:
+            self._wait_times.append(flushed_at - enqueued_at)
+
+        # requests cancelled meanwhile (client gone) are dropped, the others can't be cancelled anymore
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        try:
+            data = np.concatenate([item[0] for item in batch])
+        except ValueError:
+            # requests with a different number of features can't share a batch
+            for item in batch:
+                self._predict([item], item[0])
+            return
+        self._predict(batch, data)
+
+    def _predict(self, batch:list, data:np.ndarray)->None:
+        self.requests += len(batch)
+        self.batches += 1
+        bucket = 1 << max(len(data) - 1, 0).bit_length()
+        self._batch_sizes[bucket] = self._batch_sizes.get(bucket, 0) + 1
+        try:
+            prediction = self.predict_fn(data)
+        except Exception as e:
+            logging.exception(e)
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        # fan the results back out
+        offsets = np.cumsum([len(item[0]) for item in batch])[:-1]
+        for (_, future, _), result in zip(batch, np.split(prediction, offsets)):
+            future.set_result(result)
+
+    def metrics(self)->dict:
+        """queue depth, batch size histogram and wait time statistics
+        """
+        wait_times = np.array(self._wait_times) * 1000
+        wait = dict(count=len(wait_times))
+        if len(wait_times):
+            wait.update(
+                mean_ms=round(float(wait_times.mean()), 3),
+                p50_ms=round(float(np.percentile(wait_times, 50)), 3),
+                p99_ms=round(float(np.percentile(wait_times, 99)), 3),
+                max_ms=round(float(wait_times.max()), 3)
+            )
+        return {
+            "queue_depth": self._queue.qsize(),
+            "requests": self.requests,
+            "batches": self.batches,
+            "batch_size_histogram": {f"<={bucket}": count for bucket, count in sorted(self._batch_sizes.items())},
+            "wait_time": wait
+        }
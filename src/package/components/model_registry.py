@@ -0,0 +1,209 @@
+from package.entity import DataTransformationConfigEntity, ModelTrainerConfigEntity, PredictionConfigEntity
+from package.exception import CustomException
+from package.logger import logging
+from package.utils import load_obj, load_json
+from package.components.inference import FusedInferenceModel
+from package.components.model_store import ModelStore
+from dataclasses import dataclass, field
+from datetime import datetime
+import threading
+import time
+import sys
+import os
+
+
+@dataclass(frozen=True)
+class ModelVersion:
+    model: FusedInferenceModel
+    model_name: str
+    version: str
+    loaded_at: str
+    load_time: float
+
+
+@dataclass
+class ModelRegistry:
+    """keeps the served model resident, resolved from the local model store
+
+    Nothing is checked per request: a new version is picked up by reload(),
+    or by the background poll started with start_polling() when
+    MODEL_REFRESH_INTERVAL is above 0.
+    """
+    data_transformation_config: DataTransformationConfigEntity
+    model_trainer_config: ModelTrainerConfigEntity
+    prediction_config: PredictionConfigEntity
+    _active: ModelVersion = field(default=None, init=False, repr=False)
+    _signature: tuple = field(default=None, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    _stop: threading.Event = field(default_factory=threading.Event, init=False, repr=False)
+    _poller: threading.Thread = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        self.store = ModelStore(self.prediction_config)
+
+    def artifact_paths(self)->list:
+        """training artifacts served by the model, published into the store
+        """
+        if os.path.exists(self.model_trainer_config.INFERENCE_FILE_PATH):
+            return [self.model_trainer_config.CONFIG_FILE_PATH, self.model_trainer_config.INFERENCE_FILE_PATH]
+        # artifacts trained before the fused model existed
+        return [
+            self.model_trainer_config.CONFIG_FILE_PATH,
+            self.model_trainer_config.ESTIMATOR_FILE_PATH,
+            self.data_transformation_config.PREPROCESSOR_PATH,
+        ]
+
+    def get_signature(self)->tuple:
+        """cheap change detector built from (path, mtime, size) of every artifact,
+        None while the artifacts are missing, like during a training run
+        """
+        signature = list()
+        for path in self.artifact_paths():
+            if not os.path.exists(path):
+                return None
+            stat = os.stat(path)
+            signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def load_version(self, version:str, entry:dict)->FusedInferenceModel:
+        """model of a stored version, its arrays memory mapped with MODEL_MMAP_MODE
+        """
+        import sklearn
+        versions = load_json(self.store.get_path(version, os.path.basename(self.model_trainer_config.CONFIG_FILE_PATH))).get("versions", dict())
+        if versions.get("sklearn", sklearn.__version__) != sklearn.__version__:
+            logging.warning(f"model version {version} was saved with scikit-learn {versions['sklearn']}, "
+                            f"loading it with {sklearn.__version__}")
+
+        mmap_mode = self.prediction_config.MODEL_MMAP_MODE
+        inference_name = os.path.basename(self.model_trainer_config.INFERENCE_FILE_PATH)
+        if inference_name in entry["files"]:
+            return load_obj(self.store.get_path(version, inference_name), mmap_mode)
+        estimator = load_obj(self.store.get_path(version, os.path.basename(self.model_trainer_config.ESTIMATOR_FILE_PATH)), mmap_mode)
+        preprocessor = load_obj(self.store.get_path(version, os.path.basename(self.data_transformation_config.PREPROCESSOR_PATH)))
+        return FusedInferenceModel.from_pipeline(preprocessor, estimator)
+
+    def load(self)->ModelVersion:
+        """publishes new training artifacts into the store, then loads the current
+        intact version of the store and swaps it in as the active version
+
+        Returns:
+            ModelVersion: active version
+        """
+        try:
+            logging.info("In load")
+            start = time.perf_counter()
+
+            signature = self.get_signature()
+            if signature is not None and signature != self._signature:
+                model_config = load_json(self.model_trainer_config.CONFIG_FILE_PATH)
+                # published only if every file matches the sha256 of config.json, which is written last
+                self.store.publish(self.artifact_paths(), model_config["model"], model_config.get("artifacts"))
+
+            version, entry = self.store.resolve()
+            if version is None:
+                # wrapped once by the handler below
+                raise FileNotFoundError("no trained model in the model store, run the training pipeline")
+
+            if self._active is not None and self._active.version == version:
+                self._signature = signature
+                logging.info(f"model version {version} already active")
+                logging.info("Out load")
+                return self._active
+
+            active = ModelVersion(
+                model=self.load_version(version, entry),
+                model_name=entry["model_name"],
+                version=version,
+                loaded_at=datetime.now().isoformat(timespec="seconds"),
+                load_time=round(time.perf_counter() - start, 4)
+            )
+
+            # single reference assignment, requests holding the old version keep using it
+            self._active = active
+            self._signature = signature
+            logging.info(f"model {active.model_name} version {version} loaded in {active.load_time}s")
+
+            logging.info("Out load")
+            return active
+        except Exception as e:
+            logging.exception(e)
+            raise CustomException(e, sys)
+
+    def reload(self)->ModelVersion:
+        """explicit reload, the active version keeps serving if it fails
+        """
+        with self._lock:
+            # artifacts are published again even if unchanged, which repairs a damaged stored copy
+            self._signature = None
+            return self.load()
+
+    def refresh_if_changed(self)->bool:
+        """reloads if the training artifacts changed on disk since the last load
+
+        Returns:
+            bool: True if a new version was activated
+        """
+        # only one thread reloads, the others keep serving the active version
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            signature = self.get_signature()
+            if signature is None or signature == self._signature:
+                return False
+            previous = self._active
+            return self.load() is not previous
+        except Exception as e:
+            # keep serving the active version if the new artifacts are unreadable
+            logging.exception(e)
+            return False
+        finally:
+            self._lock.release()
+
+    def start_polling(self)->None:
+        """checks for new artifacts every MODEL_REFRESH_INTERVAL seconds in a daemon thread,
+        nothing is started when the interval is 0
+        """
+        interval = self.prediction_config.MODEL_REFRESH_INTERVAL
+        if interval <= 0 or (self._poller is not None and self._poller.is_alive()):
+            return
+        self._stop.clear()
+
+        def poll():
+            while not self._stop.wait(interval):
+                self.refresh_if_changed()
+
+        self._poller = threading.Thread(target=poll, name="model-poller", daemon=True)
+        self._poller.start()
+        logging.info(f"polling for new model artifacts every {interval}s")
+
+    def stop_polling(self)->None:
+        self._stop.set()
+        if self._poller is not None:
+            self._poller.join()
+            self._poller = None
+
+    def get(self)->ModelVersion:
+        """returns the active version, loading it on first use
+        """
+        active = self._active
+        if active is None:
+            with self._lock:
+                if self._active is None:
+                    self.load()
+                active = self._active
+        return active
+
+    def health(self)->dict:
+        """status of the registry for health checks
+        """
+        active = self._active
+        if active is None:
+            return {"status": "unavailable", "model": None, "version": None}
+        return {
+            "status": "ok",
+            "model": active.model_name,
+            "version": active.version,
+            "loaded_at": active.loaded_at,
+            "load_time": active.load_time,
+            "polling": self._poller is not None
+        }
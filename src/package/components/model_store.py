@@ -0,0 +1,153 @@
+from package.entity import PredictionConfigEntity
+from package.exception import CustomException
+from package.logger import logging
+from package.utils import create_dirs, save_json, load_json, get_file_digest
+from dataclasses import dataclass
+from datetime import datetime
+import hashlib
+import shutil
+import sys
+import os
+
+
+@dataclass
+class ModelStore:
+    """local, versioned copies of the served artifacts
+
+    Every version is a directory named by the content hash of its files and is
+    listed in the manifest with the sha256 and size of each file. Serving needs
+    neither the network nor the training artifacts (dvc wipes those during a run),
+    and a corrupted copy is detected before it gets loaded.
+
+    manifest: {"current": version, "versions": {version: {"model_name", "created_at", "files": {name: {"sha256", "size"}}}}}
+    """
+    prediction_config: PredictionConfigEntity
+
+    def read_manifest(self)->dict:
+        path = self.prediction_config.MODEL_STORE_MANIFEST_FILE_PATH
+        if not os.path.exists(path):
+            return {"current": None, "versions": dict()}
+        return load_json(path)
+
+    def write_manifest(self, manifest:dict)->None:
+        # replaced in one step, a reader never sees half a manifest
+        path = self.prediction_config.MODEL_STORE_MANIFEST_FILE_PATH
+        save_json(manifest, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+    def get_path(self, version:str, name:str)->str:
+        """path of a stored file of a version
+        """
+        return os.path.join(self.prediction_config.MODEL_STORE_ROOT_DIR_PATH, version, name)
+
+    def verify(self, version:str, entry:dict)->bool:
+        """True if every file of the version is present with the size and sha256 of the manifest
+        """
+        for name, expected in entry["files"].items():
+            path = self.get_path(version, name)
+            if not os.path.exists(path) or os.path.getsize(path) != expected["size"]:
+                return False
+            if get_file_digest(path) != expected["sha256"]:
+                return False
+        return True
+
+    def publish(self, paths:list, model_name:str, expected:dict=None)->str:
+        """copies artifacts into the store as a version and makes it the current one,
+        the copy is skipped when the version is already stored intact
+
+        Args:
+            paths (list): artifact files, stored under their file names
+            model_name (str): name of the trained model
+            expected (dict, optional): {file name: {"sha256"}} the artifacts were saved with, nothing
+                is published unless the files on disk match it. Defaults to None, not checked.
+
+        Returns:
+            str: version, the first 12 hex digits of the hash over the file hashes,
+                None if the files don't match expected
+        """
+        try:
+            logging.info("In publish")
+            files = dict()
+            digest = hashlib.sha256()
+            for path in paths:
+                files[os.path.basename(path)] = {"sha256": get_file_digest(path), "size": os.path.getsize(path)}
+                digest.update(files[os.path.basename(path)]["sha256"].encode())
+            version = digest.hexdigest()[:12]
+
+            # a training run rewriting the artifacts leaves a mix of old and new files
+            if expected is not None:
+                mismatched = [name for name in files if name in expected and expected[name]["sha256"] != files[name]["sha256"]]
+                if mismatched:
+                    logging.warning(f"{mismatched} don't match the hashes they were saved with, "
+                                    f"artifacts are still being written, nothing published")
+                    logging.info("Out publish")
+                    return None
+
+            manifest = self.read_manifest()
+            entry = manifest["versions"].get(version)
+            if entry is None or not self.verify(version, entry):
+                version_dir = os.path.join(self.prediction_config.MODEL_STORE_ROOT_DIR_PATH, version)
+                temp_dir = f"{version_dir}.tmp"
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                create_dirs(temp_dir)
+                for path in paths:
+                    shutil.copy2(path, os.path.join(temp_dir, os.path.basename(path)))
+
+                # the copies must match the hashes taken above, or training rewrote the artifacts meanwhile
+                for name, expected in files.items():
+                    if get_file_digest(os.path.join(temp_dir, name)) != expected["sha256"]:
+                        shutil.rmtree(temp_dir, ignore_errors=True)
+                        raise CustomException(f"{name} changed while it was copied into the model store", sys)
+
+                shutil.rmtree(version_dir, ignore_errors=True)
+                os.replace(temp_dir, version_dir)
+                manifest["versions"][version] = {
+                    "model_name": model_name,
+                    "created_at": datetime.now().isoformat(timespec="seconds"),
+                    "files": files
+                }
+                logging.info(f"model {model_name} version {version} stored at {version_dir}")
+
+            manifest["current"] = version
+            self.prune(manifest)
+            self.write_manifest(manifest)
+
+            logging.info("Out publish")
+            return version
+        except Exception as e:
+            logging.exception(e)
+            raise CustomException(e, sys)
+
+    def get_versions(self, manifest:dict)->list:
+        """stored versions, newest first (versions of the same second in reverse order of publishing)
+        """
+        versions = list(reversed(list(manifest["versions"])))
+        return sorted(versions, key=lambda version: manifest["versions"][version]["created_at"], reverse=True)
+
+    def prune(self, manifest:dict)->None:
+        """keeps the current and the newest MODEL_STORE_KEEP_VERSIONS versions
+        """
+        keep = max(self.prediction_config.MODEL_STORE_KEEP_VERSIONS, 1)
+        for version in self.get_versions(manifest)[keep:]:
+            if version != manifest["current"]:
+                shutil.rmtree(os.path.join(self.prediction_config.MODEL_STORE_ROOT_DIR_PATH, version), ignore_errors=True)
+                del manifest["versions"][version]
+                logging.info(f"model version {version} removed from the store")
+
+    def resolve(self)->tuple:
+        """current version if it is intact, else the newest intact one
+
+        Returns:
+            tuple: (version, manifest entry), (None, None) if no intact version is stored
+        """
+        manifest = self.read_manifest()
+        versions = self.get_versions(manifest)
+        if manifest["current"] in versions:
+            versions.remove(manifest["current"])
+            versions.insert(0, manifest["current"])
+        for version in versions:
+            entry = manifest["versions"][version]
+            if self.verify(version, entry):
+                return version, entry
+            logging.error(f"model version {version} failed the integrity check, skipped")
+        return None, None
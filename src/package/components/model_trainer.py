@@ -1,13 +1,19 @@
 from package.entity import DataTransformationConfigEntity
 from package.exception import CustomException
 from package.logger import logging
-from package.utils import (load_json, save_json, create_dirs, save_obj, evaluate_models, get_performance_report)
+from package.utils import (load_json, save_json, create_dirs, save_obj, load_obj, evaluate_models, get_performance_report,
+                           get_artifact_entry)
+from package.components.inference import FusedInferenceModel
+from package.utils.model_search import CVCache
 from package.entity import ModelTrainerConfigEntity
 from dataclasses import dataclass
-import mlflow, dagshub, bentoml
 from urllib.parse import urlparse
+import math
+import time
 import sys
+import os
 import numpy as np
+from sklearn.metrics import accuracy_score
 from sklearn.linear_model import LogisticRegression
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.ensemble import (
@@ -22,6 +28,16 @@ class ModelTrainerComponents:
     data_transformation_config: DataTransformationConfigEntity
     model_trainer_config: ModelTrainerConfigEntity
 
+    def load_data(self)->tuple[np.ndarray]:
+        """opens the transformed data without reading it into memory
+
+        Returns:
+            tuple[np.ndarray]: (X_train, y_train, X_test, y_test) read only memory maps
+        """
+        config = self.data_transformation_config
+        return tuple(np.load(path, mmap_mode="r") for path in (config.X_TRAIN_FILE_PATH, config.Y_TRAIN_FILE_PATH,
+                                                                config.X_TEST_FILE_PATH, config.Y_TEST_FILE_PATH))
+
     # @retry(stop_max_attempt_number=2, wait_fixed=10000) 
     def initiate_training(self):
         try:
@@ -46,98 +62,240 @@ class ModelTrainerComponents:
             params = load_json(self.model_trainer_config.PARAMS_FILE_PATH)
             logging.info("params collected")
 
-            # transformed data collection
-            train_data = np.load(self.data_transformation_config.TRAIN_FILE_PATH)
-            test_data = np.load(self.data_transformation_config.TEST_FILE_PATH)
+            timing = dict()
+            start = time.perf_counter()
+
+            # transformed data collection, memory mapped
+            X_train, y_train, X_test, y_test = self.load_data()
             logging.info("transformed data collected")
 
-            # extract input and output features
-            # train data
-            X_train = train_data[:, :-1]
-            y_train = train_data[:, -1]
+            timing["load_data"] = time.perf_counter() - start
+            start = time.perf_counter()
 
-            # test data
-            X_test = test_data[:, :-1]
-            y_test = test_data[:, -1]
+            # fold scores of earlier runs on the same train data
+            cv_cache = CVCache(self.model_trainer_config.CV_CACHE_FILE_PATH)
+            cv_cache.load(X_train, y_train)
+            logging.info(f"cross validation cache loaded with {len(cv_cache.results)} results")
 
-            # get evaluation report
-            model_performance_report = evaluate_models(X_train, y_train, X_test, y_test, models, params)
+            # get evaluation report, models are replaced by their fitted best estimator
+            test_predictions = dict()
+            model_performance_report = evaluate_models(X_train, y_train, X_test, y_test, models, params,
+                                                       cv=self.model_trainer_config.CV_FOLDS, n_jobs=self.model_trainer_config.N_JOBS,
+                                                       predictions=test_predictions, cache=cv_cache)
+            timing["evaluate_models"] = time.perf_counter() - start
             logging.info("evaluation report collected")
 
-            # save evaluation report
-            evaluation_report_path = self.model_trainer_config.EVALUATION_FILE_PATH
-            save_json(model_performance_report, evaluation_report_path)
-            logging.info(f"saved evaluation report at {evaluation_report_path}")
+            # save cross validation cache
+            create_dirs(self.model_trainer_config.CV_CACHE_ROOT_DIR_PATH)
+            cv_cache.save()
+            logging.info(f"cross validation cache {cv_cache.stats()} saved at {cv_cache.path}")
 
             # get best model name 
-            best_model_name, _ = max(sorted([(model_name, model_performance_report[model_name]["score"]) for model_name in model_performance_report.keys()]))
+            best_model_name = max(model_performance_report, key=lambda model_name: model_performance_report[model_name]["score"])
 
             # get best params for best model 
             best_params = model_performance_report[best_model_name]["params"]
 
-            # login in dagshub
-            # cmd: dagshub login --token <token from account>
-            # connecting with dagshub repository
-            dagshub.init(repo_owner='hasan-raza-01', repo_name='Network-Security', mlflow=True)
+            # best performed model, already fitted with best params on train data
+            self.save_model(models[best_model_name], best_model_name, best_params, X_train, y_train, X_test, y_test,
+                            test_y_pred=test_predictions[best_model_name], training={"mode": "full"}, timing=timing)
+
+            # save evaluation report with the time spent per phase
+            timing = {phase: round(seconds, 3) for phase, seconds in timing.items()}
+            evaluation_report_path = self.model_trainer_config.EVALUATION_FILE_PATH
+            save_json({"models": model_performance_report, "timing": timing, "cv_cache": cv_cache.stats()}, evaluation_report_path)
+            logging.info(f"saved evaluation report at {evaluation_report_path}, timing: {timing}")
+
+            logging.info("Out initiate_training")
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def save_model(self, model, model_name:str, params:dict, X_train:np.ndarray, y_train:np.ndarray, X_test:np.ndarray,
+                   y_test:np.ndarray, test_y_pred:np.ndarray=None, training:dict=None, timing:dict=None)->dict:
+        """saves a trained model with its fused inference model and config, and logs it to mlflow
+
+        Args:
+            model (sklearn model): fitted estimator
+            model_name (str): name of the model
+            params (dict): params of the model
+            X_train, y_train, X_test, y_test (np.ndarray): data the model was trained and is scored on
+            test_y_pred (np.ndarray, optional): prediction of X_test if already known
+            training (dict, optional): how the model was trained, saved in the model config
+            timing (dict, optional): filled with the seconds spent per phase
+
+        Returns:
+            dict: model scores
+        """
+        timing = timing if timing is not None else dict()
+
+        # tracking clients are only needed here, importing them costs seconds
+        import mlflow, dagshub
 
-            # mlflow tracking
-            with mlflow.start_run():
-                # get best performed model from scratch
-                model = models[best_model_name]
+        # login in dagshub
+        # cmd: dagshub login --token <token from account>
+        # connecting with dagshub repository
+        dagshub.init(repo_owner='hasan-raza-01', repo_name='Network-Security', mlflow=True)
 
-                # set best params for model
-                model.set_params(**best_params)
+        # mlflow tracking
+        with mlflow.start_run():
+            start = time.perf_counter()
 
-                # train model
-                model.fit(X_train, y_train)
+            # save model, artifacts holds the format and sha256 of every saved file
+            compress = self.model_trainer_config.COMPRESS
+            model_file_path = self.model_trainer_config.ESTIMATOR_FILE_PATH
+            artifacts = {os.path.basename(model_file_path): save_obj(model, model_file_path, compress)}
+            logging.info(f"model {model_name} saved at {model_file_path}")
 
-                # save model
-                model_file_path = self.model_trainer_config.ESTIMATOR_FILE_PATH
-                save_obj(model, model_file_path)
-                logging.info(f"model {best_model_name} saved at {model_file_path}")
+            # save preprocessor and model fused into a single inference step
+            preprocessor_path = self.data_transformation_config.PREPROCESSOR_PATH
+            preprocessor = load_obj(preprocessor_path)
+            artifacts[os.path.basename(preprocessor_path)] = get_artifact_entry(preprocessor_path, self.data_transformation_config.COMPRESS)
+            inference_model = FusedInferenceModel.from_pipeline(preprocessor, model)
+            inference_file_path = self.model_trainer_config.INFERENCE_FILE_PATH
+            artifacts[os.path.basename(inference_file_path)] = save_obj(inference_model, inference_file_path, compress)
+            logging.info(f"fused inference model saved at {inference_file_path}")
+            timing["save_model"] = time.perf_counter() - start
+            start = time.perf_counter()
 
-                # model prediction
-                train_y_pred = model.predict(X_train)
+            # model prediction
+            train_y_pred = model.predict(X_train)
+            if test_y_pred is None:
                 test_y_pred = model.predict(X_test)
 
-                # get evaluation score
-                model_scores = get_performance_report(y_train, y_test, train_y_pred, test_y_pred)
-                logging.info(f"model scores: {model_scores}")
+            # get evaluation score
+            model_scores = get_performance_report(y_train, y_test, train_y_pred, test_y_pred)
+            logging.info(f"model scores: {model_scores}")
+            timing["score"] = time.perf_counter() - start
+            start = time.perf_counter()
 
-                # create and save model config report
-                model_config = {"model":best_model_name, "scores":model_scores, "params":best_params}
-                config_file_path = self.model_trainer_config.CONFIG_FILE_PATH
-                save_json(model_config, config_file_path)
-                logging.info(f"model {best_model_name} configurations saved at {config_file_path}")
+            # create and save model config report, train_rows is where the next incremental training starts
+            # library versions the artifacts were saved with, unpickling them elsewhere isn't safe
+            import sklearn, joblib, platform
+            model_config = {"model":model_name, "scores":model_scores, "params":params,
+                            "train_rows":len(X_train), "training":training, "artifacts":artifacts,
+                            "versions":{"python": platform.python_version(), "numpy": np.__version__,
+                                        "sklearn": sklearn.__version__, "joblib": joblib.__version__}}
+            config_file_path = self.model_trainer_config.CONFIG_FILE_PATH
+            save_json(model_config, config_file_path)
+            logging.info(f"model {model_name} configurations saved at {config_file_path}")
 
-                # log parameters
-                mlflow.log_params(best_params)
+            # log parameters
+            mlflow.log_params(params)
 
-                # log metrics
-                mlflow.log_metrics(model_scores["test"])
+            # log metrics
+            mlflow.log_metrics(model_scores["test"])
 
+        
+            # model signature for model registration
+            infer_signature = mlflow.models.infer_signature(X_train, train_y_pred)
+            
+            uri = "https://dagshub.com/hasan-raza-01/Network-Security.mlflow"
+            mlflow.set_tracking_uri(uri)
             
-                # model signature for model registration
-                infer_signature = mlflow.models.infer_signature(X_train, model.predict(X_train))
-                
-                uri = "https://dagshub.com/hasan-raza-01/Network-Security.mlflow"
-                mlflow.set_tracking_uri(uri)
-                
-                tracking_url_type_store = urlparse(mlflow.get_tracking_uri()).scheme
-
-                if tracking_url_type_store != "file":
-                    mlflow.sklearn.log_model(model, best_model_name,
-                                            registered_model_name=best_model_name, 
-                                            signature=infer_signature
-                                    )
-                else:
-                    mlflow.sklearn.log_model(model, best_model_name,
-                                            signature=infer_signature
-                                    )
-            logging.info("mlflow tracking and logging successful")
+            tracking_url_type_store = urlparse(mlflow.get_tracking_uri()).scheme
 
-            logging.info("Out initiate_training")
+            if tracking_url_type_store != "file":
+                mlflow.sklearn.log_model(model, model_name,
+                                        registered_model_name=model_name, 
+                                        signature=infer_signature
+                                )
+            else:
+                mlflow.sklearn.log_model(model, model_name,
+                                        signature=infer_signature
+                                )
+            timing["mlflow"] = time.perf_counter() - start
+        logging.info("mlflow tracking and logging successful")
+        return model_scores
+
+    @staticmethod
+    def update_model(model, X_train:np.ndarray, y_train:np.ndarray, previous_rows:int):
+        """adds the train records after previous_rows to a fitted model
+
+        Tree ensembles grow by warm_start in proportion to the new records, every
+        added tree or boosting stage is fitted on all records. LogisticRegression
+        restarts its solver from the current coefficients.
+
+        Args:
+            model (sklearn model): fitted estimator, updated in place
+            X_train (np.ndarray): input features of all train data
+            y_train (np.ndarray): output features of all train data
+            previous_rows (int): number of train records the model was fitted on
+
+        Returns:
+            sklearn model: updated model, None if the model can't be updated incrementally
+        """
+        if isinstance(model, (RandomForestClassifier, GradientBoostingClassifier)):
+            n_estimators = model.n_estimators
+            added = max(1, math.ceil(n_estimators * (len(X_train) - previous_rows) / len(X_train)))
+            model.set_params(warm_start=True, n_estimators=n_estimators + added)
+            model.fit(X_train, y_train)
+            model.set_params(warm_start=False)
+            return model
+        if isinstance(model, LogisticRegression):
+            model.set_params(warm_start=True)
+            model.fit(X_train, y_train)
+            model.set_params(warm_start=False)
+            return model
+        return None
+
+    def incremental_training(self)->None:
+        """updates the current model with the train records added since it was trained
+
+        Falls back to initiate_training when there is no model yet, the model
+        can't be updated incrementally or the updated model loses more than
+        INCREMENTAL_TOLERANCE test accuracy against the current one.
+        """
+        try:
+            logging.info("In incremental_training")
+
+            config_file_path = self.model_trainer_config.CONFIG_FILE_PATH
+            model_file_path = self.model_trainer_config.ESTIMATOR_FILE_PATH
+            if not (os.path.exists(config_file_path) and os.path.exists(model_file_path)):
+                logging.info("no trained model yet, running full training")
+                return self.initiate_training()
+            model_config = load_json(config_file_path)
+
+            # transformed data collection, memory mapped
+            X_train, y_train, X_test, y_test = self.load_data()
+            logging.info("transformed data collected")
+
+            # new records are appended to the train data, see DataIngestionComponents.get_splits
+            previous_rows = model_config.get("train_rows")
+            if previous_rows is None or previous_rows > len(X_train):
+                logging.info(f"train data doesn't extend the {previous_rows} records of the current model, running full training")
+                return self.initiate_training()
+            new_rows = len(X_train) - previous_rows
+            if new_rows == 0:
+                logging.info("no new train records, model is up to date")
+                logging.info("Out incremental_training")
+                return
+
+            model = load_obj(model_file_path)
+            current_score = accuracy_score(y_test, model.predict(X_test))
+
+            start = time.perf_counter()
+            model = self.update_model(model, X_train, y_train, previous_rows)
+            if model is None:
+                logging.info(f"{model_config['model']} can't be updated incrementally, running full training")
+                return self.initiate_training()
+            update_time = time.perf_counter() - start
+            logging.info(f"{model_config['model']} updated with {new_rows} new records in {update_time:.2f}s")
+
+            # guardrail against updates that make the model worse
+            test_y_pred = model.predict(X_test)
+            score = accuracy_score(y_test, test_y_pred)
+            if score < current_score - self.model_trainer_config.INCREMENTAL_TOLERANCE:
+                logging.info(f"test accuracy dropped from {current_score:.4f} to {score:.4f}, running full training")
+                return self.initiate_training()
+
+            training = {"mode": "incremental", "previous_rows": previous_rows, "new_rows": new_rows,
+                        "update_time": round(update_time, 3)}
+            params = dict(model_config["params"])
+            if hasattr(model, "n_estimators"):
+                params["n_estimators"] = model.n_estimators
+            self.save_model(model, model_config["model"], params, X_train, y_train, X_test, y_test,
+                            test_y_pred=test_y_pred, training=training)
+
+            logging.info("Out incremental_training")
         except Exception as e:
             raise CustomException(e, sys)
-        
-
@@ -1,10 +1,11 @@
 from dataclasses import dataclass
 from package.exception import CustomException
-from package.utils import create_dirs, save_json
 from package.entity import PredictionConfigEntity
+from package.components.prediction_sink import get_prediction_sink
+from package.components.drift import get_drift_monitor
 from package.logger import logging
-from datetime import datetime
-import sys, os
+import numpy as np
+import sys
 
 
 @dataclass
@@ -16,17 +17,14 @@ class PredictionComponents:
 
         Args:
             model (sklearn model): model object for prediction
-            preprocessor (): transformation object for data transformation
+            preprocessor (): transformation object for data transformation, None if model is a FusedInferenceModel
             data (dataframe): data for prediction
 
         Returns:
-            list: _description_
+            list: model prediction for every row of data
         """
         try:
             logging.info("In predict")
-            # create required dir's
-            create_dirs(self.prediction_config.PREDICTION_ROOT_DIR_PATH)
-            logging.info("created required dir's")
 
             # get model and preprocessor
             self.model = model
@@ -34,26 +32,50 @@ class PredictionComponents:
             logging.info("Model and preprocessor loaded")
 
             # transform data and predict
-            data = self.preprocessor.transform(data)
-            prediction = self.model.predict(data).tolist()
+            if self.preprocessor is not None:
+                data = self.preprocessor.transform(data)
+            data = np.asarray(data)
+            prediction = self.model.predict(data)
             logging.info("Data transformed and predicted")
 
-            # create path for output file
-            timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-            OUTPUT_FILE_DIR,  OUTPUT_FILE_NAME= os.path.split(self.prediction_config.OUTPUT_FILE_PATH)
-            prediction_file_path = os.path.join(OUTPUT_FILE_DIR, f"{timestamp}_{OUTPUT_FILE_NAME}")
+            # hand the batch to the background writer, never blocks on disk
+            sink = get_prediction_sink(self.prediction_config)
+            sink.record(data, prediction)
+            get_drift_monitor(self.prediction_config).update(data)
 
-            # create content for ouptput file
-            model_prediction_file_content = {"input":data.tolist(), "pred":prediction}
+            logging.info("Out predict")            
+            return prediction.tolist()
+        except Exception as e:
+            logging.exception(e)
+            raise CustomException(e, sys)
 
-            # save prediction
-            save_json(model_prediction_file_content, prediction_file_path)
-            logging.info(f"Prediction saved at {prediction_file_path}")
+    def predict_array(self, model, data:np.ndarray, proba:bool=False)->tuple[np.ndarray]:
+        """makes model's prediction as arrays, without any list conversion
 
-            logging.info("Out predict")            
-            return prediction
+        Args:
+            model (FusedInferenceModel): fused model for prediction
+            data (np.ndarray): data for prediction
+            proba (bool, optional): also return class probabilities. Defaults to False.
+
+        Returns:
+            tuple[np.ndarray]: (int8 prediction, float32 probabilities or None)
+        """
+        try:
+            if proba:
+                probabilities = model.predict_proba(data).astype(np.float32, copy=False)
+                prediction = model.estimator.classes_.take(probabilities.argmax(axis=1))
+            else:
+                probabilities = None
+                prediction = model.predict(data)
+            prediction = prediction.astype(np.int8, copy=False)
+
+            # hand the batch to the background writer, never blocks on disk
+            sink = get_prediction_sink(self.prediction_config)
+            sink.record(data, prediction)
+            get_drift_monitor(self.prediction_config).update(data)
+
+            return prediction, probabilities
         except Exception as e:
             logging.exception(e)
             raise CustomException(e, sys)
-            
 
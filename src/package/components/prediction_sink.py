@@ -0,0 +1,153 @@
+from package.entity import PredictionConfigEntity
+from package.exception import CustomException
+from package.logger import logging
+from package.utils import create_dirs
+from dataclasses import dataclass, field
+from datetime import datetime
+from glob import glob
+import numpy as np
+import threading
+import random
+import atexit
+import queue
+import sys
+import os
+
+
+SINK_MODES = ("off", "sampled", "log")
+
+
+@dataclass
+class PredictionSink:
+    """records predictions from a background writer thread so requests never wait on disk
+
+    Every recorded batch is appended to the active log file as two consecutive
+    .npy arrays (float32 inputs, int8 predictions). Files rotate at
+    SINK_MAX_FILE_SIZE and only the newest SINK_MAX_FILES are kept.
+    """
+    prediction_config: PredictionConfigEntity
+    recorded: int = field(default=0, init=False)
+    dropped: int = field(default=0, init=False)
+    _queue: queue.Queue = field(default=None, init=False, repr=False)
+    _thread: threading.Thread = field(default=None, init=False, repr=False)
+    _file: any = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        mode = self.prediction_config.SINK_MODE
+        if mode not in SINK_MODES:
+            raise CustomException(f"improper value {mode} provided for prediction sink mode, expected one of {SINK_MODES}", sys)
+        if mode == "off":
+            return
+
+        self._queue = queue.Queue(maxsize=self.prediction_config.SINK_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name="prediction-sink", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, data:np.ndarray, prediction:np.ndarray)->bool:
+        """queues a batch for writing without blocking
+
+        Args:
+            data (np.ndarray): input features
+            prediction (np.ndarray): model prediction
+
+        Returns:
+            bool: True if the batch was queued
+        """
+        mode = self.prediction_config.SINK_MODE
+        if mode == "off":
+            return False
+        if mode == "sampled" and random.random() >= self.prediction_config.SINK_SAMPLE_RATE:
+            return False
+        try:
+            self._queue.put_nowait((data, prediction))
+            return True
+        except queue.Full:
+            # disk is behind, shed load instead of stalling the request
+            self.dropped += 1
+            return False
+
+    def _run(self)->None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+                self.recorded += 1
+            except Exception as e:
+                logging.exception(e)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, data:np.ndarray, prediction:np.ndarray)->None:
+        if self._file is None or self._file.tell() >= self.prediction_config.SINK_MAX_FILE_SIZE:
+            self._rotate()
+        np.save(self._file, np.asarray(data, dtype=np.float32))
+        np.save(self._file, np.asarray(prediction, dtype=np.int8))
+        self._file.flush()
+
+    def _rotate(self)->None:
+        if self._file is not None:
+            self._file.close()
+
+        output_dir, output_file_name = os.path.split(self.prediction_config.OUTPUT_FILE_PATH)
+        create_dirs(output_dir)
+        timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S_%f")
+        path = os.path.join(output_dir, f"{timestamp}_{output_file_name}")
+        self._file = open(path, "ab")
+        logging.info(f"prediction log rotated to {path}")
+
+        # drop the oldest logs
+        files = sorted(glob(os.path.join(output_dir, f"*_{output_file_name}")))
+        for old_file in files[:-self.prediction_config.SINK_MAX_FILES]:
+            os.remove(old_file)
+
+    def close(self, timeout:float=5.0)->None:
+        """flushes queued batches and stops the writer thread
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def stats(self)->dict:
+        return {
+            "mode": self.prediction_config.SINK_MODE,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize() if self._queue is not None else 0
+        }
+
+
+def read_prediction_log(path:str):
+    """yields (input, prediction) batches from a prediction log file
+
+    Args:
+        path (str): path of the log file
+    """
+    try:
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            while file.tell() < size:
+                yield np.load(file), np.load(file)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+_sinks = dict()
+_sinks_lock = threading.Lock()
+
+
+def get_prediction_sink(prediction_config:PredictionConfigEntity)->PredictionSink:
+    """process wide sink for a prediction config
+    """
+    with _sinks_lock:
+        key = id(prediction_config)
+        if key not in _sinks:
+            _sinks[key] = PredictionSink(prediction_config)
+        return _sinks[key]
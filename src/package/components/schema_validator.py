@@ -0,0 +1,208 @@
+from package.exception import CustomException
+from package.logger import logging
+from package.utils import get_schema_dtype
+from box import ConfigBox
+import numpy as np
+import threading
+import hashlib
+import yaml
+import sys
+import os
+
+
+class SchemaValidator:
+    """schema compiled once into arrays, so records are checked with a few vectorized
+    operations instead of walking the yaml for every chunk or request
+
+    Allowed values of all columns share one lookup table of shape
+    (columns, high - low + 1): a value v of column i is allowed when
+    table[i, v - low] is True.
+
+    Args:
+        schema (ConfigBox): schema read with read_yaml
+        digest (str): sha256 of the schema file
+    """
+
+    def __init__(self, schema:ConfigBox, digest:str=None):
+        self.digest = digest
+        self.columns = tuple(schema.columns.keys())
+        self.dtypes = {col: np.dtype(dtype) for col, dtype in schema.columns.items()}
+        self.dtype = get_schema_dtype(schema)
+        allowed_values = schema.get("allowed_values") or dict()
+        self.allowed_values = {col: sorted(allowed_values[col]) for col in self.columns if col in allowed_values}
+
+        self._position = {col: index for index, col in enumerate(self.columns)}
+        self._integer = np.array([self.dtypes[col].kind in "iu" for col in self.columns])
+        self._restricted = np.array([col in self.allowed_values for col in self.columns])
+        values = [value for col in self.allowed_values for value in self.allowed_values[col]]
+        if not all(float(value).is_integer() for value in values):
+            raise CustomException("allowed_values must be integers", sys)
+        self._low = int(min(values)) if values else 0
+        self._high = int(max(values)) if values else 0
+        self._table = np.zeros((len(self.columns), self._high - self._low + 1), dtype=bool)
+        for col, col_values in self.allowed_values.items():
+            self._table[self._position[col], np.asarray(col_values, dtype=np.int64) - self._low] = True
+        self._indices = dict()
+
+    def get_indices(self, exclude:list=None)->np.ndarray:
+        """positions of the schema columns left after exclude, in schema order
+        """
+        key = tuple(exclude or ())
+        if key not in self._indices:
+            self._indices[key] = np.array([index for index, col in enumerate(self.columns) if col not in key], dtype=np.intp)
+        return self._indices[key]
+
+    def _check_matrix(self, values:np.ndarray, indices:np.ndarray)->tuple[np.ndarray]:
+        """null, non integral and not allowed cells of a numeric 2D array whose
+        columns are the schema columns at indices
+        """
+        if values.dtype.kind == "f":
+            null = np.isnan(values)
+            with np.errstate(invalid="ignore"):
+                # inf stands for a value that wasn't a number at ingestion
+                type_error = ~null & (np.isinf(values) | (self._integer[indices] & (values != np.floor(values))))
+        else:
+            null = type_error = np.zeros(values.shape, dtype=bool)
+
+        restricted = self._restricted[indices]
+        if not restricted.any():
+            return null, type_error, np.zeros(values.shape, dtype=bool)
+        with np.errstate(invalid="ignore"):
+            in_range = (values >= self._low) & (values <= self._high)
+        codes = np.where(in_range, values, self._low).astype(np.intp) - self._low
+        allowed = in_range & self._table[indices, codes]
+        domain_error = restricted & ~allowed & ~null & ~type_error
+        return null, type_error, domain_error
+
+    def check_array(self, data:np.ndarray, exclude:list=None)->tuple[np.ndarray, dict]:
+        """checks a 2D array of schema columns in schema order, missing values are accepted
+
+        Args:
+            data (np.ndarray): records to check
+            exclude (list, optional): schema columns the array doesn't hold, like the target column
+
+        Returns:
+            tuple[np.ndarray, dict]: (invalid row mask, dict(key=reason, value=number of rows)), empty dict if all records are valid
+        """
+        indices = self.get_indices(exclude)
+        data = np.asarray(data)
+        if data.ndim != 2 or data.shape[1] != len(indices):
+            return np.ones(len(data), dtype=bool), {f"expected {len(indices)} columns, got shape {data.shape}": len(data)}
+        if data.dtype.kind not in "iubf":
+            return np.ones(len(data), dtype=bool), {f"expected numeric values, got {data.dtype}": len(data)}
+
+        _, type_error, domain_error = self._check_matrix(data, indices)
+        errors = type_error | domain_error
+        invalid = errors.any(axis=1)
+        summary = dict()
+        if invalid.any():
+            for position in np.flatnonzero(errors.any(axis=0)):
+                col = self.columns[indices[position]]
+                for reason, mask in ((f"{col}: not {self.dtypes[col]}", type_error), (f"{col}: not in allowed values", domain_error)):
+                    count = int(mask[:, position].sum())
+                    if count:
+                        summary[reason] = count
+        return invalid, summary
+
+    def check_frame(self, data:"pd.DataFrame", required:list=None, allow_missing:bool=True)->tuple:
+        """checks every record of a dataframe against the schema
+
+        A record fails on a missing column, a value that isn't numeric (or not
+        integral for integer columns), a value outside the allowed values of
+        its column or a missing value in a required column.
+
+        Args:
+            data (pd.DataFrame): records to check
+            required (list, optional): columns that can't have missing values, like the target column
+            allow_missing (bool, optional): accept missing values in the other columns. Defaults to True.
+
+        Returns:
+            tuple: (invalid row mask, reasons of the invalid rows, dict(key=reason, value=number of rows))
+        """
+        import pandas as pd
+
+        rows = len(data)
+        problems = list()
+        present = [col for col in self.columns if col in data.columns]
+        for col in self.columns:
+            if col not in data.columns:
+                problems.append((f"{col}: missing column", np.ones(rows, dtype=bool)))
+
+        # values that aren't numbers at all, the rest is checked as one numeric array
+        frame = data[present]
+        coerce_error = dict()
+        if any(dtype.kind not in "iubf" for dtype in frame.dtypes):
+            frame = frame.copy()
+            for col in present:
+                if frame[col].dtype.kind not in "iubf":
+                    values = pd.to_numeric(frame[col], errors="coerce")
+                    coerce_error[col] = (values.isna() & frame[col].notna()).to_numpy()
+                    frame[col] = values.astype(np.float64)
+        values = frame.to_numpy()
+        if values.dtype.kind not in "iubf":
+            values = values.astype(np.float64)
+        null, type_error, domain_error = self._check_matrix(values, np.array([self._position[col] for col in present], dtype=np.intp))
+
+        required = set(required or [])
+        for position, col in enumerate(present):
+            col_type_error = type_error[:, position]
+            if col in coerce_error:
+                col_type_error = col_type_error | coerce_error[col]
+            problems.append((f"{col}: not {self.dtypes[col]}", col_type_error))
+            if col in required or not allow_missing:
+                problems.append((f"{col}: missing value", null[:, position] & ~col_type_error))
+            problems.append((f"{col}: not in allowed values", domain_error[:, position]))
+
+        invalid = np.zeros(rows, dtype=bool)
+        for _, mask in problems:
+            invalid |= mask
+
+        # reasons are only built for the rejected rows
+        reasons = np.full(invalid.sum(), "", dtype=object)
+        summary = dict()
+        for reason, mask in problems:
+            count = int(mask.sum())
+            if count:
+                selected = mask[invalid]
+                reasons[selected] = reasons[selected] + "; " + reason
+                summary[reason] = count
+        reasons = np.array([reason.lstrip("; ") for reason in reasons], dtype=object)
+        return invalid, reasons, summary
+
+
+_validators = dict()
+_validators_lock = threading.Lock()
+
+
+def get_schema_validator(path:str)->SchemaValidator:
+    """compiled validator of a schema file, recompiled only when the content of the file changes
+
+    The file is hashed again only when its modification time or size changes,
+    so a cached validator costs one stat call.
+
+    Args:
+        path (str): path of the schema yaml
+
+    Returns:
+        SchemaValidator
+    """
+    try:
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with _validators_lock:
+            cached = _validators.get(str(path))
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+
+            with open(path, "rb") as file:
+                content = file.read()
+            digest = hashlib.sha256(content).hexdigest()
+            if cached is not None and cached[1].digest == digest:
+                validator = cached[1]
+            else:
+                validator = SchemaValidator(ConfigBox(yaml.safe_load(content)), digest)
+                logging.info(f"schema {path} compiled, sha256 {digest[:12]}")
+            _validators[str(path)] = (signature, validator)
+            return validator
+    except Exception as e:
+        raise CustomException(e, sys)
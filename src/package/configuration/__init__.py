@@ -1,6 +1,7 @@
 from dataclasses import dataclass
 from pathlib import Path
 import os
+from package.utils import lazy
 from package.constants import (
     DataIngestionConstants, 
     DataValidationConstants, 
@@ -12,71 +13,127 @@ from package.constants import (
 
 @dataclass
 class DataIngestionConfig:
-    ARITFACTS_ROOT_DIR_PATH = DataIngestionConstants.ARITFACTS_ROOT_DIR_NAME
-    DATA_ROOT_DIR_PATH = os.path.join(ARITFACTS_ROOT_DIR_PATH, DataIngestionConstants.DATA_ROOT_DIR_NAME)
-    INGESTION_ROOT_DIR_PATH = os.path.join(DATA_ROOT_DIR_PATH, DataIngestionConstants.INGESTION_ROOT_DIR_NAME)
+    ARITFACTS_ROOT_DIR_PATH = lazy(lambda cls: DataIngestionConstants.ARITFACTS_ROOT_DIR_NAME)
+    DATA_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.ARITFACTS_ROOT_DIR_PATH, DataIngestionConstants.DATA_ROOT_DIR_NAME))
+    INGESTION_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.DATA_ROOT_DIR_PATH, DataIngestionConstants.INGESTION_ROOT_DIR_NAME))
 
-    FEATURE_STORE_ROOT_DIR_PATH = os.path.join(INGESTION_ROOT_DIR_PATH, DataIngestionConstants.FEATURE_STORE_ROOT_DIR_NAME)
-    RAW_FILE_PATH = os.path.join(FEATURE_STORE_ROOT_DIR_PATH, DataIngestionConstants.RAW_FILE_NAME)
+    FEATURE_STORE_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.INGESTION_ROOT_DIR_PATH, DataIngestionConstants.FEATURE_STORE_ROOT_DIR_NAME))
+    PARTITIONS_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.FEATURE_STORE_ROOT_DIR_PATH, DataIngestionConstants.PARTITIONS_DIR_NAME))
+    PARTITION_FILE_PATH = lazy(lambda cls: os.path.join(cls.PARTITIONS_ROOT_DIR_PATH, DataIngestionConstants.PARTITION_FILE_NAME))
+    WATERMARK_FILE_PATH = lazy(lambda cls: os.path.join(cls.FEATURE_STORE_ROOT_DIR_PATH, DataIngestionConstants.WATERMARK_FILE_NAME))
 
-    INGESTED_ROOT_DIR_PATH = os.path.join(INGESTION_ROOT_DIR_PATH, DataIngestionConstants.INGESTED_ROOT_DIR_NAME)
-    TRAIN_FILE_PATH = os.path.join(INGESTED_ROOT_DIR_PATH, DataIngestionConstants.TRAIN_FILE_NAME)
-    TEST_FILE_PATH = os.path.join(INGESTED_ROOT_DIR_PATH, DataIngestionConstants.TEST_FILE_NAME)
+    INGESTED_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.INGESTION_ROOT_DIR_PATH, DataIngestionConstants.INGESTED_ROOT_DIR_NAME))
+    TRAIN_FILE_PATH = lazy(lambda cls: os.path.join(cls.INGESTED_ROOT_DIR_PATH, DataIngestionConstants.TRAIN_FILE_NAME))
+    TEST_FILE_PATH = lazy(lambda cls: os.path.join(cls.INGESTED_ROOT_DIR_PATH, DataIngestionConstants.TEST_FILE_NAME))
 
     SPLIT_RATIO = DataIngestionConstants.SPLIT_RATIO
     DATABASE_NAME = DataIngestionConstants.DATABASE_NAME
     COLLECTION_NAME = DataIngestionConstants.COLLECTION_NAME
+    LOADS_COLLECTION_NAME = DataIngestionConstants.LOADS_COLLECTION_NAME
+    BATCH_SIZE = lazy(lambda cls: DataIngestionConstants.BATCH_SIZE)
+    EXPORT_CSV = lazy(lambda cls: DataIngestionConstants.EXPORT_CSV)
+    WATERMARK_FIELD = DataIngestionConstants.WATERMARK_FIELD
+    SCHEMA_FILE_PATH = DataIngestionConstants.SCHEMA_FILE_PATH
 
 
 @dataclass
 class DataValidationConfig:
-    ARITFACTS_ROOT_DIR_PATH = Path(DataValidationConstants.ARITFACTS_ROOT_DIR_NAME)
-    DATA_ROOT_DIR_PATH = os.path.join(ARITFACTS_ROOT_DIR_PATH, DataValidationConstants.DATA_ROOT_DIR_NAME)
-    VALIDATION_ROOT_DIR_PATH = os.path.join(DATA_ROOT_DIR_PATH, DataValidationConstants.VALIDATION_ROOT_DIR_NAME)
-
-    VALID_ROOT_DIR_PATH = os.path.join(VALIDATION_ROOT_DIR_PATH, DataValidationConstants.VALID_ROOT_DIR_NAME)
-    VALID_TRAIN_FILE_PATH = os.path.join(VALID_ROOT_DIR_PATH, DataValidationConstants.VALID_TRAIN_FILE_NAME)
-    VALID_TEST_FILE_PATH = os.path.join(VALID_ROOT_DIR_PATH, DataValidationConstants.VALID_TEST_FILE_NAME)
-
-    INVALID_ROOT_DIR_PATH = os.path.join(VALIDATION_ROOT_DIR_PATH, DataValidationConstants.INVALID_ROOT_DIR_NAME)
-    INVALID_TRAIN_FILE_PATH = os.path.join(INVALID_ROOT_DIR_PATH, DataValidationConstants.INVALID_TRAIN_FILE_NAME)
-    INVALID_TEST_FILE_PATH = os.path.join(INVALID_ROOT_DIR_PATH, DataValidationConstants.INVALID_TEST_FILE_NAME)
-
-    DRIFT_REPORT_ROOT_DIR_PATH = os.path.join(VALIDATION_ROOT_DIR_PATH, DataValidationConstants.DRIFT_REPORT_ROOT_DIR_NAME)
-    DRIFT_REPORT_FILE_PATH = os.path.join(DRIFT_REPORT_ROOT_DIR_PATH, DataValidationConstants.DRIFT_REPORT_FILE_NAME)
+    ARITFACTS_ROOT_DIR_PATH = lazy(lambda cls: Path(DataValidationConstants.ARITFACTS_ROOT_DIR_NAME))
+    DATA_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.ARITFACTS_ROOT_DIR_PATH, DataValidationConstants.DATA_ROOT_DIR_NAME))
+    VALIDATION_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.DATA_ROOT_DIR_PATH, DataValidationConstants.VALIDATION_ROOT_DIR_NAME))
+
+    VALID_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.VALIDATION_ROOT_DIR_PATH, DataValidationConstants.VALID_ROOT_DIR_NAME))
+    VALID_TRAIN_FILE_PATH = lazy(lambda cls: os.path.join(cls.VALID_ROOT_DIR_PATH, DataValidationConstants.VALID_TRAIN_FILE_NAME))
+    VALID_TEST_FILE_PATH = lazy(lambda cls: os.path.join(cls.VALID_ROOT_DIR_PATH, DataValidationConstants.VALID_TEST_FILE_NAME))
+
+    INVALID_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.VALIDATION_ROOT_DIR_PATH, DataValidationConstants.INVALID_ROOT_DIR_NAME))
+    INVALID_TRAIN_FILE_PATH = lazy(lambda cls: os.path.join(cls.INVALID_ROOT_DIR_PATH, DataValidationConstants.INVALID_TRAIN_FILE_NAME))
+    INVALID_TEST_FILE_PATH = lazy(lambda cls: os.path.join(cls.INVALID_ROOT_DIR_PATH, DataValidationConstants.INVALID_TEST_FILE_NAME))
+
+    DRIFT_REPORT_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.VALIDATION_ROOT_DIR_PATH, DataValidationConstants.DRIFT_REPORT_ROOT_DIR_NAME))
+    DRIFT_REPORT_FILE_PATH = lazy(lambda cls: os.path.join(cls.DRIFT_REPORT_ROOT_DIR_PATH, DataValidationConstants.DRIFT_REPORT_FILE_NAME))
+    DRIFT_PSI_THRESHOLD = lazy(lambda cls: DataValidationConstants.DRIFT_PSI_THRESHOLD)
+    DRIFT_JS_THRESHOLD = lazy(lambda cls: DataValidationConstants.DRIFT_JS_THRESHOLD)
+    CHUNK_SIZE = lazy(lambda cls: DataValidationConstants.CHUNK_SIZE)
+    MAX_INVALID_RATIO = lazy(lambda cls: DataValidationConstants.MAX_INVALID_RATIO)
+    ALLOW_MISSING = lazy(lambda cls: DataValidationConstants.ALLOW_MISSING)
+    TARGET_COLUMN_NAME = DataValidationConstants.TARGET_COLUMN_NAME
 
     SCHEMA_FILE_PATH = DataValidationConstants.SCHEMA_FILE_PATH
+    EXPORT_CSV = lazy(lambda cls: DataValidationConstants.EXPORT_CSV)
 
 
 @dataclass
 class DataTransformationConfig:
-    ARITFACTS_ROOT_DIR_PATH =  Path(DataTransformationConstants.ARITFACTS_ROOT_DIR_NAME)
-    DATA_ROOT_DIR_PATH =  os.path.join(ARITFACTS_ROOT_DIR_PATH, DataTransformationConstants.DATA_ROOT_DIR_NAME)
-    TRANSFORMATION_ROOT_DIR_PATH =  os.path.join(DATA_ROOT_DIR_PATH, DataTransformationConstants.TRANSFORMATION_ROOT_DIR_NAME)
-    PREPROCESSOR_PATH =  os.path.join(TRANSFORMATION_ROOT_DIR_PATH, DataTransformationConstants.PREPROCESSOR_NAME)
-    TRAIN_FILE_PATH =  os.path.join(TRANSFORMATION_ROOT_DIR_PATH, DataTransformationConstants.TRAIN_FILE_NAME)
-    TEST_FILE_PATH =  os.path.join(TRANSFORMATION_ROOT_DIR_PATH, DataTransformationConstants.TEST_FILE_NAME)
-    TARGET_COLUMN_NAME =  DataTransformationConstants.TARGET_COLUMN_NAME
-    PREPROCESSOR_PARAMS =  DataTransformationConstants.PREPROCESSOR_PARAMS
+    ARITFACTS_ROOT_DIR_PATH = lazy(lambda cls: Path(DataTransformationConstants.ARITFACTS_ROOT_DIR_NAME))
+    DATA_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.ARITFACTS_ROOT_DIR_PATH, DataTransformationConstants.DATA_ROOT_DIR_NAME))
+    TRANSFORMATION_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.DATA_ROOT_DIR_PATH, DataTransformationConstants.TRANSFORMATION_ROOT_DIR_NAME))
+    PREPROCESSOR_PATH = lazy(lambda cls: os.path.join(cls.TRANSFORMATION_ROOT_DIR_PATH, DataTransformationConstants.PREPROCESSOR_NAME))
+    X_TRAIN_FILE_PATH = lazy(lambda cls: os.path.join(cls.TRANSFORMATION_ROOT_DIR_PATH, DataTransformationConstants.X_TRAIN_FILE_NAME))
+    Y_TRAIN_FILE_PATH = lazy(lambda cls: os.path.join(cls.TRANSFORMATION_ROOT_DIR_PATH, DataTransformationConstants.Y_TRAIN_FILE_NAME))
+    X_TEST_FILE_PATH = lazy(lambda cls: os.path.join(cls.TRANSFORMATION_ROOT_DIR_PATH, DataTransformationConstants.X_TEST_FILE_NAME))
+    Y_TEST_FILE_PATH = lazy(lambda cls: os.path.join(cls.TRANSFORMATION_ROOT_DIR_PATH, DataTransformationConstants.Y_TEST_FILE_NAME))
+    CHUNK_SIZE = lazy(lambda cls: DataTransformationConstants.CHUNK_SIZE)
+    COMPRESS = lazy(lambda cls: DataTransformationConstants.COMPRESS)
+    SCHEMA_FILE_PATH = DataTransformationConstants.SCHEMA_FILE_PATH
+    TARGET_COLUMN_NAME = DataTransformationConstants.TARGET_COLUMN_NAME
+    PREPROCESSOR_PARAMS = DataTransformationConstants.PREPROCESSOR_PARAMS
 
 
 @dataclass
 class ModelTrainerConfig:
-    ARITFACTS_ROOT_DIR_PATH = Path(ModelTrainerConstants.ARITFACTS_ROOT_DIR_NAME)
-    MODEL_ROOT_DIR_PATH =  os.path.join(ARITFACTS_ROOT_DIR_PATH, ModelTrainerConstants.MODEL_ROOT_DIR_NAME)
-    EVALUATION_FILE_PATH = os.path.join(MODEL_ROOT_DIR_PATH, ModelTrainerConstants.EVALUATION_FILE_NAME)
+    ARITFACTS_ROOT_DIR_PATH = lazy(lambda cls: Path(ModelTrainerConstants.ARITFACTS_ROOT_DIR_NAME))
+    MODEL_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.ARITFACTS_ROOT_DIR_PATH, ModelTrainerConstants.MODEL_ROOT_DIR_NAME))
+    EVALUATION_FILE_PATH = lazy(lambda cls: os.path.join(cls.MODEL_ROOT_DIR_PATH, ModelTrainerConstants.EVALUATION_FILE_NAME))
+
+    ESTIMATOR_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.MODEL_ROOT_DIR_PATH, ModelTrainerConstants.ESTIMATOR_ROOT_DIR_NAME))
+    ESTIMATOR_FILE_PATH = lazy(lambda cls: os.path.join(cls.ESTIMATOR_ROOT_DIR_PATH, ModelTrainerConstants.ESTIMATOR_FILE_NAME))
+    CONFIG_FILE_PATH = lazy(lambda cls: os.path.join(cls.ESTIMATOR_ROOT_DIR_PATH, ModelTrainerConstants.CONFIG_FILE_NAME))
+    INFERENCE_FILE_PATH = lazy(lambda cls: os.path.join(cls.ESTIMATOR_ROOT_DIR_PATH, ModelTrainerConstants.INFERENCE_FILE_NAME))
+
+    CV_FOLDS = lazy(lambda cls: ModelTrainerConstants.CV_FOLDS)
+    # outside the model dir, dvc wipes that one before every training run
+    CV_CACHE_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.ARITFACTS_ROOT_DIR_PATH, ModelTrainerConstants.CV_CACHE_DIR_NAME))
+    CV_CACHE_FILE_PATH = lazy(lambda cls: os.path.join(cls.CV_CACHE_ROOT_DIR_PATH, ModelTrainerConstants.CV_CACHE_FILE_NAME))
+    N_JOBS = lazy(lambda cls: ModelTrainerConstants.N_JOBS)
+
+    INCREMENTAL_TOLERANCE = lazy(lambda cls: ModelTrainerConstants.INCREMENTAL_TOLERANCE)
 
-    ESTIMATOR_ROOT_DIR_PATH =  os.path.join(MODEL_ROOT_DIR_PATH, ModelTrainerConstants.ESTIMATOR_ROOT_DIR_NAME)
-    ESTIMATOR_FILE_PATH =  os.path.join(ESTIMATOR_ROOT_DIR_PATH, ModelTrainerConstants.ESTIMATOR_FILE_NAME)
-    CONFIG_FILE_PATH =  os.path.join(ESTIMATOR_ROOT_DIR_PATH, ModelTrainerConstants.CONFIG_FILE_NAME)
+    COMPRESS = lazy(lambda cls: ModelTrainerConstants.COMPRESS)
 
     PARAMS_FILE_PATH = ModelTrainerConstants.PARAMS_FILE_NAME
 
 
 @dataclass
 class PredictionConfig:
-    ARITFACTS_ROOT_DIR_PATH = Path(PredictionConstants.ARITFACTS_ROOT_DIR_NAME)
-    PREDICTION_ROOT_DIR_PATH = os.path.join(ARITFACTS_ROOT_DIR_PATH, PredictionConstants.PREDICTION_ROOT_DIR_NAME)
-    OUTPUT_FILE_PATH = os.path.join(PREDICTION_ROOT_DIR_PATH,PredictionConstants.OUTPUT_FILE_NAME)
+    ARITFACTS_ROOT_DIR_PATH = lazy(lambda cls: Path(PredictionConstants.ARITFACTS_ROOT_DIR_NAME))
+    PREDICTION_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.ARITFACTS_ROOT_DIR_PATH, PredictionConstants.PREDICTION_ROOT_DIR_NAME))
+    OUTPUT_FILE_PATH = lazy(lambda cls: os.path.join(cls.PREDICTION_ROOT_DIR_PATH,PredictionConstants.OUTPUT_FILE_NAME))
+    MODEL_REFRESH_INTERVAL = lazy(lambda cls: PredictionConstants.MODEL_REFRESH_INTERVAL)
+    MAX_WORKERS = lazy(lambda cls: PredictionConstants.MAX_WORKERS)
+    HTML_MAX_ROWS = lazy(lambda cls: PredictionConstants.HTML_MAX_ROWS)
+    BATCH_CHUNK_SIZE = lazy(lambda cls: PredictionConstants.BATCH_CHUNK_SIZE)
+
+    MODEL_STORE_ROOT_DIR_PATH = lazy(lambda cls: os.path.join(cls.ARITFACTS_ROOT_DIR_PATH, PredictionConstants.MODEL_STORE_ROOT_DIR_NAME))
+    MODEL_STORE_MANIFEST_FILE_PATH = lazy(lambda cls: os.path.join(cls.MODEL_STORE_ROOT_DIR_PATH, PredictionConstants.MODEL_STORE_MANIFEST_FILE_NAME))
+    MODEL_STORE_KEEP_VERSIONS = lazy(lambda cls: PredictionConstants.MODEL_STORE_KEEP_VERSIONS)
+    MODEL_MMAP_MODE = lazy(lambda cls: PredictionConstants.MODEL_MMAP_MODE)
+
+    MICRO_BATCH_MAX_REQUEST_ROWS = lazy(lambda cls: PredictionConstants.MICRO_BATCH_MAX_REQUEST_ROWS)
+    MICRO_BATCH_MAX_BATCH_SIZE = lazy(lambda cls: PredictionConstants.MICRO_BATCH_MAX_BATCH_SIZE)
+    MICRO_BATCH_MAX_LATENCY = lazy(lambda cls: PredictionConstants.MICRO_BATCH_MAX_LATENCY)
+
+    SINK_MODE = lazy(lambda cls: PredictionConstants.SINK_MODE)
+    SINK_SAMPLE_RATE = lazy(lambda cls: PredictionConstants.SINK_SAMPLE_RATE)
+    SINK_QUEUE_SIZE = lazy(lambda cls: PredictionConstants.SINK_QUEUE_SIZE)
+    SINK_MAX_FILE_SIZE = lazy(lambda cls: PredictionConstants.SINK_MAX_FILE_SIZE)
+    SINK_MAX_FILES = lazy(lambda cls: PredictionConstants.SINK_MAX_FILES)
+
+    # reference distribution written by the validation stage
+    DRIFT_REPORT_FILE_PATH = lazy(lambda cls: DataValidationConfig.DRIFT_REPORT_FILE_PATH)
+    TARGET_COLUMN_NAME = DataTransformationConstants.TARGET_COLUMN_NAME
+
+    # prediction inputs are checked against the schema of the train data
+    SCHEMA_FILE_PATH = DataValidationConfig.SCHEMA_FILE_PATH
 
 
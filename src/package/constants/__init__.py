@@ -1,57 +1,108 @@
-from package.utils import read_yaml
+from package.utils import read_yaml, lazy
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 import numpy as np
+import os
 
 
-CONFIG = read_yaml("config/config.yaml")
+# relative to the working directory unless the environment points elsewhere
+CONFIG_FILE_PATH = os.getenv("CONFIG_FILE_PATH", "config/config.yaml")
+
+
+@lru_cache(maxsize=None)
+def get_config():
+    """config.yaml, read once on first use instead of at import
+    """
+    return read_yaml(CONFIG_FILE_PATH)
+
+
+def config(key:str, convert=None)->lazy:
+    """class attribute holding a value of config.yaml, resolved on first access
+
+    Args:
+        key (str): dotted key, like "DATA.ROOT_DIR_NAME"
+        convert (Callable, optional): applied to the value once it is read
+    """
+    def compute(owner):
+        value = get_config()
+        for part in key.split("."):
+            value = value[part]
+        return convert(value) if convert else value
+    return lazy(compute)
+
+
+def __getattr__(name):
+    # CONFIG used to be read at import, kept for scripts still using it
+    if name == "CONFIG":
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 @dataclass
 class DataIngestionConstants:
-    ARITFACTS_ROOT_DIR_NAME = CONFIG.ARITFACTS_ROOT_DIR_NAME
-    DATA_ROOT_DIR_NAME = CONFIG.DATA.ROOT_DIR_NAME
-    INGESTION_ROOT_DIR_NAME = CONFIG.DATA.INGESTION.ROOT_DIR_NAME
+    ARITFACTS_ROOT_DIR_NAME = config("ARITFACTS_ROOT_DIR_NAME")
+    DATA_ROOT_DIR_NAME = config("DATA.ROOT_DIR_NAME")
+    INGESTION_ROOT_DIR_NAME = config("DATA.INGESTION.ROOT_DIR_NAME")
 
-    FEATURE_STORE_ROOT_DIR_NAME = CONFIG.DATA.INGESTION.FEATURE_STORE.ROOT_DIR_NAME
-    RAW_FILE_NAME = CONFIG.DATA.INGESTION.FEATURE_STORE.RAW_FILE_NAME
+    FEATURE_STORE_ROOT_DIR_NAME = config("DATA.INGESTION.FEATURE_STORE.ROOT_DIR_NAME")
+    PARTITIONS_DIR_NAME = config("DATA.INGESTION.FEATURE_STORE.PARTITIONS_DIR_NAME")
+    PARTITION_FILE_NAME = config("DATA.INGESTION.FEATURE_STORE.PARTITION_FILE_NAME")
+    WATERMARK_FILE_NAME = config("DATA.INGESTION.FEATURE_STORE.WATERMARK_FILE_NAME")
 
-    INGESTED_ROOT_DIR_NAME = CONFIG.DATA.INGESTION.INGESTED.ROOT_DIR_NAME
-    TRAIN_FILE_NAME = CONFIG.DATA.INGESTION.INGESTED.TRAIN_FILE_NAME
-    TEST_FILE_NAME = CONFIG.DATA.INGESTION.INGESTED.TEST_FILE_NAME
+    INGESTED_ROOT_DIR_NAME = config("DATA.INGESTION.INGESTED.ROOT_DIR_NAME")
+    TRAIN_FILE_NAME = config("DATA.INGESTION.INGESTED.TRAIN_FILE_NAME")
+    TEST_FILE_NAME = config("DATA.INGESTION.INGESTED.TEST_FILE_NAME")
 
     SPLIT_RATIO = 0.2
     DATABASE_NAME = "Network-Security"
     COLLECTION_NAME = "Data"
+    LOADS_COLLECTION_NAME = "Loads"
+    BATCH_SIZE = config("DATA.INGESTION.BATCH_SIZE")
+    EXPORT_CSV = config("DATA.EXPORT_CSV")
+    WATERMARK_FIELD = "_id"
+    SCHEMA_FILE_PATH = Path("schema/schema.yaml")
 
 
 @dataclass
 class DataValidationConstants:
-    ARITFACTS_ROOT_DIR_NAME = CONFIG.ARITFACTS_ROOT_DIR_NAME
-    DATA_ROOT_DIR_NAME = CONFIG.DATA.ROOT_DIR_NAME
-    VALIDATION_ROOT_DIR_NAME = CONFIG.DATA.VALIDATION.ROOT_DIR_NAME
-
-    VALID_ROOT_DIR_NAME = CONFIG.DATA.VALIDATION.VALID.ROOT_DIR_NAME
-    VALID_TRAIN_FILE_NAME = CONFIG.DATA.VALIDATION.VALID.TRAIN_FILE_NAME
-    VALID_TEST_FILE_NAME = CONFIG.DATA.VALIDATION.VALID.TEST_FILE_NAME
-
-    INVALID_ROOT_DIR_NAME = CONFIG.DATA.VALIDATION.INVALID.ROOT_DIR_NAME
-    INVALID_TRAIN_FILE_NAME = CONFIG.DATA.VALIDATION.INVALID.TRAIN_FILE_NAME
-    INVALID_TEST_FILE_NAME = CONFIG.DATA.VALIDATION.INVALID.TEST_FILE_NAME
-
-    DRIFT_REPORT_ROOT_DIR_NAME = CONFIG.DATA.VALIDATION.DRIFT_REPORT.ROOT_DIR_NAME
-    DRIFT_REPORT_FILE_NAME = CONFIG.DATA.VALIDATION.DRIFT_REPORT.FILE_NAME
+    ARITFACTS_ROOT_DIR_NAME = config("ARITFACTS_ROOT_DIR_NAME")
+    DATA_ROOT_DIR_NAME = config("DATA.ROOT_DIR_NAME")
+    VALIDATION_ROOT_DIR_NAME = config("DATA.VALIDATION.ROOT_DIR_NAME")
+
+    VALID_ROOT_DIR_NAME = config("DATA.VALIDATION.VALID.ROOT_DIR_NAME")
+    VALID_TRAIN_FILE_NAME = config("DATA.VALIDATION.VALID.TRAIN_FILE_NAME")
+    VALID_TEST_FILE_NAME = config("DATA.VALIDATION.VALID.TEST_FILE_NAME")
+
+    INVALID_ROOT_DIR_NAME = config("DATA.VALIDATION.INVALID.ROOT_DIR_NAME")
+    INVALID_TRAIN_FILE_NAME = config("DATA.VALIDATION.INVALID.TRAIN_FILE_NAME")
+    INVALID_TEST_FILE_NAME = config("DATA.VALIDATION.INVALID.TEST_FILE_NAME")
+
+    DRIFT_REPORT_ROOT_DIR_NAME = config("DATA.VALIDATION.DRIFT_REPORT.ROOT_DIR_NAME")
+    DRIFT_REPORT_FILE_NAME = config("DATA.VALIDATION.DRIFT_REPORT.FILE_NAME")
+    DRIFT_PSI_THRESHOLD = config("DATA.VALIDATION.DRIFT_REPORT.PSI_THRESHOLD")
+    DRIFT_JS_THRESHOLD = config("DATA.VALIDATION.DRIFT_REPORT.JS_THRESHOLD")
+    CHUNK_SIZE = config("DATA.VALIDATION.CHUNK_SIZE")
+    MAX_INVALID_RATIO = config("DATA.VALIDATION.MAX_INVALID_RATIO")
+    ALLOW_MISSING = config("DATA.VALIDATION.ALLOW_MISSING")
+    TARGET_COLUMN_NAME = "Result"
+    EXPORT_CSV = config("DATA.EXPORT_CSV")
 
     SCHEMA_FILE_PATH = Path("schema/schema.yaml")
 
 
 @dataclass
 class DataTransformationConstants:
-    ARITFACTS_ROOT_DIR_NAME = CONFIG.ARITFACTS_ROOT_DIR_NAME
-    DATA_ROOT_DIR_NAME = CONFIG.DATA.ROOT_DIR_NAME
-    TRANSFORMATION_ROOT_DIR_NAME = CONFIG.DATA.TRANSFORMATION.ROOT_DIR_NAME
-    PREPROCESSOR_NAME = CONFIG.DATA.TRANSFORMATION.PREPROCESSOR_NAME
-    TRAIN_FILE_NAME = CONFIG.DATA.TRANSFORMATION.TRAIN_FILE_NAME
-    TEST_FILE_NAME = CONFIG.DATA.TRANSFORMATION.TEST_FILE_NAME
+    ARITFACTS_ROOT_DIR_NAME = config("ARITFACTS_ROOT_DIR_NAME")
+    DATA_ROOT_DIR_NAME = config("DATA.ROOT_DIR_NAME")
+    TRANSFORMATION_ROOT_DIR_NAME = config("DATA.TRANSFORMATION.ROOT_DIR_NAME")
+    PREPROCESSOR_NAME = config("DATA.TRANSFORMATION.PREPROCESSOR_NAME")
+    X_TRAIN_FILE_NAME = config("DATA.TRANSFORMATION.X_TRAIN_FILE_NAME")
+    Y_TRAIN_FILE_NAME = config("DATA.TRANSFORMATION.Y_TRAIN_FILE_NAME")
+    X_TEST_FILE_NAME = config("DATA.TRANSFORMATION.X_TEST_FILE_NAME")
+    Y_TEST_FILE_NAME = config("DATA.TRANSFORMATION.Y_TEST_FILE_NAME")
+    CHUNK_SIZE = config("DATA.TRANSFORMATION.CHUNK_SIZE")
+    COMPRESS = config("MODEL.SERIALIZATION.COMPRESS")
+    SCHEMA_FILE_PATH = Path("schema/schema.yaml")
     TARGET_COLUMN_NAME = "Result"
     PREPROCESSOR_PARAMS = dict(
         missing_values = np.nan,
@@ -61,22 +112,51 @@ class DataTransformationConstants:
 
 @dataclass
 class ModelTrainerConstants:
-    ARITFACTS_ROOT_DIR_NAME = CONFIG.ARITFACTS_ROOT_DIR_NAME
-    MODEL_ROOT_DIR_NAME = CONFIG.MODEL.ROOT_DIR_NAME
-    EVALUATION_FILE_NAME = CONFIG.MODEL.EVALUATION_FILE_NAME
+    ARITFACTS_ROOT_DIR_NAME = config("ARITFACTS_ROOT_DIR_NAME")
+    MODEL_ROOT_DIR_NAME = config("MODEL.ROOT_DIR_NAME")
+    EVALUATION_FILE_NAME = config("MODEL.EVALUATION_FILE_NAME")
+
+    ESTIMATOR_ROOT_DIR_NAME = config("MODEL.ESTIMATOR.ROOT_DIR_NAME")
+    ESTIMATOR_FILE_NAME = config("MODEL.ESTIMATOR.ESTIMATOR_FILE_NAME")
+    CONFIG_FILE_NAME = config("MODEL.ESTIMATOR.CONFIG_FILE_NAME")
+    INFERENCE_FILE_NAME = config("MODEL.ESTIMATOR.INFERENCE_FILE_NAME")
+
+    CV_FOLDS = config("MODEL.SEARCH.CV_FOLDS")
+    CV_CACHE_DIR_NAME = config("MODEL.SEARCH.CACHE_DIR_NAME")
+    CV_CACHE_FILE_NAME = config("MODEL.SEARCH.CACHE_FILE_NAME")
+    N_JOBS = config("MODEL.SEARCH.N_JOBS")
+
+    INCREMENTAL_TOLERANCE = config("MODEL.INCREMENTAL.TOLERANCE")
 
-    ESTIMATOR_ROOT_DIR_NAME = CONFIG.MODEL.ESTIMATOR.ROOT_DIR_NAME
-    ESTIMATOR_FILE_NAME = CONFIG.MODEL.ESTIMATOR.ESTIMATOR_FILE_NAME
-    CONFIG_FILE_NAME = CONFIG.MODEL.ESTIMATOR.CONFIG_FILE_NAME
+    COMPRESS = config("MODEL.SERIALIZATION.COMPRESS")
 
     PARAMS_FILE_NAME = "params.json"
 
 
 @dataclass
 class PredictionConstants:
-    ARITFACTS_ROOT_DIR_NAME = CONFIG.ARITFACTS_ROOT_DIR_NAME
-    PREDICTION_ROOT_DIR_NAME = CONFIG.PREDICTION.ROOT_DIR_NAME
-    OUTPUT_FILE_NAME = CONFIG.PREDICTION.OUTPUT_FILE_NAME
+    ARITFACTS_ROOT_DIR_NAME = config("ARITFACTS_ROOT_DIR_NAME")
+    PREDICTION_ROOT_DIR_NAME = config("PREDICTION.ROOT_DIR_NAME")
+    OUTPUT_FILE_NAME = config("PREDICTION.OUTPUT_FILE_NAME")
+    MODEL_REFRESH_INTERVAL = config("PREDICTION.MODEL_REFRESH_INTERVAL")
+    MAX_WORKERS = config("PREDICTION.MAX_WORKERS")
+    HTML_MAX_ROWS = config("PREDICTION.HTML_MAX_ROWS")
+    BATCH_CHUNK_SIZE = config("PREDICTION.BATCH_CHUNK_SIZE")
+
+    MODEL_STORE_ROOT_DIR_NAME = config("PREDICTION.MODEL_STORE.ROOT_DIR_NAME")
+    MODEL_STORE_MANIFEST_FILE_NAME = config("PREDICTION.MODEL_STORE.MANIFEST_FILE_NAME")
+    MODEL_STORE_KEEP_VERSIONS = config("PREDICTION.MODEL_STORE.KEEP_VERSIONS")
+    MODEL_MMAP_MODE = config("MODEL.SERIALIZATION.MMAP_MODE")
+
+    MICRO_BATCH_MAX_REQUEST_ROWS = config("PREDICTION.MICRO_BATCH.MAX_REQUEST_ROWS")
+    MICRO_BATCH_MAX_BATCH_SIZE = config("PREDICTION.MICRO_BATCH.MAX_BATCH_SIZE")
+    MICRO_BATCH_MAX_LATENCY = config("PREDICTION.MICRO_BATCH.MAX_LATENCY_MS", lambda ms: ms / 1000)
+
+    SINK_MODE = config("PREDICTION.SINK.MODE")
+    SINK_SAMPLE_RATE = config("PREDICTION.SINK.SAMPLE_RATE")
+    SINK_QUEUE_SIZE = config("PREDICTION.SINK.QUEUE_SIZE")
+    SINK_MAX_FILE_SIZE = config("PREDICTION.SINK.MAX_FILE_SIZE_MB", lambda mb: mb * 1024 * 1024)
+    SINK_MAX_FILES = config("PREDICTION.SINK.MAX_FILES")
 
 
 @dataclass
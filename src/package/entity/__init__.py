@@ -9,7 +9,9 @@ class DataIngestionConfigEntity:
     INGESTION_ROOT_DIR_PATH:Path
 
     FEATURE_STORE_ROOT_DIR_PATH:Path
-    RAW_FILE_PATH:Path
+    PARTITIONS_ROOT_DIR_PATH:Path
+    PARTITION_FILE_PATH:Path
+    WATERMARK_FILE_PATH:Path
 
     INGESTED_ROOT_DIR_PATH:Path
     TRAIN_FILE_PATH:Path
@@ -18,6 +20,11 @@ class DataIngestionConfigEntity:
     SPLIT_RATIO:float
     DATABASE_NAME:str
     COLLECTION_NAME:str
+    LOADS_COLLECTION_NAME:str
+    BATCH_SIZE:int
+    EXPORT_CSV:bool
+    WATERMARK_FIELD:str
+    SCHEMA_FILE_PATH:Path
 
 
 @dataclass
@@ -36,8 +43,15 @@ class DataValidationConfigEntity:
 
     DRIFT_REPORT_ROOT_DIR_PATH = Path
     DRIFT_REPORT_FILE_PATH = str
+    DRIFT_PSI_THRESHOLD = float
+    DRIFT_JS_THRESHOLD = float
+    CHUNK_SIZE = int
+    MAX_INVALID_RATIO = float
+    ALLOW_MISSING = bool
+    TARGET_COLUMN_NAME = str
 
     SCHEMA_FILE_PATH = Path
+    EXPORT_CSV = bool
 
 
 @dataclass
@@ -46,8 +60,13 @@ class DataTransformationConfigEntity:
     DATA_ROOT_DIR_PATH: Path
     TRANSFORMATION_ROOT_DIR_PATH: Path
     PREPROCESSOR_PATH: Path
-    TRAIN_FILE_PATH: Path
-    TEST_FILE_PATH: Path
+    X_TRAIN_FILE_PATH: Path
+    Y_TRAIN_FILE_PATH: Path
+    X_TEST_FILE_PATH: Path
+    Y_TEST_FILE_PATH: Path
+    CHUNK_SIZE: int
+    COMPRESS: int
+    SCHEMA_FILE_PATH: Path
     TARGET_COLUMN_NAME: str
     PREPROCESSOR_PARAMS: dict
 
@@ -61,6 +80,16 @@ class ModelTrainerConfigEntity:
     ESTIMATOR_ROOT_DIR_PATH: Path
     ESTIMATOR_FILE_PATH: Path
     CONFIG_FILE_PATH: Path
+    INFERENCE_FILE_PATH: Path
+
+    CV_FOLDS: int
+    CV_CACHE_ROOT_DIR_PATH: Path
+    CV_CACHE_FILE_PATH: Path
+    N_JOBS: int
+
+    INCREMENTAL_TOLERANCE: float
+
+    COMPRESS: int
 
     PARAMS_FILE_PATH: Path
 
@@ -70,5 +99,28 @@ class PredictionConfigEntity:
     ARITFACTS_ROOT_DIR_PATH = Path
     PREDICTION_ROOT_DIR_PATH = Path
     OUTPUT_FILE_PATH = Path
+    MODEL_REFRESH_INTERVAL = float
+    MAX_WORKERS = int
+    HTML_MAX_ROWS = int
+    BATCH_CHUNK_SIZE = int
+
+    MODEL_STORE_ROOT_DIR_PATH = Path
+    MODEL_STORE_MANIFEST_FILE_PATH = Path
+    MODEL_STORE_KEEP_VERSIONS = int
+    MODEL_MMAP_MODE = str
+
+    MICRO_BATCH_MAX_REQUEST_ROWS = int
+    MICRO_BATCH_MAX_BATCH_SIZE = int
+    MICRO_BATCH_MAX_LATENCY = float
+
+    SINK_MODE = str
+    SINK_SAMPLE_RATE = float
+    SINK_QUEUE_SIZE = int
+    SINK_MAX_FILE_SIZE = int
+    SINK_MAX_FILES = int
+
+    DRIFT_REPORT_FILE_PATH = Path
+    TARGET_COLUMN_NAME = str
+    SCHEMA_FILE_PATH = Path
 
 
@@ -6,11 +6,17 @@ from package.components.model_trainer import ModelTrainerComponents
 @dataclass
 class ModelTrainerPipeline:
 
-    def main(self)->None:
+    def main(self, incremental:bool=False)->None:
         """runs data ingestion full pipeline
+
+        Args:
+            incremental (bool, optional): update the current model with the new records instead of a full training. Defaults to False.
         """
         mt = ModelTrainerComponents(DataTransformationConfig, ModelTrainerConfig)
-        mt.initiate_training()
+        if incremental:
+            mt.incremental_training()
+        else:
+            mt.initiate_training()
 
 
 
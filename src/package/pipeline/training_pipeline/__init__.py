@@ -1,22 +1,32 @@
-from package.pipeline import (
-    stage_01_data_ingestion,
-    stage_02_data_validation,
-    stage_03_data_transformation,
-    stage_04_model_trainer
-)
 from package.constants import TrainingPipelineConstants
-from dataclasses import dataclass
+from dataclasses import dataclass, field, asdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from package.cloud import S3Sync
 from package.exception import CustomException
+from package.logger import logging
+import threading
+import uuid
 import sys
 
 
 @dataclass
 class TrainingPipeline:
-    stage_01 = stage_01_data_ingestion.DataIngestionPipeline()
-    stage_02 = stage_02_data_validation.DataValidationPipeline()
-    stage_03 = stage_03_data_transformation.DataTransformationPipeline()
-    stage_04 = stage_04_model_trainer.ModelTrainerPipeline()
+    """runs all stages, which are imported on the first run so importing the pipeline
+    (like app.py does for the /train route) doesn't load pymongo, sklearn or mlflow
+    """
+
+    def get_stages(self)->tuple:
+        from package.pipeline import (
+            stage_01_data_ingestion,
+            stage_02_data_validation,
+            stage_03_data_transformation,
+            stage_04_model_trainer
+        )
+        return (stage_01_data_ingestion.DataIngestionPipeline(),
+                stage_02_data_validation.DataValidationPipeline(),
+                stage_03_data_transformation.DataTransformationPipeline(),
+                stage_04_model_trainer.ModelTrainerPipeline())
 
     ## local artifact is going to s3 bucket    
     def push_to_cloud(self):
@@ -31,13 +41,85 @@ class TrainingPipeline:
         except Exception as e:
             raise CustomException(e,sys)
 
-    def run(self):
-        self.stage_01.main()
-        self.stage_02.main()
-        self.stage_03.main()
-        self.stage_04.main()
+    def run(self, incremental:bool=False):
+        stage_01, stage_02, stage_03, stage_04 = self.get_stages()
+        stage_01.main()
+        stage_02.main()
+        stage_03.main()
+        stage_04.main(incremental)
         self.push_to_cloud()
-        
-        
 
 
+TRAINING_MODES = ("full", "incremental")
+
+
+@dataclass
+class TrainingJob:
+    job_id: str
+    mode: str = "full"
+    status: str = "queued"
+    submitted_at: str = field(default_factory=lambda: datetime.now().isoformat(timespec="seconds"))
+    started_at: str = None
+    finished_at: str = None
+    error: str = None
+
+    def to_dict(self)->dict:
+        return asdict(self)
+
+
+class TrainingJobManager:
+    """runs TrainingPipeline in the background, one job at a time
+    """
+
+    def __init__(self, on_success=None):
+        # called after a successful job, like a reload of the served model
+        self._on_success = on_success
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="training")
+        self._lock = threading.Lock()
+        self._jobs = dict()
+        self._current = None
+
+    def submit(self, mode:str="full")->tuple[TrainingJob, bool]:
+        """starts a training job unless one is already queued or running
+
+        Args:
+            mode (str, optional): one of TRAINING_MODES. Defaults to "full".
+
+        Returns:
+            tuple[TrainingJob, bool]: (job, True if a new job was created)
+        """
+        if mode not in TRAINING_MODES:
+            raise CustomException(f"improper training mode {mode}, expected one of {TRAINING_MODES}", sys)
+        with self._lock:
+            if self._current is not None and self._current.status in ("queued", "running"):
+                return self._current, False
+            job = TrainingJob(job_id=uuid.uuid4().hex, mode=mode)
+            self._jobs[job.job_id] = job
+            self._current = job
+        self._executor.submit(self._run, job)
+        logging.info(f"{mode} training job {job.job_id} submitted")
+        return job, True
+
+    def get(self, job_id:str)->TrainingJob:
+        return self._jobs.get(job_id)
+
+    def _run(self, job:TrainingJob)->None:
+        job.status = "running"
+        job.started_at = datetime.now().isoformat(timespec="seconds")
+        try:
+            TrainingPipeline().run(incremental=job.mode == "incremental")
+            job.status = "succeeded"
+        except Exception as e:
+            logging.exception(e)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now().isoformat(timespec="seconds")
+            logging.info(f"training job {job.job_id} {job.status}")
+
+        if job.status == "succeeded" and self._on_success is not None:
+            try:
+                self._on_success()
+            except Exception as e:
+                # the job succeeded, the served model just stays as it is
+                logging.exception(e)
@@ -1,14 +1,34 @@
 from package.exception import CustomException
-from sklearn.model_selection import GridSearchCV
 from box import ConfigBox
 from pathlib import Path
+from io import BytesIO
 import numpy as np
 import sys
 import os
 import yaml
 import pickle
+import hashlib
 import json
-from sklearn.metrics import f1_score, precision_score, recall_score, accuracy_score
+
+class lazy:
+    """class attribute computed on first access and then stored on the class,
+    so constants and configs don't read anything at import
+
+    Args:
+        compute (Callable): function of the owner class returning the value
+    """
+
+    def __init__(self, compute):
+        self.compute = compute
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        value = self.compute(owner)
+        setattr(owner, self.name, value)
+        return value
+
 
 def create_dirs(path:str)->None:
     """creates directory if path do not exists
@@ -46,35 +66,112 @@ def save_yaml(content:any, file_path:str)->None:
         path (str): path to save the file
     """
     try:
-        with open(Path(file_path), "w") as file:
+        # replaced in one step, a reader never sees half a file
+        temp_path = f"{file_path}.tmp"
+        with open(Path(temp_path), "w") as file:
             yaml.safe_dump(content, file)
+        os.replace(temp_path, file_path)
     except Exception as e:
         raise CustomException(e, sys)
     
 
-def save_obj(obj:any, path:str)->None:
-    """saves the object on given path
+def _pickle_dump(obj:any, path:str, compress:int)->None:
+    with open(Path(path), "wb") as file:
+        pickle.dump(obj, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _pickle_load(path:str, mmap_mode:str):
+    with open(Path(path), "rb") as file:
+        return pickle.load(file)
+
+
+def _joblib_dump(obj:any, path:str, compress:int)->None:
+    import joblib
+    joblib.dump(obj, path, compress=compress)
+
+
+def _joblib_load(path:str, mmap_mode:str):
+    import joblib
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+# file suffix => (dump(obj, path, compress), load(path, mmap_mode)), .h5 are pickles of earlier runs
+SERIALIZERS = {
+    ".joblib": (_joblib_dump, _joblib_load),
+    ".pkl": (_pickle_dump, _pickle_load),
+    ".h5": (_pickle_dump, _pickle_load),
+}
+
+
+def get_serializer(path:str)->tuple:
+    suffix = Path(path).suffix
+    if suffix not in SERIALIZERS:
+        raise CustomException(f"no serializer for {suffix} files, expected one of {list(SERIALIZERS)}", sys)
+    return SERIALIZERS[suffix]
+
+
+def get_file_digest(path:str)->str:
+    """sha256 of a file, read in 1 MB blocks
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_artifact_entry(path:str, compress:int=0)->dict:
+    """manifest entry of a file saved by save_obj
+
+    Args:
+        path (str): path of the saved file
+        compress (int, optional): joblib compression level it was saved with, only recorded for joblib files. Defaults to 0.
+
+    Returns:
+        dict: dict(format, sha256, size), joblib files also have compress
+    """
+    try:
+        entry = {"format": Path(path).suffix.lstrip(".")}
+        if SERIALIZERS.get(Path(path).suffix) == SERIALIZERS[".joblib"]:
+            entry["compress"] = compress
+        entry["sha256"] = get_file_digest(path)
+        entry["size"] = os.path.getsize(path)
+        return entry
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def save_obj(obj:any, path:str, compress:int=0)->dict:
+    """saves the object on given path, the serializer is chosen by the file suffix
 
     Args:
         obj (any): object to dump
         path (str): path to dump the object
+        compress (int, optional): joblib compression level 0-9, compressed files can't be memory mapped,
+            ignored by pickle files. Defaults to 0.
+
+    Returns:
+        dict: manifest entry of the file, see get_artifact_entry
     """
     try:
-        with open(Path(path), "wb") as file:
-            pickle.dump(obj, file)
+        dump, _ = get_serializer(path)
+        dump(obj, path, compress)
+        return get_artifact_entry(path, compress)
     except Exception as e:
         raise CustomException(e, sys)
     
 
-def load_obj(path:str):
+def load_obj(path:str, mmap_mode:str=None):
     """load the object available in path
 
     Args:
         path (str): path of the object
+        mmap_mode (str, optional): "r" maps the numpy arrays of an uncompressed joblib file read only
+            instead of reading them into memory, everything else is still unpickled. Defaults to None.
     """
     try:
-        with open(Path(path), "rb") as file:
-            return pickle.load(file)
+        _, load = get_serializer(path)
+        return load(path, mmap_mode)
     except Exception as e:
         raise CustomException(e, sys)
     
@@ -117,45 +214,351 @@ def load_json(path:str)->dict:
         raise CustomException(e, sys)
     
 
-def evaluate_models(X_train:np.array, y_train:np.array, X_test:np.array, y_test:np.array, models:dict, params:dict)->dict[dict]:
+def get_schema_dtype(schema:ConfigBox, exclude:list=None)->np.dtype:
+    """smallest common dtype of the schema columns
+
+    A column with integer allowed_values only needs the smallest signed integer
+    type that holds them, any other column keeps its declared dtype.
+
+    Args:
+        schema (ConfigBox): schema read with read_yaml
+        exclude (list, optional): columns to leave out, like the target column
+
+    Returns:
+        np.dtype: dtype every column fits in
+    """
+    try:
+        allowed_values = schema.get("allowed_values") or dict()
+        dtypes = list()
+        for col, dtype in schema.columns.items():
+            if exclude and col in exclude:
+                continue
+            values = allowed_values.get(col)
+            if values and all(float(value).is_integer() for value in values):
+                low, high = min(values), max(values)
+                dtypes.append(next(np.dtype(candidate) for candidate in (np.int8, np.int16, np.int32, np.int64)
+                                   if np.iinfo(candidate).min <= low and high <= np.iinfo(candidate).max))
+            else:
+                dtypes.append(np.dtype(dtype))
+        return np.result_type(*dtypes)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def cast_if_lossless(data:np.ndarray, dtype:type)->np.ndarray:
+    """data converted to dtype if every value survives the conversion exactly, unchanged otherwise
+
+    Args:
+        data (np.ndarray): values to convert
+        dtype (type): target dtype, like the schema dtype
+
+    Returns:
+        np.ndarray
+    """
+    dtype = np.dtype(dtype)
+    if data.dtype == dtype:
+        return data
+    with np.errstate(invalid="ignore", over="ignore"):
+        cast = data.astype(dtype)
+        if np.array_equal(cast.astype(data.dtype), data, equal_nan=data.dtype.kind == "f"):
+            return cast
+    return data
+
+
+def save_frame(data:"pd.DataFrame", path:str, export_csv:bool=False)->None:
+    """saves the dataframe in the format given by the file extension
+
+    Args:
+        data (pd.DataFrame): data to save
+        path (str): .parquet, .feather or .csv file path
+        export_csv (bool, optional): also write a .csv copy next to binary files. Defaults to False.
+    """
+    try:
+        suffix = Path(path).suffix
+        if suffix == ".parquet":
+            data.to_parquet(path, index=False)
+        elif suffix == ".feather":
+            data.reset_index(drop=True).to_feather(path)
+        elif suffix == ".csv":
+            data.to_csv(path, index=False, header=True)
+        else:
+            raise ValueError(f"unsupported file format {suffix}")
+
+        if export_csv and suffix != ".csv":
+            data.to_csv(Path(path).with_suffix(".csv"), index=False, header=True)
+    except Exception as e:
+        raise CustomException(e, sys)
+    
+
+def load_frame(path:str, columns:list=None)->"pd.DataFrame":
+    """loads the dataframe saved by save_frame
+
+    Args:
+        path (str): .parquet, .feather or .csv file path
+        columns (list, optional): columns to read, all if None
+
+    Returns:
+        pd.DataFrame
+    """
+    try:
+        import pandas as pd
+        suffix = Path(path).suffix
+        if suffix == ".parquet":
+            return pd.read_parquet(path, columns=columns)
+        if suffix == ".feather":
+            return pd.read_feather(path, columns=columns)
+        if suffix == ".csv":
+            return pd.read_csv(path, usecols=columns)
+        raise ValueError(f"unsupported file format {suffix}")
+    except Exception as e:
+        raise CustomException(e, sys)
+    
+
+def iter_frame_chunks(path:str, chunk_size:int=10000):
+    """reads a file saved by save_frame or FrameWriter in chunks of at most chunk_size rows
+
+    Args:
+        path (str): .parquet, .feather or .csv file path
+        chunk_size (int, optional): rows per chunk. Defaults to 10000.
+
+    Yields:
+        pd.DataFrame: next chunk
+    """
+    try:
+        import pandas as pd
+        suffix = Path(path).suffix
+        if suffix == ".parquet":
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+                yield batch.to_pandas()
+        elif suffix == ".feather":
+            import pyarrow as pa
+            with pa.memory_map(str(path)) as source:
+                reader = pa.ipc.open_file(source)
+                for index in range(reader.num_record_batches):
+                    batch = reader.get_batch(index)
+                    for start in range(0, batch.num_rows, chunk_size):
+                        yield batch.slice(start, chunk_size).to_pandas()
+        elif suffix == ".csv":
+            yield from pd.read_csv(path, chunksize=chunk_size)
+        else:
+            raise ValueError(f"unsupported file format {suffix}")
+    except Exception as e:
+        raise CustomException(e, sys)
+    
+
+class FrameWriter:
+    """appends dataframe chunks to a .parquet, .feather or .csv file
+
+    Args:
+        path (str): .parquet, .feather or .csv file path
+        dtype (type, optional): numpy dtype every column is stored as in binary files, missing values are kept as nulls
+        export_csv (bool, optional): also write a .csv copy next to binary files. Defaults to False.
+    """
+
+    def __init__(self, path:str, dtype:type=None, export_csv:bool=False):
+        self.path = Path(path)
+        self.dtype = dtype
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+        self._csv = FrameWriter(self.path.with_suffix(".csv")) if export_csv and self.path.suffix != ".csv" else None
+        if self.path.suffix not in (".parquet", ".feather", ".csv"):
+            raise CustomException(f"unsupported file format {self.path.suffix}", sys)
+
+    def write(self, data:"pd.DataFrame")->None:
+        try:
+            if self.path.suffix == ".csv":
+                data.to_csv(self.path, mode="w" if self._writer is None else "a", header=self._writer is None, index=False)
+                self._writer = True
+            else:
+                import pyarrow as pa
+                table = pa.Table.from_pandas(data, preserve_index=False)
+                if self._writer is None:
+                    self._schema = table.schema
+                    if self.dtype is not None:
+                        arrow_type = pa.from_numpy_dtype(np.dtype(self.dtype))
+                        self._schema = pa.schema([pa.field(name, arrow_type) for name in table.column_names])
+                    if self.path.suffix == ".parquet":
+                        import pyarrow.parquet as pq
+                        self._writer = pq.ParquetWriter(self.path, self._schema)
+                    else:
+                        self._writer = pa.ipc.new_file(str(self.path), self._schema)
+                self._writer.write_table(table.cast(self._schema))
+            self.rows += len(data)
+
+            if self._csv is not None:
+                self._csv.write(data)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def close(self)->None:
+        if self._writer is not None and self._writer is not True:
+            self._writer.close()
+        if self._csv is not None:
+            self._csv.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+    
+
+class ArrayWriter:
+    """appends array chunks to a .npy file whose number of rows isn't known up front
+
+    The header is written with room for any row count and rewritten with the
+    real shape on close, so the file can be opened with np.load(path, mmap_mode="r").
+
+    Args:
+        path (str): .npy file path
+        dtype (type): dtype of the stored array, chunks are cast to it
+    """
+    # fixed header size in bytes, a multiple of 64 like numpy pads it
+    HEADER_SIZE = 128
+
+    def __init__(self, path:str, dtype:type):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self._columns = None
+        self._file = open(self.path, "wb")
+        self._write_header((0,))
+
+    def _write_header(self, shape:tuple)->None:
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (self.dtype.str, shape)
+        preamble = b"\x93NUMPY\x01\x00" + (self.HEADER_SIZE - 10).to_bytes(2, "little")
+        self._file.seek(0)
+        self._file.write(preamble + header.ljust(self.HEADER_SIZE - len(preamble) - 1).encode("latin1") + b"\n")
+
+    def write(self, data:np.ndarray)->None:
+        try:
+            data = np.ascontiguousarray(data, dtype=self.dtype)
+            columns = data.shape[1:]
+            if self._columns is None:
+                self._columns = columns
+            elif columns != self._columns:
+                raise ValueError(f"chunk of shape {data.shape} doesn't match {self._columns}")
+            self._file.write(memoryview(data).cast("B"))
+            self.rows += len(data)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def close(self)->None:
+        if self._file.closed:
+            return
+        self._write_header((self.rows,) + (self._columns or ()))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+    
+
+def load_array(content:bytes, content_type:str)->tuple[np.ndarray, list]:
+    """parses a request body into a 2D array
+
+    Args:
+        content (bytes): body of the request
+        content_type (str): one of
+            - application/x-npy or application/octet-stream - .npy file
+            - text/csv - csv with header row
+            - application/vnd.apache.arrow.stream or application/vnd.apache.arrow.file - Arrow IPC
+
+    Returns:
+        tuple[np.ndarray, list]: (2D array, column names of csv and arrow bodies, None for .npy)
+    """
+    try:
+        content_type = content_type.split(";")[0].strip().lower()
+        columns = None
+
+        if content_type in ("application/x-npy", "application/octet-stream", ""):
+            data = np.load(BytesIO(content), allow_pickle=False)
+
+        elif content_type == "text/csv":
+            import pandas as pd
+            frame = pd.read_csv(BytesIO(content))
+            columns = list(frame.columns)
+            # a header only csv has object columns
+            data = frame.to_numpy() if len(frame) else np.empty((0, len(columns)))
+
+        elif content_type in ("application/vnd.apache.arrow.stream", "application/vnd.apache.arrow.file"):
+            import pyarrow as pa
+            reader = pa.ipc.open_stream(content) if content_type.endswith("stream") else pa.ipc.open_file(content)
+            table = reader.read_all()
+            columns = list(table.column_names)
+            data = np.column_stack([column.to_numpy() for column in table.columns]) if columns else np.empty((0, 0))
+
+        else:
+            raise ValueError(f"unsupported content type {content_type}")
+
+        return (data.reshape(1, -1) if data.ndim == 1 else data), columns
+    except Exception as e:
+        raise CustomException(e, sys)
+    
+
+def evaluate_models(X_train:np.array, y_train:np.array, X_test:np.array, y_test:np.array, models:dict, params:dict,
+                    cv:int=5, n_jobs:int=-1, predictions:dict=None, cache:"CVCache"=None)->dict[dict]:
     """evaluates model with provided parameters and data
 
+    Hyper parameter search of all models shares one process pool (see
+    package.utils.model_search), then every model is refitted with its best
+    params in parallel and replaced in models by the fitted estimator.
+
     Args:
         X_train (np.array): input features of train data
         y_train (np.array): output features of train data
         X_test (np.array): input features of test data
         y_test (np.array): output features of test data
         models (dict): dict(key=model_name, value=model_object)
-        params (dict): dict(key=model_name, value=model_parameters)
+        params (dict): dict(key=model_name, value=parameter grid or search spec, see package.utils.model_search.get_search_spec)
+        cv (int, optional): number of cross validation folds. Defaults to 5.
+        n_jobs (int, optional): worker processes, -1 for all cores. Defaults to -1.
+        predictions (dict, optional): filled with dict(key=model_name, value=test data prediction) so callers don't predict again
+        cache (CVCache, optional): loaded cross validation cache, fold fits found in it are skipped
 
     Returns:
         dict[dict]: dict(
-            key=model_score (type=int) 
+            key=model_name (type=str) 
            value=dict(
-                    key=model_name (type=str) 
-                   value=model_params (type=dict) )
+                    score=test accuracy (type=float),
+                    params=best params (type=dict),
+                    cv_score=mean cross validation accuracy (type=float),
+                    search=strategy, rounds and eliminations of the search (type=dict) )
     )
     """
     try:
-        report = dict()
-        for model_name, model in models.items():
-            param = params[model_name]
+        # training only imports, kept out of the import of package.utils
+        from package.utils.model_search import search_models, fit_best
+        from sklearn.metrics import accuracy_score
+        from joblib import Parallel, delayed
 
-            # hyper parameter tuning
-            grid = GridSearchCV(model, param, n_jobs=-1)
-            grid.fit(X_train, y_train)
+        # hyper parameter tuning
+        best = search_models(X_train, y_train, models, params, cv=cv, n_jobs=n_jobs, cache=cache)
 
-            # fit best params
-            model.set_params(**grid.best_params_)
-            model.fit(X_train, y_train)
+        # fit best params
+        model_names = list(models)
+        fitted = Parallel(n_jobs=n_jobs)(
+            delayed(fit_best)(models[model_name], best[model_name]["params"], X_train, y_train) for model_name in model_names
+        )
+
+        report = dict()
+        for model_name, model in zip(model_names, fitted):
+            models[model_name] = model
 
             # predict test data 
             test_y_pred = model.predict(X_test)
+            if predictions is not None:
+                predictions[model_name] = test_y_pred
 
             # model test data performance score calculation
             score = accuracy_score(y_test, test_y_pred)
 
-            report[model_name] = {f"score":score, f"params":grid.best_params_}
+            report[model_name] = {"score":score, "params":best[model_name]["params"], "cv_score":best[model_name]["cv_score"],
+                                  "search":best[model_name]["search"]}
 
         return report
     except Exception as e:
@@ -173,6 +576,8 @@ def get_performance_report(y_train:np.array, y_test:np.array, train_pred:np.arra
         dict: _description_
     """
     try:
+        from sklearn.metrics import f1_score, precision_score, recall_score, accuracy_score
+
         # model performance score
         train_f1_score = f1_score(y_train, train_pred)
         train_precision_score = precision_score(y_train, train_pred)
@@ -0,0 +1,375 @@
+from package.exception import CustomException
+from sklearn.model_selection import ParameterGrid, ParameterSampler, StratifiedKFold
+from sklearn.metrics import accuracy_score
+from sklearn.base import clone
+from joblib import Parallel, delayed, effective_n_jobs
+from dataclasses import dataclass, field
+import numpy as np
+import sklearn
+import hashlib
+import json
+import math
+import time
+import sys
+import os
+
+
+# relative cost of a single estimator (tree, stage or fit) per model, used to order the work queue
+COST_WEIGHTS = {
+    "GradientBoostingClassifier": 4.0,
+    "RandomForestClassifier": 1.0,
+    "AdaBoostClassifier": 1.0,
+    "DecisionTreeClassifier": 1.0,
+    "LogisticRegression": 2.0,
+}
+
+# seed of the fold permutation sub sampled halving rounds draw their rows from
+SUBSAMPLE_SEED = 42
+
+
+def estimate_cost(model, params:dict)->float:
+    """rough relative fit time of model with params, only the ordering matters
+
+    Args:
+        model (sklearn model): unfitted estimator
+        params (dict): candidate parameters
+
+    Returns:
+        float: relative cost
+    """
+    model_params = model.get_params()
+    n_estimators = params.get("n_estimators", model_params.get("n_estimators", 1)) or 1
+    subsample = params.get("subsample", model_params.get("subsample", 1.0)) or 1.0
+    return COST_WEIGHTS.get(type(model).__name__, 1.0) * n_estimators * subsample
+
+
+def fit_and_score(model, params:dict, X:np.ndarray, y:np.ndarray, train_index:np.ndarray, test_index:np.ndarray,
+                  n_train:int=None)->tuple:
+    """fits a clone of model with params on one fold and scores it on the held out part
+
+    Args:
+        n_train (int, optional): only fit on the first n_train rows of train_index. Defaults to all.
+
+    Returns:
+        tuple: (accuracy, fit time in seconds)
+    """
+    start = time.perf_counter()
+    if n_train is not None:
+        train_index = train_index[:n_train]
+    estimator = clone(model).set_params(**params)
+    estimator.fit(X[train_index], y[train_index])
+    score = accuracy_score(y[test_index], estimator.predict(X[test_index]))
+    return score, time.perf_counter() - start
+
+
+def fit_best(model, params:dict, X:np.ndarray, y:np.ndarray):
+    """fits a clone of model with params on the whole data
+    """
+    return clone(model).set_params(**params).fit(X, y)
+
+
+def get_data_fingerprint(X:np.ndarray, y:np.ndarray)->str:
+    """sha256 of the shape, dtype and bytes of the train data
+    """
+    digest = hashlib.sha256()
+    for array in (X, y):
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.shape}{array.dtype}".encode())
+        digest.update(memoryview(array).cast("B"))
+    return digest.hexdigest()
+
+
+@dataclass
+class CVCache:
+    """persistent fold scores of the hyper parameter search
+
+    Every fold fit is keyed by (estimator class, its full params, sklearn
+    version, fold split and index, training rows), results are kept for one
+    train data fingerprint at a time so the file only holds what can still hit.
+    """
+    path: str
+    data: str = field(default=None, init=False)
+    results: dict = field(default_factory=dict, init=False, repr=False)
+    hits: int = field(default=0, init=False)
+    misses: int = field(default=0, init=False)
+
+    def load(self, X:np.ndarray, y:np.ndarray)->None:
+        """reads the cached results of the train data X, y
+        """
+        self.data = get_data_fingerprint(X, y)
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as file:
+            cache = json.load(file)
+        if cache.get("data") == self.data and cache.get("sklearn") == sklearn.__version__:
+            self.results = cache["results"]
+
+    def save(self)->None:
+        with open(self.path, "w") as file:
+            json.dump({"data": self.data, "sklearn": sklearn.__version__, "results": self.results}, file)
+
+    def key(self, model, params:dict, cv:int, fold_index:int, n_train:int=None)->str:
+        estimator = type(model)
+        description = {
+            "data": self.data,
+            "estimator": f"{estimator.__module__}.{estimator.__qualname__}",
+            "params": {**model.get_params(deep=False), **params},
+            "sklearn": sklearn.__version__,
+            "folds": f"StratifiedKFold(n_splits={cv})",
+            "fold": fold_index,
+            # sub sampled rows come from the seeded permutation of search_models
+            "n_train": None if n_train is None else [SUBSAMPLE_SEED, n_train],
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=repr).encode()).hexdigest()
+
+    def stats(self)->dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+
+SEARCH_STRATEGIES = ("exhaustive", "random", "halving")
+
+
+def get_search_spec(entry:dict)->dict:
+    """normalizes a params.json entry into a search spec
+
+    An entry is either a plain parameter grid, searched exhaustively, or
+    {"strategy": "exhaustive" | "random" | "halving", "grid": {...}, ...} with
+    the optional keys
+        n_iter: candidates sampled from the grid (random, halving). Defaults to 10 for random, the full grid for halving
+        time_budget: seconds of fit time (summed over workers) after which no more candidates of the model are scheduled
+        resource: "n_estimators" or "n_samples", the resource halving grows each round. Defaults to "n_estimators"
+        min_resource: resource of the first halving round. Defaults to what the number of rounds allows
+        factor: halving keeps 1/factor of the candidates per round and multiplies the resource by it. Defaults to 3
+        random_state: seed of the sampling. Defaults to 42
+
+    Args:
+        entry (dict): params.json entry of a model
+
+    Returns:
+        dict: search spec
+    """
+    if "strategy" not in entry:
+        entry = {"strategy": "exhaustive", "grid": entry}
+    spec = {"grid": {}, "n_iter": None, "time_budget": None, "resource": "n_estimators",
+            "min_resource": None, "factor": 3, "random_state": 42}
+    spec.update(entry)
+    if spec["strategy"] not in SEARCH_STRATEGIES:
+        raise CustomException(f"improper search strategy {spec['strategy']}, expected one of {SEARCH_STRATEGIES}", sys)
+    return spec
+
+
+@dataclass
+class ModelSearch:
+    """search state of one model, advanced one round at a time by search_models
+
+    exhaustive and random searches run all their candidates in one round, or in
+    rounds of round_size candidates when they have a time budget. Halving runs
+    every surviving candidate on a growing resource and keeps the best
+    1/factor of them after each round.
+    """
+    model: any
+    spec: dict
+    n_samples: int
+    round_size: int
+    rounds: list = field(default_factory=list, init=False)
+    fit_time: float = field(default=0.0, init=False)
+    budget_exhausted: bool = field(default=False, init=False)
+    done: bool = field(default=False, init=False)
+    best_score: float = field(default=-np.inf, init=False)
+    best_params: dict = field(default=None, init=False)
+    _candidates: list = field(default=None, init=False, repr=False)
+    _current: list = field(default=None, init=False, repr=False)
+    _resource: int = field(default=None, init=False, repr=False)
+    _max_resource: int = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        spec = self.spec
+        grid = dict(spec["grid"])
+        if spec["strategy"] == "halving":
+            if spec["resource"] == "n_samples":
+                self._max_resource = self.n_samples
+            else:
+                # the resource is set by the rounds, its largest grid value is the final one
+                values = grid.pop(spec["resource"], None)
+                self._max_resource = max(values) if values else self.model.get_params()[spec["resource"]]
+
+        n_iter = spec["n_iter"] or (10 if spec["strategy"] == "random" else None)
+        size = len(ParameterGrid(grid))
+        if n_iter is not None and n_iter < size:
+            self._candidates = list(ParameterSampler(grid, n_iter, random_state=spec["random_state"]))
+        else:
+            self._candidates = list(ParameterGrid(grid))
+
+        if spec["strategy"] == "halving":
+            factor = spec["factor"]
+            n_rounds = math.ceil(math.log(len(self._candidates), factor)) + 1 if len(self._candidates) > 1 else 1
+            self._resource = spec["min_resource"] or max(1, self._max_resource // factor ** (n_rounds - 1))
+
+    @property
+    def candidates(self)->int:
+        return len(self._candidates)
+
+    def next_round(self)->tuple:
+        """candidates of the next round
+
+        Returns:
+            tuple: (list of params, rows to fit per fold or None for all)
+        """
+        if self.spec["strategy"] != "halving":
+            evaluated = sum(record["candidates"] for record in self.rounds)
+            size = self.round_size if self.spec["time_budget"] else len(self._candidates)
+            self._current = self._candidates[evaluated:evaluated + size]
+            return self._current, None
+
+        if self._current is None:
+            self._current = self._candidates
+        resource = self.spec["resource"]
+        if resource == "n_samples":
+            return self._current, self._resource
+        return [{**params, resource: self._resource} for params in self._current], None
+
+    def update(self, scores:np.ndarray, fit_time:float)->None:
+        """records the fold scores of the round and decides what runs next
+
+        Args:
+            scores (np.ndarray): (candidates, folds) accuracy of the round
+            fit_time (float): seconds the workers spent on the round
+        """
+        mean_scores = scores.mean(axis=1)
+        self.fit_time += fit_time
+        record = {"candidates": len(mean_scores), "best_score": float(mean_scores.max()), "fit_time": round(fit_time, 3)}
+
+        if self.spec["strategy"] != "halving":
+            # first best candidate, like GridSearchCV
+            best_index = int(np.argmax(mean_scores))
+            if mean_scores[best_index] > self.best_score:
+                self.best_score = float(mean_scores[best_index])
+                self.best_params = self._current[best_index]
+            self.done = sum(record["candidates"] for record in self.rounds) + len(mean_scores) >= len(self._candidates)
+        else:
+            record["resource"] = int(self._resource)
+            order = np.argsort(-mean_scores, kind="stable")
+            self.best_score = float(mean_scores[order[0]])
+            self.best_params = self._current[order[0]]
+            keep = math.ceil(len(order) / self.spec["factor"])
+            record["eliminated"] = len(order) - keep
+            self._current = [self._current[index] for index in order[:keep]]
+            self.done = keep == 1 or self._resource >= self._max_resource
+            self._resource = min(self._resource * self.spec["factor"], self._max_resource)
+        self.rounds.append(record)
+
+        budget = self.spec["time_budget"]
+        if not self.done and budget is not None and self.fit_time >= budget:
+            self.budget_exhausted = True
+            self.done = True
+
+    def result(self)->dict:
+        params = dict(self.best_params)
+        if self.spec["strategy"] == "halving" and self.spec["resource"] != "n_samples":
+            # the final model gets the full resource
+            params[self.spec["resource"]] = self._max_resource
+        return {
+            "params": params,
+            "cv_score": self.best_score,
+            "candidates": self.candidates,
+            "search": {
+                "strategy": self.spec["strategy"],
+                "rounds": self.rounds,
+                "fit_time": round(self.fit_time, 3),
+                "budget_exhausted": self.budget_exhausted
+            }
+        }
+
+
+def search_models(X_train:np.ndarray, y_train:np.ndarray, models:dict, params:dict, cv:int=5, n_jobs:int=-1,
+                  cache:CVCache=None)->dict:
+    """hyper parameter search of every model through one shared process pool
+
+    Each round, the (model, candidate, fold) fits of every model that still
+    searches are flattened into a single work queue ordered longest first, so
+    small grids fill the gaps left by big ones instead of leaving cores idle.
+    The strategy of each model comes from its params.json entry, see get_search_spec.
+
+    Args:
+        X_train (np.ndarray): input features of train data
+        y_train (np.ndarray): output features of train data
+        models (dict): dict(key=model_name, value=model_object)
+        params (dict): dict(key=model_name, value=params.json entry)
+        cv (int, optional): number of stratified folds. Defaults to 5.
+        n_jobs (int, optional): worker processes, -1 for all cores. Defaults to -1.
+        cache (CVCache, optional): loaded cache of fold scores, only missing fits are run and then added to it
+
+    Returns:
+        dict: dict(key=model_name, value=dict(params=best params, cv_score=mean fold accuracy,
+                                              candidates=number of candidates, search=rounds of the search))
+    """
+    try:
+        folds = list(StratifiedKFold(n_splits=cv).split(X_train, y_train))
+        # sub sampled halving rounds take a random part of each fold
+        rng = np.random.default_rng(SUBSAMPLE_SEED)
+        shuffled_folds = [(rng.permutation(train_index), test_index) for train_index, test_index in folds]
+
+        n_samples = min(len(train_index) for train_index, _ in folds)
+        round_size = effective_n_jobs(n_jobs)
+        searches = {
+            model_name: ModelSearch(model, get_search_spec(params[model_name]), n_samples, round_size)
+            for model_name, model in models.items()
+        }
+
+        with Parallel(n_jobs=n_jobs) as parallel:
+            while True:
+                active = {model_name: search.next_round() for model_name, search in searches.items() if not search.done}
+                if not active:
+                    break
+
+                tasks = [
+                    (model_name, candidate_index, fold_index)
+                    for model_name, (candidates, _) in active.items()
+                    for candidate_index in range(len(candidates))
+                    for fold_index in range(cv)
+                ]
+
+                def cost(task):
+                    model_name, candidate_index, _ = task
+                    candidates, n_train = active[model_name]
+                    return estimate_cost(models[model_name], candidates[candidate_index]) * (n_train or n_samples)
+
+                tasks.sort(key=cost, reverse=True)
+
+                if cache is not None:
+                    keys = [
+                        cache.key(models[model_name], active[model_name][0][candidate_index], cv, fold_index, active[model_name][1])
+                        for model_name, candidate_index, fold_index in tasks
+                    ]
+                    missing = [index for index, key in enumerate(keys) if key not in cache.results]
+                else:
+                    missing = range(len(tasks))
+
+                results = parallel(
+                    delayed(fit_and_score)(models[model_name], active[model_name][0][candidate_index], X_train, y_train,
+                                           *(shuffled_folds if active[model_name][1] else folds)[fold_index],
+                                           n_train=active[model_name][1])
+                    for model_name, candidate_index, fold_index in (tasks[index] for index in missing)
+                )
+
+                if cache is not None:
+                    cache.hits += len(tasks) - len(missing)
+                    cache.misses += len(missing)
+                    for index, result in zip(missing, results):
+                        cache.results[keys[index]] = list(result)
+                    # cached fits keep their recorded fit time, so budgets decide the same way on every run
+                    results = [cache.results[key] for key in keys]
+
+                scores = {model_name: np.zeros((len(candidates), cv)) for model_name, (candidates, _) in active.items()}
+                fit_times = dict.fromkeys(active, 0.0)
+                for (model_name, candidate_index, fold_index), (score, fit_time) in zip(tasks, results):
+                    scores[model_name][candidate_index, fold_index] = score
+                    fit_times[model_name] += fit_time
+
+                for model_name in active:
+                    searches[model_name].update(scores[model_name], fit_times[model_name])
+
+        return {model_name: search.result() for model_name, search in searches.items()}
+    except Exception as e:
+        raise CustomException(e, sys)
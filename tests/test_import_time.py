@@ -0,0 +1,27 @@
+from pathlib import Path
+import os
+import pytest
+
+from import_time import IMPORT_TIME_BUDGET, STARTUP_EXCLUDED_MODULES, get_import_times, get_excluded_imports
+
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture(scope="module")
+def import_times():
+    # app reads its configuration relative to the repository root
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(ROOT_DIR)
+        # the fresh interpreter finds package without an editable install, like pytest does
+        monkeypatch.setenv("PYTHONPATH", os.pathsep.join(filter(None, [str(ROOT_DIR / "src"), os.environ.get("PYTHONPATH")])))
+        return get_import_times("app")
+
+
+def test_import_app_within_budget(import_times):
+    assert import_times["app"] <= IMPORT_TIME_BUDGET, f"import app took {import_times['app']:.3f}s"
+
+
+@pytest.mark.parametrize("module", STARTUP_EXCLUDED_MODULES)
+def test_import_app_excludes_training_dependencies(import_times, module):
+    assert module not in get_excluded_imports(import_times)
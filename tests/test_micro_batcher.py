@@ -0,0 +1,35 @@
+import threading
+import numpy as np
+
+from package.components.micro_batcher import MicroBatcher
+
+
+def test_cancelled_request_does_not_stop_the_batcher():
+    gate = threading.Event()
+
+    def predict(data):
+        gate.wait(5)
+        return data[:, 0]
+
+    batcher = MicroBatcher(predict_fn=predict, max_batch_size=64, max_latency=0.01)
+    # keeps the worker busy, so the next request is still queued when it gets cancelled
+    busy = batcher.submit(np.zeros((1, 2)))
+    cancelled = batcher.submit(np.ones((1, 2)))
+    assert cancelled.cancel()
+    gate.set()
+
+    assert busy.result(timeout=5).tolist() == [0]
+    assert batcher.submit(np.full((2, 2), 2.0)).result(timeout=5).tolist() == [2, 2]
+    assert batcher._thread.is_alive()
+
+
+def test_failed_batch_does_not_stop_the_batcher():
+    def predict(data):
+        if (data < 0).any():
+            raise ValueError("bad batch")
+        return data[:, 0]
+
+    batcher = MicroBatcher(predict_fn=predict, max_batch_size=64, max_latency=0.01)
+    failed = batcher.submit(np.full((1, 2), -1.0))
+    assert isinstance(failed.exception(timeout=5), ValueError)
+    assert batcher.submit(np.ones((1, 2))).result(timeout=5).tolist() == [1]